@@ -7,26 +7,89 @@
 from flask import Flask, render_template, jsonify, request
 from flask_cors import CORS
 import sqlite3
-import pandas as pd
-import requests
 import json
 from datetime import datetime
 import os
-import threading
+
+from db_pool import ConnectionPool
+from downloader import (
+    CSV_URL, LOCAL_CSV_FILE, MAX_AGE_DAYS, DownloadError, ensure_csv, file_age_days, load_metadata
+)
+from pagination import (
+    PaginationError, TotalCountCache, parse_limit, encode_cursor, decode_cursor
+)
+from csv_importer import create_schema, schema_is_current, has_fts_table, table_exists, FTS_TABLE
+from facets import FACET_TABLE, lookup_facets
+from fuzzy_search import SearchQueryError, load_bigram_index, parse_query, parse_search_limit
+from geo import (
+    GeoQueryError, bbox_condition, has_geo_table, nearby_ids, parse_k, parse_point, parse_radius
+)
+from geo_grid import (
+    CLUSTER_MAX_ZOOM, GRID_TABLE, MAX_POINTS, parse_bbox, parse_zoom, precision_for_zoom, query_grid
+)
+from columnar import ResultFormatError, encode_columns, parse_result_format
+from compression import compress_response
+from export import EXPORT_BATCH_SIZE, ExportError, export_response, parse_format
+from region_catalog import RegionCatalog, catalog_response
+from region_mapping import MAPPING_FILE, load_region_mapping, write_mapping_file
+from refresh_worker import RefreshWorker, job_phase
+from result_cache import ResultCache, cached_response
+from suggest import SuggestQueryError, load_suggest_index, parse_prefix, parse_suggest_limit
+from text_normalize import normalize_text
+from dataset_store import (
+    LEGACY_DATABASE_PATH, current_database_path, current_version,
+    build_dataset, activate_dataset, update_dataset
+)
 
 app = Flask(__name__)
 CORS(app)
+app.after_request(compress_response)
 
-# 資料庫設定
-DATABASE_PATH = 'data/institutions.db'
+# 資料庫設定 (實際使用的版本檔由 data/institutions.current 指標決定)
+DATABASE_PATH = LEGACY_DATABASE_PATH
 city_district_mapping = {}
+# 縣市鄉鎮區目錄 (對照表載入時預先序列化)
+region_catalog = RegionCatalog({})
+# 全文搜尋的二連字索引與名稱自動完成索引 (資料集載入或更新時重建；舊版資料庫為 None)
+text_search_index = None
+suggest_index = None
+
+# 三連字索引可處理的最短比對字串長度
+MIN_TRIGRAM_LENGTH = 3
+# 命中比例低於此值的條件才改走 FTS / 對照表索引
+# (高命中率時逐列檢查搭配名稱索引的排序掃描可提早結束，反而較快)
+SELECTIVE_RATIO = 0.05
+
+# 回傳欄位：資料庫欄位 -> API 欄位 (順序即為輸出順序)
+RESULT_COLUMNS = {
+    'name': 'name',
+    'code': 'code',
+    'type': 'type',
+    'city_code': 'city',
+    'district_code': 'district',
+    'address': 'address',
+    'longitude': 'longitude',
+    'latitude': 'latitude',
+    'service_type': 'service_type',
+    'phone': 'phone',
+    'email': 'email',
+    'manager': 'manager',
+    'contract_start': 'contract_start',
+    'contract_end': 'contract_end',
+}
+
+# 資料庫連線池 (查詢用唯讀連線，資料集切換後自動改開新版本檔)
+db_pool = ConnectionPool(lambda: current_database_path(default=DATABASE_PATH))
+
+# 各篩選條件的總筆數快取 (鍵值含資料庫檔案路徑，資料集切換後自動失效)
+count_cache = TotalCountCache()
 
-# 資料庫連線池 (簡單實現)
-db_lock = threading.Lock()
+# 機構搜尋結果快取 (鍵值含資料庫檔案路徑，資料更新後整個清除)
+result_cache = ResultCache()
 
 def get_db_connection():
-    """取得資料庫連線"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    """取得可寫入的資料庫連線 (依指標檔開啟目前版本的資料庫，查詢請改用 db_pool)"""
+    conn = sqlite3.connect(current_database_path(default=DATABASE_PATH))
     conn.row_factory = sqlite3.Row  # 讓結果可以像字典一樣存取
     return conn
 
@@ -35,170 +98,316 @@ def init_database():
     os.makedirs('data', exist_ok=True)
     
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 建立機構主表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS institutions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            code TEXT,
-            type TEXT,
-            city_code TEXT,
-            district_code TEXT,
-            address TEXT,
-            longitude REAL,
-            latitude REAL,
-            o_abc TEXT,
-            service_type TEXT,
-            contract_city TEXT,
-            contract_district TEXT,
-            phone TEXT,
-            email TEXT,
-            manager TEXT,
-            contract_start TEXT,
-            contract_end TEXT,
-            last_updated TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
     
-    # 建立索引以提升查詢效能
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_city_code ON institutions(city_code)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_district_code ON institutions(district_code)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_address ON institutions(address)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_service_type ON institutions(service_type)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_name ON institutions(name)')
+    # 建立機構主表與索引
+    create_schema(conn)
     
     conn.commit()
+    # 查詢連線與匯入可同時進行
+    conn.execute('PRAGMA journal_mode = WAL')
     conn.close()
     print("✓ 資料庫初始化完成")
 
 def load_city_district_mapping():
-    """載入縣市鄉鎮區碼對照表"""
-    global city_district_mapping
+    """
+    載入縣市鄉鎮區碼對照表，並重建縣市鄉鎮區目錄
+
+    優先使用目前資料集中匯入時推導的對照表 (同時同步寫入對照表檔案)，
+    舊版資料庫或尚未匯入時才讀取對照表檔案
+    """
+    global city_district_mapping, region_catalog
+    mapping = None
+    if os.path.exists(current_database_path(default=DATABASE_PATH)):
+        with db_pool.connection() as conn:
+            mapping = load_region_mapping(conn)
+    if mapping:
+        if write_mapping_file(mapping):
+            print(f"✓ 已依資料集更新 {MAPPING_FILE}")
+    else:
+        mapping = read_city_district_mapping()
+    city_district_mapping = mapping
+    region_catalog = RegionCatalog(city_district_mapping)
+
+def load_search_indexes(db_path=None):
+    """
+    由資料庫的正規化名稱與地址重建全文搜尋索引與名稱自動完成索引
+
+    db_path 省略時使用目前的資料集；完整匯入時在切換指標前先以新版本檔建立，
+    縮短新資料與舊索引並存的時間
+    """
+    global text_search_index, suggest_index
+    db_path = db_path or current_database_path(default=DATABASE_PATH)
+    search, suggest = None, None
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            if schema_is_current(conn):
+                search = load_bigram_index(conn)
+                suggest = load_suggest_index(conn)
+        finally:
+            conn.close()
+    text_search_index, suggest_index = search, suggest
+
+def read_city_district_mapping():
+    """讀取縣市鄉鎮區碼對照表"""
     try:
         # 優先使用從CSV生成的真實對照表
-        if os.path.exists('real_city_mapping.json'):
-            with open('real_city_mapping.json', 'r', encoding='utf-8') as f:
-                city_district_mapping = json.load(f)
-                return
+        if os.path.exists(MAPPING_FILE):
+            with open(MAPPING_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
     except:
         pass
     
     try:
         # 備用：使用預設對照表
         from city_mapping import CITY_DISTRICT_MAPPING
-        city_district_mapping = CITY_DISTRICT_MAPPING
+        return CITY_DISTRICT_MAPPING
     except ImportError:
         # 最後備用：基本版本
-        city_district_mapping = {
+        return {
             "63000": {"name": "臺北市", "districts": {"63000030": "大安區"}},
             "64000": {"name": "高雄市", "districts": {"64000050": "三民區"}}
         }
 
-def download_and_import_csv():
-    """下載CSV並匯入資料庫"""
-    local_csv_file = 'data/abc.csv'
-    
-    # 確保資料目錄存在
-    os.makedirs('data', exist_ok=True)
-    
+def download_and_import_csv(incremental=False, force=False, job=None):
+    """
+    下載CSV並匯入資料庫 (incremental=True 時只寫入與目前資料的差異)
+
+    本地檔案 30 天內確認過就直接使用；過期或 force=True 時向來源發出條件式請求，
+    force=True 且來源未變更時略過匯入。
+    由背景更新工作呼叫時 (job 不為 None)，各階段耗時與結果記錄在工作上。
+    """
     try:
-        # 檢查本地檔案是否存在且在一個月內
-        if os.path.exists(local_csv_file):
-            file_time = os.path.getmtime(local_csv_file)
-            current_time = datetime.now().timestamp()
-            days_old = (current_time - file_time) / (24 * 3600)
-            
-            if days_old < 30:
-                print(f"使用本地CSV檔案 (檔案建立於 {days_old:.1f} 天前)")
-                return import_csv_to_database(local_csv_file)
-            else:
-                print(f"本地檔案已過期 ({days_old:.1f} 天)，重新下載...")
-        
-        # 下載新檔案
-        print("正在下載最新的CSV資料...")
-        url = "https://ltcpap.mohw.gov.tw/publish/abc.csv"
-        response = requests.get(url, timeout=30)
-        response.encoding = 'utf-8-sig'  # 處理BOM
-        
-        # 儲存到本地
-        with open(local_csv_file, 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        
-        print(f"CSV檔案已下載並儲存到 {local_csv_file}")
-        
-        # 匯入資料庫
-        return import_csv_to_database(local_csv_file)
-        
-    except Exception as e:
+        with job_phase(job, 'download'):
+            result = ensure_csv(CSV_URL, LOCAL_CSV_FILE, force=force)
+    except DownloadError as e:
         print(f"處理CSV時發生錯誤: {e}")
         
         # 如果下載失敗，嘗試使用舊的本地檔案
-        if os.path.exists(local_csv_file):
+        if os.path.exists(LOCAL_CSV_FILE):
             print("下載失敗，使用現有的本地檔案...")
-            return import_csv_to_database(local_csv_file)
+            if job is not None:
+                job.result['download_error'] = str(e)
+            return import_csv_to_database(LOCAL_CSV_FILE, incremental, job)
         
+        if job is not None:
+            job.error = str(e)
         return False
+    
+    print_download_result(result)
+    if job is not None:
+        job.result['download_status'] = result['status']
+    if force and result['status'] in ('not_modified', 'unchanged'):
+        print("✓ 資料來源未變更，略過匯入")
+        if job is not None:
+            job.result['skipped'] = True
+        return True
+    return import_csv_to_database(LOCAL_CSV_FILE, incremental, job)
+
+def print_download_result(result):
+    """輸出下載結果"""
+    status = result['status']
+    if status == 'fresh':
+        print(f"使用本地CSV檔案 (上次確認於 {result['age_days']} 天前)")
+    elif status == 'not_modified':
+        print("✓ 資料來源未更新 (HTTP 304)，沿用本地CSV檔案")
+    elif status == 'unchanged':
+        print("✓ 下載內容與本地CSV檔案相同")
+    else:
+        resumed = "，續傳" if result['resumed'] else ""
+        print(f"✓ CSV檔案已下載並儲存到 {result['path']} "
+              f"({result['bytes']:,} bytes{resumed}，{result['seconds']} 秒)")
 
-def import_csv_to_database(csv_file):
-    """將CSV資料匯入資料庫"""
+def import_csv_to_database(csv_file, incremental=False, job=None):
+    """
+    將CSV資料匯入資料庫 (分塊串流 + 批次寫入)
+
+    完整匯入時資料寫入新的版本檔，完成後才切換指標，查詢端全程讀取舊版本的完整資料。
+    incremental=True 時在目前版本檔上只套用新增、異動與刪除的資料列 (單一交易)；
+    尚無可用的版本檔時自動改為完整匯入。
+    """
     try:
-        # 讀取CSV
-        df = pd.read_csv(csv_file)
-        df = df.dropna(subset=['機構名稱', '縣市', '區'])
-        
-        # 資料清理
-        df['縣市'] = df['縣市'].astype(str)
-        df['區'] = df['區'].astype(str).str.replace('.0', '', regex=False)
-        
-        # 清空現有資料
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM institutions')
+        if incremental:
+            result = update_dataset(csv_file, district_mapping=city_district_mapping)
+            if result is not None:
+                _, stats = result
+                record_import_stats(job, stats)
+                # 資料內容已變動，清除各篩選條件的總數快取與搜尋結果快取
+                with job_phase(job, 'swap'):
+                    count_cache.clear()
+                    load_search_indexes()
+                    result_cache.invalidate()
+                    load_city_district_mapping()
+                print(f"✓ 增量更新完成 (版本 {stats['version']})：新增 {stats['inserted']} 筆、"
+                      f"更新 {stats['updated']} 筆、刪除 {stats['deleted']} 筆、"
+                      f"未變動 {stats['unchanged']} 筆")
+                if stats.get('reresolved'):
+                    print(f"  區域對照表已變更，重新解析 {stats['reresolved']} 筆機構的區域")
+                print(f"  耗時 {stats['seconds']} 秒，記憶體峰值 {stats['peak_memory_mb']} MB")
+                return True
+            print("沒有可增量更新的資料庫，改為完整匯入...")
         
-        # 批次插入資料
-        insert_count = 0
-        for _, row in df.iterrows():
-            cursor.execute('''
-                INSERT INTO institutions (
-                    name, code, type, city_code, district_code, address,
-                    longitude, latitude, o_abc, service_type, contract_city,
-                    contract_district, phone, email, manager, contract_start,
-                    contract_end, last_updated
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                row['機構名稱'], row['機構代碼'], row['機構種類'],
-                row['縣市'], row['區'], row['地址全址'],
-                row['經度'] if pd.notna(row['經度']) else None,
-                row['緯度'] if pd.notna(row['緯度']) else None,
-                row['O_ABC'], row['特約服務項目'], row['特約縣市'],
-                row['特約區域'], row['機構電話'], row['電子郵件'],
-                row['機構負責人姓名'], row['特約起日'], row['特約迄日'],
-                row['最後異動時間']
-            ))
-            insert_count += 1
+        db_path, stats = build_dataset(csv_file, district_mapping=city_district_mapping)
+        record_import_stats(job, stats)
+        with job_phase(job, 'swap'):
+            load_search_indexes(db_path)
+            activate_dataset(db_path)
+            result_cache.invalidate()
+            # 對照表隨資料集一起切換 (縣市鄉鎮區目錄與對照表檔案同步更新)
+            load_city_district_mapping()
         
-        conn.commit()
-        conn.close()
-        
-        print(f"✓ 成功匯入 {insert_count} 筆機構資料到資料庫")
+        print(f"✓ 成功匯入 {stats['rows']} 筆機構資料到資料庫 (版本 {stats['version']})")
+        print(f"  耗時 {stats['seconds']} 秒，{stats['rows_per_sec']:,} 筆/秒，"
+              f"記憶體峰值 {stats['peak_memory_mb']} MB")
         return True
         
     except Exception as e:
         print(f"匯入資料庫時發生錯誤: {e}")
+        if job is not None:
+            job.error = f"匯入資料庫時發生錯誤: {e}"
         return False
 
+def record_import_stats(job, stats):
+    """將匯入統計的各階段耗時 (mapping / parse / import / index) 與筆數記錄到更新工作"""
+    if job is None:
+        return
+    for name, seconds in stats['phases'].items():
+        job.record_phase(name, seconds)
+    job.result.update({key: value for key, value in stats.items() if key != 'phases'})
+
+def run_refresh_job(job, incremental=True, force=True):
+    """背景更新工作：向來源確認並匯入，完成後記錄目前的機構總數"""
+    success = download_and_import_csv(incremental, force, job)
+    if success:
+        job.result['total_records'] = get_institution_count()
+    return success
+
+def refresh_is_due():
+    """本地資料不存在或超過 MAX_AGE_DAYS 天未向來源確認時需要更新"""
+    days_old = file_age_days(LOCAL_CSV_FILE)
+    return days_old is None or days_old >= MAX_AGE_DAYS
+
+# 背景更新工作 (同時間只執行一個，重複的更新要求併入執行中的工作)
+refresh_worker = RefreshWorker(run_refresh_job)
+
 def get_institution_count():
     """取得機構總數"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM institutions')
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    with db_pool.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM institutions').fetchone()[0]
+
+def substring_condition(conn, column, patterns):
+    """
+    建立子字串比對條件
+
+    column 可為單一欄位或欄位列表 (任一欄位符合即可)。
+    比對字串都至少三個字且命中筆數夠少時走 FTS5 三連字索引；
+    命中比例高的字串改用 LIKE，讓 ORDER BY name 的索引掃描能提早結束。
+    沒有全文檢索表的舊資料庫一律使用 LIKE。
+    """
+    columns = [column] if isinstance(column, str) else list(column)
+    # 若某字串包含另一個較短的字串，只需比對較短者
+    patterns = [p for p in dict.fromkeys(patterns) if p]
+    patterns = [p for p in patterns if not any(q != p and q in p for q in patterns)]
+    
+    if has_fts_table(conn) and all(len(p) >= MIN_TRIGRAM_LENGTH for p in patterns):
+        phrases = ' OR '.join('"{}"'.format(p.replace('"', '""')) for p in patterns)
+        match = '{{{}}} : ({})'.format(' '.join(columns), phrases)
+        hits = conn.execute(
+            f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?', (match,)
+        ).fetchone()[0]
+        if hits <= approximate_row_count(conn) * SELECTIVE_RATIO:
+            condition = f'id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)'
+            return condition, [match]
+    
+    condition = '(' + ' OR '.join(f'{c} LIKE ?' for c in columns for _ in patterns) + ')'
+    return condition, [f'%{p}%' for _ in columns for p in patterns]
+
+def approximate_row_count(conn):
+    """以最大編號估計機構筆數 (O(log n)，不需掃描整張表)"""
+    return conn.execute('SELECT MAX(id) FROM institutions').fetchone()[0] or 0
+
+def service_condition(conn, service_type):
+    """
+    建立服務類型篩選條件
+
+    已知服務項目改用服務對照表：命中比例低時以 institution_services 的
+    主鍵等值查詢取得機構編號；命中比例高時直接對 service_mask 做位元檢查。
+    資料中沒有的服務名稱 (或舊版資料庫) 才退回子字串比對。
+    """
+    if schema_is_current(conn):
+        hits = conn.execute(
+            'SELECT COUNT(*) FROM institution_services WHERE service = ?', (service_type,)
+        ).fetchone()[0]
+        if hits:
+            row = conn.execute('SELECT bit FROM service_types WHERE name = ?', (service_type,)).fetchone()
+            if row is not None and hits > approximate_row_count(conn) * SELECTIVE_RATIO:
+                return '(service_mask & ?) != 0', [1 << row[0]]
+            condition = 'id IN (SELECT institution_id FROM institution_services WHERE service = ?)'
+            return condition, [service_type]
+    
+    return substring_condition(conn, 'service_type', [service_type])
+
+def service_is_known(conn, service_type):
+    """服務名稱是否為已登錄或資料中出現的完整服務項目 (地圖網格只統計完整名稱)"""
+    return bool(conn.execute(
+        'SELECT EXISTS (SELECT 1 FROM service_types WHERE name = ?) '
+        'OR EXISTS (SELECT 1 FROM institution_services WHERE service = ?)',
+        (service_type, service_type)
+    ).fetchone()[0])
+
+def keyword_condition(conn, keyword):
+    """
+    建立名稱 / 地址關鍵字條件
+
+    資料在匯入時已寫入正規化的名稱與地址欄位，這裡只需正規化使用者輸入的關鍵字
+    (臺/台、全形數字、空白)，再以單一字串比對。舊版資料庫沒有正規化欄位時比對原始欄位。
+    """
+    if schema_is_current(conn):
+        return substring_condition(conn, ['name_norm', 'address_norm'], [normalize_text(keyword)])
+    return substring_condition(conn, ['name', 'address'], [keyword.strip()])
+
+def build_search_conditions(conn, city_code, district_code, service_type, keyword=''):
+    """依搜尋參數建立 WHERE 條件與參數"""
+    where_conditions = []
+    params = []
+    
+    # 縣市篩選
+    if city_code:
+        where_conditions.append('city_code = ?')
+        params.append(city_code)
+    
+    # 鄉鎮區篩選 (匯入時已依地址解析出標準區域代碼，此處為等值比對)
+    if district_code:
+        district_column = 'resolved_district_code' if schema_is_current(conn) else 'district_code'
+        where_conditions.append(f'{district_column} = ?')
+        params.append(district_code)
+    
+    # 服務類型篩選
+    if service_type:
+        condition, condition_params = service_condition(conn, service_type)
+        where_conditions.append(condition)
+        params.extend(condition_params)
+    
+    # 名稱 / 地址關鍵字篩選
+    if keyword and normalize_text(keyword):
+        condition, condition_params = keyword_condition(conn, keyword)
+        where_conditions.append(condition)
+        params.extend(condition_params)
+    
+    return where_conditions, params
+
+def row_to_institution(row):
+    """將資料庫列轉為 API 回傳格式"""
+    return {field: row[column] for column, field in RESULT_COLUMNS.items()}
+
+def rows_to_columns(rows):
+    """將資料庫列轉為 {API 欄位: 值列表} (欄式回應用)"""
+    return {field: [row[column] for row in rows] for column, field in RESULT_COLUMNS.items()}
+
+def database_schema_is_current():
+    """檢查目前使用中的資料庫結構是否為最新版本"""
+    with db_pool.connection() as conn:
+        return schema_is_current(conn)
 
 @app.route('/')
 def index():
@@ -206,150 +415,434 @@ def index():
 
 @app.route('/api/cities')
 def get_cities():
-    """取得所有縣市列表"""
-    cities = [{"code": code, "name": data["name"]} 
-              for code, data in city_district_mapping.items()]
-    return jsonify(cities)
+    """取得所有縣市列表 (預先序列化的內容)"""
+    return catalog_response(region_catalog.cities)
 
 @app.route('/api/districts/<city_code>')
 def get_districts(city_code):
-    """根據縣市代碼取得區域列表"""
-    if city_code in city_district_mapping:
-        districts = [{"code": code, "name": name} 
-                    for code, name in city_district_mapping[city_code]["districts"].items()]
-        return jsonify(districts)
-    return jsonify([])
+    """根據縣市代碼取得區域列表 (預先序列化的內容)"""
+    return catalog_response(region_catalog.district_entry(city_code))
+
+@app.route('/api/regions')
+def get_regions():
+    """一次取得所有縣市與其鄉鎮區列表"""
+    return catalog_response(region_catalog.bundle)
 
 @app.route('/api/institutions')
 def search_institutions():
-    """搜尋機構 - 資料庫版本"""
-    city_code = request.args.get('city')
-    district_code = request.args.get('district')
+    """
+    搜尋機構 - 資料庫版本 (limit + cursor keyset 分頁)
+
+    相同資料集版本與查詢參數的結果直接由快取回傳，並支援 ETag / If-None-Match
+    """
+    city_code = request.args.get('city') or ''
+    district_code = request.args.get('district') or ''
     service_type = request.args.get('service_type', '')
+    keyword = request.args.get('keyword', '')
     
-    # 建立SQL查詢
-    where_conditions = []
-    params = []
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = decode_cursor(request.args.get('cursor'))
+        result_format = parse_result_format(request.args.get('format'))
+    except (PaginationError, ResultFormatError) as e:
+        return jsonify({"error": str(e)}), 400
     
-    # 縣市篩選
-    if city_code:
-        where_conditions.append('city_code = ?')
-        params.append(city_code)
+    # 關鍵字以正規化後的字串作為鍵值 (「台北」與「臺北」共用快取)
+    key = ('institutions', current_database_path(default=DATABASE_PATH),
+           city_code, district_code, service_type, normalize_text(keyword), limit, cursor,
+           result_format)
+    return cached_response(
+        result_cache, key,
+        lambda: query_institutions(
+            city_code, district_code, service_type, limit, cursor, result_format, keyword
+        )
+    )
+
+def query_institutions(city_code, district_code, service_type, limit, cursor,
+                       result_format='rows', keyword=''):
+    """查詢一頁機構並轉為 JSON 回應"""
+    with db_pool.connection() as conn:
+        where_conditions, params = build_search_conditions(
+            conn, city_code, district_code, service_type, keyword
+        )
+        where_sql = ' WHERE ' + ' AND '.join(where_conditions) if where_conditions else ''
+        
+        # 執行查詢：從游標位置往後取 limit + 1 筆，多取的一筆用來判斷是否還有下一頁
+        page_conditions = list(where_conditions)
+        page_params = list(params)
+        if cursor:
+            page_conditions.append('(name, id) > (?, ?)')
+            page_params.extend(cursor)
+        page_where = ' WHERE ' + ' AND '.join(page_conditions) if page_conditions else ''
+        rows = conn.execute(
+            f'SELECT * FROM institutions{page_where} ORDER BY name, id LIMIT ?',
+            page_params + [limit + 1]
+        ).fetchall()
+        
+        # 計算總數：同一篩選條件的總數快取起來，翻頁時不必重算
+        count_key = (
+            conn.db_path, city_code, district_code, service_type, normalize_text(keyword)
+        )
+        total_count = count_cache.get(count_key)
+        if total_count is None:
+            total_count = conn.execute(
+                f'SELECT COUNT(*) FROM institutions{where_sql}', params
+            ).fetchone()[0]
+            count_cache.put(count_key, total_count)
     
-    # 鄉鎮區篩選 (地址模糊比對)
-    if district_code:
-        district_name = None
-        if city_code in city_district_mapping:
-            districts = city_district_mapping[city_code].get('districts', {})
-            district_name = districts.get(district_code)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['name'], rows[-1]['id'])
+    
+    # 轉換為字典格式 (欄式格式則每欄一個陣列)
+    if result_format == 'columnar':
+        result = encode_columns(rows_to_columns(rows))
+    else:
+        result = [row_to_institution(row) for row in rows]
+    
+    print(f"資料庫查詢完成，找到 {total_count} 筆，返回 {len(rows)} 筆")
+    
+    return jsonify({
+        'total': total_count,
+        'institutions': result,
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/search')
+def search_text():
+    """
+    容錯全文搜尋 - 以機構名稱與地址搜尋，允許少量錯字
+
+    參數 q 為搜尋字串，limit 為回傳筆數，可搭配 city、service_type 篩選；
+    候選與排序都由記憶體中的二連字索引完成，資料庫只用來以編號取出結果。
+    結果依編輯距離、命中欄位 (名稱優先) 排序，附 edit_distance 與 matched_field。
+    """
+    try:
+        query = parse_query(request.args.get('q'))
+        limit = parse_search_limit(request.args.get('limit'))
+    except SearchQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    index = text_search_index
+    if index is None:
+        return jsonify({"error": "資料庫尚未建立全文搜尋索引，請更新資料"}), 503
+    
+    city_code = request.args.get('city') or ''
+    service_type = request.args.get('service_type', '')
+    key = ('search', current_database_path(default=DATABASE_PATH),
+           query, city_code, service_type, limit)
+    return cached_response(
+        result_cache, key,
+        lambda: query_search(index, query, limit, city_code, service_type)
+    )
+
+def query_search(index, query, limit, city_code, service_type):
+    """以二連字索引搜尋，再依編號讀取機構並轉為 JSON 回應"""
+    with db_pool.connection() as conn:
+        service_mask = None
+        if service_type:
+            # 資料中沒有的服務名稱沒有任何機構提供
+            row = conn.execute('SELECT bit FROM service_types WHERE name = ?', (service_type,)).fetchone()
+            service_mask = 1 << row[0] if row is not None else 0
+        matches = index.search(query, limit, city_code, service_mask)
         
-        if district_name:
-            # 使用LIKE進行地址模糊比對
-            where_conditions.append('(address LIKE ? OR address LIKE ?)')
-            params.extend([f'%{district_name}%', f'%{district_name.replace("區", "").replace("市", "").replace("鎮", "").replace("鄉", "")}%'])
-            print(f"使用區域名稱 '{district_name}' 進行資料庫地址模糊比對")
-        else:
-            where_conditions.append('district_code = ?')
-            params.append(district_code)
+        rows = {}
+        if matches:
+            ids = [row_id for row_id, _, _ in matches]
+            placeholders = ', '.join('?' * len(ids))
+            rows = {row['id']: row for row in conn.execute(
+                f'SELECT * FROM institutions WHERE id IN ({placeholders})', ids
+            )}
     
-    # 服務類型篩選
-    if service_type:
-        where_conditions.append('service_type LIKE ?')
-        params.append(f'%{service_type}%')
+    # 索引與資料集切換之間的短暫期間，編號可能已不存在，略過即可
+    result = []
+    for row_id, distance, field in matches:
+        if row_id in rows:
+            institution = row_to_institution(rows[row_id])
+            institution['edit_distance'] = distance
+            institution['matched_field'] = field
+            result.append(institution)
     
-    # 建立完整SQL
-    sql = 'SELECT * FROM institutions'
-    if where_conditions:
-        sql += ' WHERE ' + ' AND '.join(where_conditions)
-    sql += ' ORDER BY name LIMIT 100'
+    print(f"全文搜尋完成，「{query}」返回 {len(result)} 筆")
     
-    # 執行查詢
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(sql, params)
-    rows = cursor.fetchall()
+    return jsonify({
+        'query': query,
+        'total': len(result),
+        'institutions': result
+    })
+
+@app.route('/api/suggest')
+def suggest_names():
+    """
+    機構名稱自動完成 - 回傳名稱 (或簡稱) 以 prefix 開頭的機構
+
+    參數 prefix 為使用者目前輸入的文字，limit 為回傳筆數，可搭配 city 限定縣市；
+    只查詢記憶體中的排序陣列，每次按鍵都不需存取資料庫
+    """
+    try:
+        prefix = parse_prefix(request.args.get('prefix'))
+        limit = parse_suggest_limit(request.args.get('limit'))
+    except SuggestQueryError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # 計算總數 (不限制LIMIT)
-    count_sql = 'SELECT COUNT(*) FROM institutions'
-    if where_conditions:
-        count_sql += ' WHERE ' + ' AND '.join(where_conditions)
-    cursor.execute(count_sql, params)
-    total_count = cursor.fetchone()[0]
+    index = suggest_index
+    if index is None:
+        return jsonify({"error": "資料庫尚未建立自動完成索引，請更新資料"}), 503
     
-    conn.close()
+    return jsonify({
+        'prefix': prefix,
+        'suggestions': index.suggest(prefix, limit, request.args.get('city') or None)
+    })
+
+@app.route('/api/institutions/nearby')
+def search_nearby_institutions():
+    """
+    搜尋附近機構 - 以 R*Tree 空間索引框選候選，再依實際距離取最近的 k 筆
+
+    參數 lat、lng 為中心點，radius 為搜尋半徑 (公里)，k 為回傳筆數；
+    可搭配 city、district、service_type 篩選。結果依距離由近到遠排序，
+    total 為半徑內符合條件的總筆數。
+    """
+    try:
+        lat, lng = parse_point(request.args.get('lat'), request.args.get('lng'))
+        radius_km = parse_radius(request.args.get('radius'))
+        k = parse_k(request.args.get('k'))
+    except GeoQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    with db_pool.connection() as conn:
+        if not has_geo_table(conn):
+            return jsonify({"error": "資料庫尚未建立空間索引，請更新資料"}), 503
+        
+        where_conditions, params = build_search_conditions(
+            conn,
+            request.args.get('city'),
+            request.args.get('district'),
+            request.args.get('service_type', '')
+        )
+        ids, distances, total_count = nearby_ids(
+            conn, lat, lng, radius_km, k, where_conditions, params
+        )
+        rows = {}
+        if ids:
+            placeholders = ', '.join('?' * len(ids))
+            rows = {row['id']: row for row in conn.execute(
+                f'SELECT * FROM institutions WHERE id IN ({placeholders})', ids
+            )}
     
-    # 轉換為字典格式
     result = []
-    for row in rows:
-        institution = {
-            'name': row['name'],
-            'code': row['code'],
-            'type': row['type'],
-            'city': row['city_code'],
-            'district': row['district_code'],
-            'address': row['address'],
-            'longitude': row['longitude'],
-            'latitude': row['latitude'],
-            'service_type': row['service_type'],
-            'phone': row['phone'],
-            'email': row['email'],
-            'manager': row['manager'],
-            'contract_start': row['contract_start'],
-            'contract_end': row['contract_end']
-        }
+    for row_id, distance in zip(ids, distances):
+        institution = row_to_institution(rows[row_id])
+        institution['distance_km'] = round(distance, 3)
         result.append(institution)
     
-    print(f"資料庫查詢完成，找到 {total_count} 筆，返回前 {len(result)} 筆")
+    print(f"附近機構查詢完成，半徑 {radius_km} 公里內 {total_count} 筆，返回 {len(result)} 筆")
     
     return jsonify({
+        'center': {'lat': lat, 'lng': lng},
+        'radius_km': radius_km,
         'total': total_count,
         'institutions': result
     })
 
+@app.route('/api/institutions/bbox')
+def search_institutions_in_bbox():
+    """
+    地圖範圍查詢 - 縮小時回傳網格聚合，放大時回傳個別機構
+
+    參數 west、south、east、north 為地圖範圍，zoom 為縮放層級，可搭配 service_type。
+    zoom <= CLUSTER_MAX_ZOOM 時查詢匯入時預先統計的 geohash 網格 (mode 為 clusters)，
+    否則以 R*Tree 取出範圍內的機構 (mode 為 points，最多 MAX_POINTS 筆)。
+    網格只統計完整的服務名稱，兩種模式都不接受部分名稱 (回傳 400)，放大縮小時結果一致。
+    """
+    try:
+        west, south, east, north = parse_bbox(
+            request.args.get('west'), request.args.get('south'),
+            request.args.get('east'), request.args.get('north')
+        )
+        zoom = parse_zoom(request.args.get('zoom'))
+    except GeoQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    service_type = request.args.get('service_type', '')
+    
+    with db_pool.connection() as conn:
+        if not has_geo_table(conn) or not table_exists(conn, GRID_TABLE):
+            return jsonify({"error": "資料庫尚未建立空間索引，請更新資料"}), 503
+        if service_type and not service_is_known(conn, service_type):
+            return jsonify({"error": f"未知的服務項目: {service_type}"}), 400
+        
+        if zoom <= CLUSTER_MAX_ZOOM:
+            precision = precision_for_zoom(zoom)
+            clusters = query_grid(conn, west, south, east, north, precision, service_type)
+            return jsonify({
+                'mode': 'clusters',
+                'zoom': zoom,
+                'precision': precision,
+                'total': sum(cluster['count'] for cluster in clusters),
+                'clusters': clusters
+            })
+        
+        condition, params = bbox_condition(west, south, east, north)
+        where_conditions = [condition]
+        if service_type:
+            service_sql, service_params = service_condition(conn, service_type)
+            where_conditions.append(service_sql)
+            params.extend(service_params)
+        rows = conn.execute(
+            f'SELECT * FROM institutions WHERE {" AND ".join(where_conditions)} ORDER BY id LIMIT ?',
+            params + [MAX_POINTS + 1]
+        ).fetchall()
+    
+    truncated = len(rows) > MAX_POINTS
+    result = [row_to_institution(row) for row in rows[:MAX_POINTS]]
+    return jsonify({
+        'mode': 'points',
+        'zoom': zoom,
+        'total': len(result),
+        'truncated': truncated,
+        'institutions': result
+    })
+
+@app.route('/api/institutions/export')
+def export_institutions():
+    """
+    匯出符合條件的全部機構 - 以 NDJSON 或 CSV 串流回傳
+
+    參數 format 為 ndjson (預設) 或 csv，可搭配 city、district、service_type、keyword 篩選；
+    排序與 /api/institutions 相同 (名稱、編號)。資料以 keyset 分批讀取，
+    伺服器端只保留一批資料，記憶體用量與結果筆數無關。
+    """
+    try:
+        fmt = parse_format(request.args.get('format'))
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    batches = export_batches(
+        request.args.get('city') or '',
+        request.args.get('district') or '',
+        request.args.get('service_type', ''),
+        request.args.get('keyword', '')
+    )
+    return export_response(batches, fmt)
+
+def export_batches(city_code, district_code, service_type, keyword=''):
+    """
+    逐批產生符合條件的機構 (API 格式)
+
+    整個匯出在同一個讀取交易中進行，期間切換資料集也不會讀到前後不一致的資料；
+    每批以 (名稱, 編號) 游標接續，ORDER BY ... LIMIT 只需保留一批的排序結果。
+    連線在產生器結束或被關閉時歸還連線池。
+    """
+    with db_pool.connection() as conn:
+        conn.execute('BEGIN')
+        where_conditions, params = build_search_conditions(
+            conn, city_code, district_code, service_type, keyword
+        )
+        exported = 0
+        cursor = None
+        while True:
+            batch_conditions = list(where_conditions)
+            batch_params = list(params)
+            if cursor:
+                batch_conditions.append('(name, id) > (?, ?)')
+                batch_params.extend(cursor)
+            batch_where = ' WHERE ' + ' AND '.join(batch_conditions) if batch_conditions else ''
+            rows = conn.execute(
+                f'SELECT * FROM institutions{batch_where} ORDER BY name, id LIMIT ?',
+                batch_params + [EXPORT_BATCH_SIZE]
+            ).fetchall()
+            if not rows:
+                break
+            exported += len(rows)
+            yield [row_to_institution(row) for row in rows]
+            if len(rows) < EXPORT_BATCH_SIZE:
+                break
+            cursor = (rows[-1]['name'], rows[-1]['id'])
+    
+    print(f"匯出完成，共 {exported} 筆")
+
+@app.route('/api/facets')
+def get_facets():
+    """
+    取得篩選條件統計 - 查詢匯入時預先計算的統計表
+
+    city、district、service_type 皆可省略；回傳符合條件的總數，
+    以及未指定維度的細項筆數 (by_city / by_district / by_service)
+    """
+    city_code = request.args.get('city')
+    district_code = request.args.get('district')
+    service_type = request.args.get('service_type', '')
+    
+    with db_pool.connection() as conn:
+        if not table_exists(conn, FACET_TABLE):
+            return jsonify({"error": "資料庫尚未建立統計表，請更新資料"}), 503
+        facets = lookup_facets(conn, city_code, district_code, service_type)
+    
+    facets['dataset_version'] = current_version()
+    return jsonify(facets)
+
 @app.route('/api/refresh-data')
 def refresh_data():
-    """強制重新下載並匯入資料"""
-    # 刪除本地檔案以強制重新下載
-    local_files = ['data/abc.csv']
-    for file_path in local_files:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"已刪除 {file_path}")
-    
-    success = download_and_import_csv()
-    if success:
-        total_records = get_institution_count()
-        file_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return jsonify({
-            "message": "資料強制更新成功", 
-            "total_records": total_records,
-            "update_time": file_time
-        })
-    else:
-        return jsonify({"error": "資料更新失敗"}), 500
+    """
+    送出背景更新工作，立即回傳工作編號 (進度請查詢 /api/refresh-status/<工作編號>)
+
+    預設只套用與目前資料的差異；mode=full 時完整重建資料集。
+    已有更新工作執行中時不另外啟動，回傳該工作的編號 (coalesced 為 true)。
+    """
+    incremental = request.args.get('mode', 'incremental') != 'full'
+    
+    # 不論本地檔案新舊都向來源確認 (條件式請求，來源未變更時不會重新下載)
+    job, coalesced = refresh_worker.submit(incremental=incremental, force=True)
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "coalesced": coalesced,
+        "status_url": f"/api/refresh-status/{job.id}"
+    }), 202
+
+@app.route('/api/refresh-status/<job_id>')
+def refresh_status(job_id):
+    """取得更新工作的狀態、目前階段與各階段耗時 (download / mapping / parse / import / index / swap)"""
+    job = refresh_worker.get(job_id)
+    if job is None:
+        return jsonify({"error": "找不到此更新工作"}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/api/data-info')
 def get_data_info():
     """取得資料檔案資訊"""
-    local_csv_file = 'data/abc.csv'
+    local_csv_file = LOCAL_CSV_FILE
     total_records = get_institution_count()
+    database_path = current_database_path(default=DATABASE_PATH)
     
     info = {
         "local_file_exists": os.path.exists(local_csv_file),
         "total_records": total_records,
-        "database_path": DATABASE_PATH,
-        "database_exists": os.path.exists(DATABASE_PATH)
+        "database_path": database_path,
+        "database_exists": os.path.exists(database_path),
+        "dataset_version": current_version(),
+        "connection_pool": db_pool.stats(),
+        "result_cache": result_cache.stats(),
+        "regions": region_catalog.info(),
+        "search_index": text_search_index.info() if text_search_index is not None else None,
+        "suggest_index": suggest_index.info() if suggest_index is not None else None
     }
     
+    latest_job = refresh_worker.latest()
+    if latest_job is not None:
+        info["refresh_job"] = latest_job.to_dict()
+    
     if os.path.exists(local_csv_file):
         file_time = os.path.getmtime(local_csv_file)
-        current_time = datetime.now().timestamp()
-        days_old = (current_time - file_time) / (24 * 3600)
+        # 以上次向來源確認的時間計算 (來源未更新時CSV檔本身不會被改寫)
+        days_old = file_age_days(local_csv_file)
         
         info.update({
             "file_date": datetime.fromtimestamp(file_time).strftime('%Y-%m-%d %H:%M:%S'),
             "days_old": round(days_old, 1),
-            "needs_update": days_old >= 30
+            "needs_update": days_old >= MAX_AGE_DAYS,
+            "source_sha256": load_metadata(local_csv_file).get('sha256')
         })
     
     return jsonify(info)
@@ -370,9 +863,23 @@ if __name__ == '__main__':
         print("資料庫為空，開始匯入CSV資料...")
         download_and_import_csv()
         record_count = get_institution_count()
+    elif not database_schema_is_current():
+        print("資料庫結構為舊版，重新匯入CSV資料...")
+        download_and_import_csv()
+        record_count = get_institution_count()
     
     print(f"✓ 資料庫中有 {record_count:,} 筆機構資料")
+    
+    # 建立全文搜尋與自動完成索引 (剛匯入時已隨資料集建立)
+    if text_search_index is None:
+        load_search_indexes()
+    
+    # 開發模式的自動重新載入會另外啟動監看行程，只在實際提供服務的行程啟動更新排程
+    # (未啟用自動重新載入時只有一個行程，直接啟動)
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        refresh_worker.start_scheduler(refresh_is_due, incremental=True, force=True)
     print("✓ 系統啟動完成")
     print("🌐 請訪問: http://127.0.0.1:5000")
     
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    app.run(debug=debug, host='127.0.0.1', port=5000)
\ No newline at end of file
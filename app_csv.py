@@ -1,17 +1,132 @@
 from flask import Flask, render_template, jsonify, request
 from flask_cors import CORS
+import numpy as np
 import pandas as pd
-import requests
+import itertools
 import json
 from datetime import datetime
 import os
+import time
+
+from district_resolver import build_district_patterns, resolve_dataframe
+from downloader import (
+    CSV_URL, LOCAL_CSV_FILE, MAX_AGE_DAYS, ensure_csv, file_age_days, load_metadata
+)
+from columnar import ResultFormatError, encode_columns, parse_result_format
+from compression import compress_response
+from export import EXPORT_BATCH_SIZE, ExportError, export_response, parse_format
+from facets import FacetIndex
+from fuzzy_search import BigramIndex, SearchQueryError, parse_query, parse_search_limit
+from geo import GeoQueryError, PointIndex, parse_k, parse_point, parse_radius
+from geo_grid import (
+    CLUSTER_MAX_ZOOM, MAX_POINTS, GridIndex, parse_bbox, parse_zoom, precision_for_zoom
+)
+from pagination import PaginationError, parse_limit, encode_cursor, decode_cursor
+from region_catalog import RegionCatalog, catalog_response
+from region_mapping import CITY_NAMES, MAPPING_FILE, derive_mapping, write_mapping_file
+from refresh_worker import RefreshWorker, job_phase
+from result_cache import ResultCache, cached_response
+from search_index import InvertedIndex
+from service_types import ServiceRegistry, compute_service_masks
+from snapshot import SnapshotError, read_snapshot, write_snapshot
+from suggest import SuggestIndex, SuggestQueryError, parse_prefix, parse_suggest_limit
+from text_normalize import normalize_addresses, normalize_series, normalize_text
 
 app = Flask(__name__)
 CORS(app)
+app.after_request(compress_response)
 
-# 全域變數存儲資料
-ltc_data = None
+# 全域變數存儲資料 (LoadedData，更新時整組替換)
+loaded_data = None
 city_district_mapping = {}
+# 縣市鄉鎮區目錄 (對照表載入時預先序列化)
+region_catalog = RegionCatalog({})
+
+# 機構搜尋結果快取 (鍵值含資料版本，資料重新載入後整個清除)
+result_cache = ResultCache()
+
+# 清理後資料的欄式快照 (與 abc.csv 放在一起，CSV 變更後自動失效)
+SNAPSHOT_FILE = 'data/abc.snapshot'
+
+# 回傳欄位：CSV 欄位 -> API 欄位 (順序即為輸出順序)
+RESULT_COLUMNS = {
+    '機構名稱': 'name',
+    '機構代碼': 'code',
+    '機構種類': 'type',
+    '縣市': 'city',
+    '區': 'district',
+    '地址全址': 'address',
+    '經度': 'longitude',
+    '緯度': 'latitude',
+    '特約服務項目': 'service_type',
+    '機構電話': 'phone',
+    '電子郵件': 'email',
+    '機構負責人姓名': 'manager',
+    '特約起日': 'contract_start',
+    '特約迄日': 'contract_end',
+}
+
+class LoadedData:
+    """
+    一次載入的機構資料與其索引
+
+    背景更新完成後以單一賦值整組替換：查詢端取用一次後，
+    DataFrame、服務對照、倒排索引、統計、座標索引、地圖網格、全文搜尋與自動完成索引必定來自同一份資料；
+    mapping 為由這份資料推導的縣市區域對照表。
+    data 為清理後的資料 (由快照載入時數值欄位為 mmap 陣列，不可再加欄位以免 pandas 整個複製)，
+    載入時計算的欄位 (服務位元遮罩、標準區域代碼與正規化欄位) 另存於同索引的 derived
+    """
+
+    # 每次載入的版本號 (行程內遞增，用於結果快取的鍵值)
+    _versions = itertools.count(1)
+
+    def __init__(self, data, derived, registry, facets, index, points, grid, mapping, search, suggest):
+        self.version = next(self._versions)
+        self.data = data
+        self.derived = derived
+        self.registry = registry
+        self.facets = facets
+        self.index = index
+        self.points = points
+        self.grid = grid
+        self.mapping = mapping
+        self.search = search
+        self.suggest = suggest
+
+def page_columns(page):
+    """
+    將一頁資料轉為 {API 欄位: 值列表}
+
+    逐欄整批轉成 Python 值，缺值 (NaN) 一律轉為 None，
+    成本只與頁面筆數有關，與符合條件的總筆數無關
+    """
+    columns = {}
+    for column, field in RESULT_COLUMNS.items():
+        values = page[column]
+        if values.hasnans:
+            values = values.astype(object).where(values.notna(), None)
+        columns[field] = values.tolist()
+    return columns
+
+def serialize_page(page):
+    """將一頁資料轉為 API 回傳格式 (逐筆字典)"""
+    columns = page_columns(page)
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def load_regions(mapping=None):
+    """
+    設定縣市鄉鎮區碼對照表，並重建縣市鄉鎮區目錄
+
+    mapping 為由資料推導的對照表 (同時以原子方式寫入對照表檔案)，省略時讀取對照表檔案
+    """
+    global city_district_mapping, region_catalog
+    if mapping:
+        if write_mapping_file(mapping):
+            print(f"✓ 已依資料更新 {MAPPING_FILE}")
+    else:
+        mapping = load_city_district_mapping()
+    city_district_mapping = mapping
+    region_catalog = RegionCatalog(city_district_mapping)
 
 def load_city_district_mapping():
     """載入縣市鄉鎮區碼對照表"""
@@ -19,8 +134,8 @@ def load_city_district_mapping():
         # 優先使用從CSV生成的真實對照表
         import json
         import os
-        if os.path.exists('real_city_mapping.json'):
-            with open('real_city_mapping.json', 'r', encoding='utf-8') as f:
+        if os.path.exists(MAPPING_FILE):
+            with open(MAPPING_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
     except:
         pass
@@ -50,88 +165,67 @@ def load_city_district_mapping():
             }}
         }
 
-def download_and_process_csv():
-    """下載並處理CSV資料 - 一個月只下載一次"""
-    local_csv_file = 'data/abc.csv'
-    local_processed_file = 'data/abc_processed.pkl'
+def process_csv(local_csv_file):
+    """解析並清理CSV，寫入欄式快照供下次啟動直接載入"""
+    df = pd.read_csv(local_csv_file, encoding='utf-8-sig')
+    df = df.dropna(subset=['機構名稱', '縣市', '區'])
     
-    # 確保資料目錄存在
-    os.makedirs('data', exist_ok=True)
+    # 將縣市和區域代碼轉換為字串格式，以便與前端對照
+    df['縣市'] = df['縣市'].astype(str)
+    # 區域代碼去除 .0 後綴
+    df['區'] = df['區'].astype(str).str.replace('.0', '', regex=False)
     
+    # 儲存處理後的資料 (寫入失敗不影響本次載入)
     try:
-        # 檢查本地檔案是否存在且在一個月內
-        if os.path.exists(local_csv_file):
-            file_time = os.path.getmtime(local_csv_file)
-            current_time = datetime.now().timestamp()
-            days_old = (current_time - file_time) / (24 * 3600)
-            
-            if days_old < 30:  # 30天內的檔案直接使用
-                print(f"使用本地CSV檔案 (檔案建立於 {days_old:.1f} 天前)")
-                
-                # 如果有處理過的檔案，直接載入
-                if os.path.exists(local_processed_file):
-                    try:
-                        df = pd.read_pickle(local_processed_file)
-                        print(f"載入已處理的資料檔案，共 {len(df)} 筆記錄")
-                        return df
-                    except:
-                        pass  # 如果載入失敗，重新處理CSV
-                
-                # 處理CSV檔案
-                df = pd.read_csv(local_csv_file)
-                df = df.dropna(subset=['機構名稱', '縣市', '區'])
-                
-                # 將縣市和區域代碼轉換為字串格式，以便與前端對照
-                df['縣市'] = df['縣市'].astype(str)
-                # 區域代碼去除 .0 後綴
-                df['區'] = df['區'].astype(str).str.replace('.0', '', regex=False)
-                
-                # 儲存處理後的資料
-                df.to_pickle(local_processed_file)
-                print(f"CSV處理完成，共 {len(df)} 筆記錄")
-                return df
-            else:
-                print(f"本地檔案已過期 ({days_old:.1f} 天)，重新下載...")
-        
-        # 下載新檔案
-        print("正在下載最新的CSV資料...")
-        url = "https://ltcpap.mohw.gov.tw/publish/abc.csv"
-        response = requests.get(url, timeout=30)
-        response.encoding = 'utf-8-sig'  # 處理BOM
-        
-        # 儲存到本地
-        with open(local_csv_file, 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        
-        print(f"CSV檔案已下載並儲存到 {local_csv_file}")
-        
-        # 處理CSV
-        df = pd.read_csv(local_csv_file)
-        df = df.dropna(subset=['機構名稱', '縣市', '區'])
-        
-        # 將縣市和區域代碼轉換為字串格式，以便與前端對照
-        df['縣市'] = df['縣市'].astype(str)
-        # 區域代碼去除 .0 後綴
-        df['區'] = df['區'].astype(str).str.replace('.0', '', regex=False)
-        
-        # 儲存處理後的資料
-        df.to_pickle(local_processed_file)
-        print(f"資料處理完成，共 {len(df)} 筆記錄")
-        
+        write_snapshot(df, SNAPSHOT_FILE, local_csv_file)
+    except (SnapshotError, OSError) as e:
+        print(f"⚠ 無法寫入快照檔: {e}")
+    return df
+
+def load_processed_data(local_csv_file):
+    """優先以 mmap 載入欄式快照，快照不存在或與CSV不符時重新解析CSV"""
+    df = read_snapshot(SNAPSHOT_FILE, local_csv_file)
+    if df is not None:
+        print(f"載入資料快照，共 {len(df)} 筆記錄")
         return df
+    df = process_csv(local_csv_file)
+    print(f"CSV處理完成，共 {len(df)} 筆記錄")
+    return df
+
+def download_and_process_csv(force=False, job=None):
+    """
+    下載並處理CSV資料
+
+    本地檔案 30 天內確認過就直接使用；過期或 force=True 時向來源發出條件式請求，
+    來源未更新時沿用本地檔案與快照
+    """
+    local_csv_file = LOCAL_CSV_FILE
+    
+    try:
+        with job_phase(job, 'download'):
+            result = ensure_csv(CSV_URL, local_csv_file, force=force)
+        if job is not None:
+            job.result['download_status'] = result['status']
+        if result['status'] == 'fresh':
+            print(f"使用本地CSV檔案 (上次確認於 {result['age_days']} 天前)")
+        elif result['status'] == 'downloaded':
+            print(f"CSV檔案已下載並儲存到 {local_csv_file} ({result['bytes']:,} bytes)")
+        else:
+            print("資料來源未更新，沿用本地CSV檔案")
+        with job_phase(job, 'parse'):
+            return load_processed_data(local_csv_file)
         
     except Exception as e:
         print(f"處理CSV時發生錯誤: {e}")
+        if job is not None:
+            job.result['download_error'] = str(e)
         
         # 如果下載失敗，嘗試使用舊的本地檔案
         if os.path.exists(local_csv_file):
             print("下載失敗，使用現有的本地檔案...")
             try:
-                if os.path.exists(local_processed_file):
-                    df = pd.read_pickle(local_processed_file)
-                else:
-                    df = pd.read_csv(local_csv_file)
-                    df = df.dropna(subset=['機構名稱', '縣市', '區'])
+                with job_phase(job, 'parse'):
+                    df = load_processed_data(local_csv_file)
                 print(f"使用本地備份檔案，共 {len(df)} 筆記錄")
                 return df
             except Exception as e2:
@@ -139,164 +233,470 @@ def download_and_process_csv():
         
         return None
 
+def load_ltc_data(force=False, job=None):
+    """
+    載入機構資料，推導縣市區域對照表，計算服務位元遮罩、標準區域代碼、
+    名稱 / 地址 / 區域的正規化欄位，並建立倒排索引、篩選條件統計、座標索引、地圖網格、
+    全文搜尋與自動完成索引
+
+    回傳 LoadedData (載入失敗時回傳 None)，由呼叫端以 activate_data() 切換
+    """
+    df = download_and_process_csv(force, job)
+    if df is None:
+        return None
+    
+    with job_phase(job, 'mapping'):
+        # 推導不出任何區域時 (例如地址都沒有縣市名稱) 改用現有的對照表
+        mapping = derive_mapping(df) or city_district_mapping or load_city_district_mapping()
+    
+    with job_phase(job, 'index'):
+        registry = ServiceRegistry()
+        masks, services = compute_service_masks(df['特約服務項目'], registry)
+        resolved = resolve_dataframe(df, build_district_patterns(mapping))
+        
+        district_names = {
+            code: name for city in mapping.values() for code, name in city['districts'].items()
+        }
+        
+        # 另存於新的 DataFrame：對 df 加欄位會讓 pandas 複製整個 DataFrame (含快照的 mmap 欄位)
+        derived = pd.DataFrame({
+            'service_mask': masks,
+            'resolved_district': resolved,
+            'name_norm': normalize_series(df['機構名稱']),
+            'address_norm': normalize_addresses(df['地址全址'], df['縣市'].map(CITY_NAMES)),
+            'district_norm': normalize_series(resolved.map(district_names)),
+        }, index=df.index)
+        facets = FacetIndex.from_series(df['縣市'], derived['resolved_district'], services)
+        index = InvertedIndex(df, services, derived['resolved_district'])
+        points = PointIndex(df['緯度'], df['經度'])
+        grid = GridIndex.from_dataframe(df, services)
+        search = BigramIndex(
+            np.arange(len(df)), derived['name_norm'], derived['address_norm'], df['縣市'],
+            derived['service_mask']
+        )
+        suggest = SuggestIndex(df['機構名稱'], derived['name_norm'], df['機構代碼'], df['縣市'])
+    return LoadedData(df, derived, registry, facets, index, points, grid, mapping, search, suggest)
+
+def activate_data(data):
+    """切換查詢用的資料，縣市鄉鎮區目錄與對照表檔案隨之更新"""
+    global loaded_data
+    loaded_data = data
+    load_regions(data.mapping)
+
+def run_refresh_job(job, force=True):
+    """背景更新工作：向來源確認、重新載入並建立索引，完成後才替換查詢用的資料"""
+    new_data = load_ltc_data(force, job)
+    if new_data is None:
+        job.error = "無法載入資料"
+        return False
+    
+    with job_phase(job, 'swap'):
+        activate_data(new_data)
+        result_cache.invalidate()
+    job.result['total_records'] = len(new_data.data)
+    return True
+
+def refresh_is_due():
+    """本地資料不存在或超過 MAX_AGE_DAYS 天未向來源確認時需要更新"""
+    days_old = file_age_days(LOCAL_CSV_FILE)
+    return days_old is None or days_old >= MAX_AGE_DAYS
+
+# 背景更新工作 (同時間只執行一個，重複的更新要求併入執行中的工作)
+refresh_worker = RefreshWorker(run_refresh_job)
+
+def match_ranks(data, city_code, district_code, service_type, keyword=''):
+    """以倒排索引取得符合篩選條件的名次陣列 (沒有任何條件時回傳 None)"""
+    service_fallback = None
+    if service_type and data.registry.mask(service_type) is None:
+        # 未登錄的服務名稱才退回子字串比對
+        service_fallback = data.data['特約服務項目'].str.contains(
+            service_type, na=False, regex=False
+        ).to_numpy()
+    return data.index.match(
+        city_code, district_code, service_type, service_fallback, keyword_filter(data.derived, keyword)
+    )
+
+def service_is_known(data, service_type):
+    """服務名稱是否為已登錄或資料中出現的完整服務項目 (地圖網格只統計完整名稱)"""
+    return service_type in data.registry or service_type in data.index.by_service
+
+def keyword_filter(df, keyword):
+    """
+    名稱 / 地址關鍵字的布林陣列 (沒有關鍵字時回傳 None)
+
+    df 為載入時算好的正規化名稱與地址欄位 (LoadedData.derived)，這裡只正規化使用者輸入，以單一字串比對
+    """
+    keyword = normalize_text(keyword)
+    if not keyword:
+        return None
+    return (
+        df['name_norm'].str.contains(keyword, regex=False).to_numpy()
+        | df['address_norm'].str.contains(keyword, regex=False).to_numpy()
+    )
+
+def allowed_positions(data, ranks):
+    """將名次陣列轉為以 DataFrame 位置計算的布林陣列 (None 代表不限)"""
+    if ranks is None:
+        return None
+    allowed = np.zeros(len(data.data), dtype=bool)
+    allowed[data.index.order[ranks]] = True
+    return allowed
+
+def get_loaded_data():
+    """取得目前的資料 (尚未載入時先載入)"""
+    if loaded_data is None:
+        data = load_ltc_data()
+        if data is not None:
+            activate_data(data)
+    return loaded_data
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/cities')
 def get_cities():
-    """取得所有縣市列表"""
-    global city_district_mapping
-    if not city_district_mapping:
-        city_district_mapping = load_city_district_mapping()
-    
-    cities = [{"code": code, "name": data["name"]} 
-              for code, data in city_district_mapping.items()]
-    return jsonify(cities)
+    """取得所有縣市列表 (預先序列化的內容)"""
+    return catalog_response(region_catalog.cities)
 
 @app.route('/api/districts/<city_code>')
 def get_districts(city_code):
-    """根據縣市代碼取得區域列表"""
-    global city_district_mapping
-    if not city_district_mapping:
-        city_district_mapping = load_city_district_mapping()
-    
-    if city_code in city_district_mapping:
-        districts = [{"code": code, "name": name} 
-                    for code, name in city_district_mapping[city_code]["districts"].items()]
-        return jsonify(districts)
-    return jsonify([])
+    """根據縣市代碼取得區域列表 (預先序列化的內容)"""
+    return catalog_response(region_catalog.district_entry(city_code))
+
+@app.route('/api/regions')
+def get_regions():
+    """一次取得所有縣市與其鄉鎮區列表"""
+    return catalog_response(region_catalog.bundle)
 
 @app.route('/api/institutions')
 def search_institutions():
-    """搜尋機構"""
-    global ltc_data, city_district_mapping
+    """
+    搜尋機構
+
+    相同資料版本與查詢參數的結果直接由快取回傳，並支援 ETag / If-None-Match
+    """
+    # 如果資料尚未載入，先載入 (之後全程使用同一份資料，不受背景更新影響)
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
     
-    # 如果資料尚未載入，先載入
-    if ltc_data is None:
-        ltc_data = download_and_process_csv()
-        if ltc_data is None:
-            return jsonify({"error": "無法載入資料"}), 500
+    city_code = request.args.get('city') or ''
+    district_code = request.args.get('district') or ''
+    service_type = request.args.get('service_type', '')
+    keyword = request.args.get('keyword', '')
     
-    # 確保對照表已載入
-    if not city_district_mapping:
-        city_district_mapping = load_city_district_mapping()
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = decode_cursor(request.args.get('cursor'))
+        result_format = parse_result_format(request.args.get('format'))
+    except (PaginationError, ResultFormatError) as e:
+        return jsonify({"error": str(e)}), 400
     
-    city_code = request.args.get('city')
-    district_code = request.args.get('district')
-    service_type = request.args.get('service_type', '')
+    # 關鍵字以正規化後的字串作為鍵值 (「台北」與「臺北」共用快取)
+    key = ('institutions', data.version, city_code, district_code, service_type,
+           normalize_text(keyword), limit, cursor, result_format)
+    return cached_response(
+        result_cache, key,
+        lambda: query_institutions(
+            data, city_code, district_code, service_type, limit, cursor, result_format, keyword
+        )
+    )
+
+def query_institutions(data, city_code, district_code, service_type, limit, cursor,
+                       result_format='rows', keyword=''):
+    """查詢一頁機構並轉為 JSON 回應"""
+    # 以倒排索引取得符合條件的列 (陣列交集，不複製 DataFrame)
+    start_time = time.perf_counter()
+    ranks = match_ranks(data, city_code, district_code, service_type, keyword)
     
-    # 篩選資料
-    filtered_data = ltc_data.copy()
-    
-    # 縣市篩選（如果有選擇縣市）
-    if city_code:
-        filtered_data = filtered_data[filtered_data['縣市'] == city_code]
-        print(f"篩選縣市 '{city_code}'，找到 {len(filtered_data)} 筆")
-    
-    # 鄉鎮區篩選（只有在選擇了鄉鎮區時才進行篩選）
-    if district_code:
-        # 改為從地址進行模糊比對
-        # 先從對照表取得區域名稱
-        district_name = None
-        if city_code in city_district_mapping:
-            districts = city_district_mapping[city_code].get('districts', {})
-            district_name = districts.get(district_code)
-        
-        if district_name:
-            # 使用區域名稱在地址中進行模糊比對
-            # 支援多種可能的區域名稱格式
-            search_patterns = [
-                district_name,  # 完整名稱，如 "三民區"
-                district_name.replace('區', '').replace('市', '').replace('鎮', '').replace('鄉', '')  # 去掉後綴，如 "三民"
-            ]
-            
-            # 建立模糊比對條件
-            mask = pd.Series([False] * len(filtered_data), index=filtered_data.index)
-            for pattern in search_patterns:
-                if pattern:  # 確保pattern不為空
-                    pattern_mask = filtered_data['地址全址'].str.contains(pattern, na=False, regex=False)
-                    mask = mask | pattern_mask
-            
-            filtered_data = filtered_data[mask]
-            print(f"使用區域名稱 '{district_name}' 進行地址模糊比對，找到 {len(filtered_data)} 筆")
-        else:
-            # 如果找不到區域名稱，仍使用原始代碼比對
-            filtered_data = filtered_data[filtered_data['區'] == district_code]
-            print(f"使用區域代碼 '{district_code}' 進行精確比對，找到 {len(filtered_data)} 筆")
+    # 依 (機構名稱, 編號) 排序分頁：從游標位置往後取 limit 筆
+    positions, total_count, has_more = data.index.page(ranks, limit, cursor)
+    page = data.data.iloc[positions]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(page['機構名稱'].iloc[-1], int(page.index[-1]))
     
-    # 服務類型篩選（只有在選擇了特定服務類型時才進行篩選）
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    print(f"索引查詢完成，找到 {total_count} 筆，返回 {len(page)} 筆，耗時 {elapsed_ms:.2f} ms")
+    
+    # 轉換為字典格式 (只轉換這一頁；欄式格式則每欄一個陣列)
+    if result_format == 'columnar':
+        result = encode_columns(page_columns(page))
+    else:
+        result = serialize_page(page)
+    
+    return jsonify({
+        'total': total_count,
+        'institutions': result,
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/search')
+def search_text():
+    """
+    容錯全文搜尋 - 以機構名稱與地址搜尋，允許少量錯字
+
+    參數 q 為搜尋字串，limit 為回傳筆數，可搭配 city、service_type 篩選；
+    結果依編輯距離、命中欄位 (名稱優先) 排序，附 edit_distance 與 matched_field
+    """
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
+    
+    try:
+        query = parse_query(request.args.get('q'))
+        limit = parse_search_limit(request.args.get('limit'))
+    except SearchQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    city_code = request.args.get('city') or ''
+    service_type = request.args.get('service_type', '')
+    
+    key = ('search', data.version, query, city_code, service_type, limit)
+    return cached_response(
+        result_cache, key,
+        lambda: query_search(data, query, limit, city_code, service_type)
+    )
+
+def query_search(data, query, limit, city_code, service_type):
+    """以二連字索引搜尋並轉為 JSON 回應"""
+    start_time = time.perf_counter()
+    service_mask = None
     if service_type:
-        filtered_data = filtered_data[filtered_data['特約服務項目'].str.contains(service_type, na=False)]
-        print(f"篩選服務類型 '{service_type}'，找到 {len(filtered_data)} 筆")
-    
-    # 轉換為字典格式
-    result = []
-    for _, row in filtered_data.iterrows():
-        institution = {
-            'name': row['機構名稱'],
-            'code': row['機構代碼'],
-            'type': row['機構種類'],
-            'city': row['縣市'],
-            'district': row['區'],
-            'address': row['地址全址'],
-            'longitude': row['經度'] if pd.notna(row['經度']) else None,
-            'latitude': row['緯度'] if pd.notna(row['緯度']) else None,
-            'service_type': row['特約服務項目'],
-            'phone': row['機構電話'],
-            'email': row['電子郵件'],
-            'manager': row['機構負責人姓名'],
-            'contract_start': row['特約起日'],
-            'contract_end': row['特約迄日']
-        }
-        result.append(institution)
+        # 未登錄的服務名稱沒有任何機構提供
+        service_mask = data.registry.mask(service_type) or 0
+    matches = data.search.search(query, limit, city_code, service_mask)
+    
+    result = serialize_page(data.data.iloc[[position for position, _, _ in matches]])
+    for institution, (_, distance, field) in zip(result, matches):
+        institution['edit_distance'] = distance
+        institution['matched_field'] = field
+    
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    print(f"全文搜尋完成，「{query}」返回 {len(result)} 筆，耗時 {elapsed_ms:.2f} ms")
     
     return jsonify({
+        'query': query,
         'total': len(result),
-        'institutions': result[:100]  # 限制返回前100筆
+        'institutions': result
     })
 
-@app.route('/api/refresh-data')
-def refresh_data():
-    """強制重新下載資料"""
-    global ltc_data
-    
-    # 刪除本地檔案以強制重新下載
-    local_files = ['data/abc.csv', 'data/abc_processed.pkl']
-    for file_path in local_files:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"已刪除 {file_path}")
-    
-    ltc_data = download_and_process_csv()
-    if ltc_data is not None:
-        file_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+@app.route('/api/suggest')
+def suggest_names():
+    """
+    機構名稱自動完成 - 回傳名稱 (或簡稱) 以 prefix 開頭的機構
+
+    參數 prefix 為使用者目前輸入的文字，limit 為回傳筆數，可搭配 city 限定縣市；
+    只查詢載入時建立的排序陣列，不存取 DataFrame
+    """
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
+    
+    try:
+        prefix = parse_prefix(request.args.get('prefix'))
+        limit = parse_suggest_limit(request.args.get('limit'))
+    except SuggestQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        'prefix': prefix,
+        'suggestions': data.suggest.suggest(prefix, limit, request.args.get('city') or None)
+    })
+
+@app.route('/api/institutions/nearby')
+def search_nearby_institutions():
+    """
+    搜尋附近機構 - 以座標索引框選候選，再依實際距離取最近的 k 筆
+
+    參數 lat、lng 為中心點，radius 為搜尋半徑 (公里)，k 為回傳筆數；
+    可搭配 city、district、service_type 篩選
+    """
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
+    
+    try:
+        lat, lng = parse_point(request.args.get('lat'), request.args.get('lng'))
+        radius_km = parse_radius(request.args.get('radius'))
+        k = parse_k(request.args.get('k'))
+    except GeoQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    start_time = time.perf_counter()
+    ranks = match_ranks(
+        data,
+        request.args.get('city'),
+        request.args.get('district'),
+        request.args.get('service_type', '')
+    )
+    positions, distances, total_count = data.points.nearest(
+        lat, lng, radius_km, k, allowed_positions(data, ranks)
+    )
+    
+    result = serialize_page(data.data.iloc[positions])
+    for institution, distance in zip(result, distances.tolist()):
+        institution['distance_km'] = round(distance, 3)
+    
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    print(f"附近機構查詢完成，半徑 {radius_km} 公里內 {total_count} 筆，返回 {len(result)} 筆，耗時 {elapsed_ms:.2f} ms")
+    
+    return jsonify({
+        'center': {'lat': lat, 'lng': lng},
+        'radius_km': radius_km,
+        'total': total_count,
+        'institutions': result
+    })
+
+@app.route('/api/institutions/bbox')
+def search_institutions_in_bbox():
+    """
+    地圖範圍查詢 - 縮小時回傳網格聚合，放大時回傳個別機構
+
+    參數 west、south、east、north 為地圖範圍，zoom 為縮放層級，可搭配 service_type
+    (須為完整的服務名稱：網格只統計完整名稱，兩種模式都不接受部分名稱)
+    """
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
+    
+    try:
+        west, south, east, north = parse_bbox(
+            request.args.get('west'), request.args.get('south'),
+            request.args.get('east'), request.args.get('north')
+        )
+        zoom = parse_zoom(request.args.get('zoom'))
+    except GeoQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    service_type = request.args.get('service_type', '')
+    if service_type and not service_is_known(data, service_type):
+        return jsonify({"error": f"未知的服務項目: {service_type}"}), 400
+    
+    if zoom <= CLUSTER_MAX_ZOOM:
+        precision = precision_for_zoom(zoom)
+        clusters = data.grid.query(west, south, east, north, precision, service_type)
         return jsonify({
-            "message": "資料強制更新成功", 
-            "total_records": len(ltc_data),
-            "update_time": file_time
+            'mode': 'clusters',
+            'zoom': zoom,
+            'precision': precision,
+            'total': sum(cluster['count'] for cluster in clusters),
+            'clusters': clusters
         })
-    else:
-        return jsonify({"error": "資料更新失敗"}), 500
+    
+    ranks = match_ranks(data, None, None, service_type)
+    positions = data.points.within(west, south, east, north, allowed_positions(data, ranks))
+    truncated = len(positions) > MAX_POINTS
+    result = serialize_page(data.data.iloc[positions[:MAX_POINTS]])
+    return jsonify({
+        'mode': 'points',
+        'zoom': zoom,
+        'total': len(result),
+        'truncated': truncated,
+        'institutions': result
+    })
+
+@app.route('/api/institutions/export')
+def export_institutions():
+    """
+    匯出符合條件的全部機構 - 以 NDJSON 或 CSV 串流回傳
+
+    參數 format 為 ndjson (預設) 或 csv，可搭配 city、district、service_type、keyword 篩選；
+    排序與 /api/institutions 相同，每次只轉換一批資料
+    """
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
+    
+    try:
+        fmt = parse_format(request.args.get('format'))
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    ranks = match_ranks(
+        data,
+        request.args.get('city'),
+        request.args.get('district'),
+        request.args.get('service_type', ''),
+        request.args.get('keyword', '')
+    )
+    return export_response(export_batches(data, ranks), fmt, list(RESULT_COLUMNS.values()))
+
+def export_batches(data, ranks):
+    """依名次逐批產生機構 (API 格式)，ranks 為 None 時匯出全部"""
+    total = data.index.size if ranks is None else len(ranks)
+    for start in range(0, total, EXPORT_BATCH_SIZE):
+        if ranks is None:
+            batch = np.arange(start, min(start + EXPORT_BATCH_SIZE, total))
+        else:
+            batch = ranks[start:start + EXPORT_BATCH_SIZE]
+        yield serialize_page(data.data.iloc[data.index.order[batch]])
+    print(f"匯出完成，共 {total} 筆")
+
+@app.route('/api/facets')
+def get_facets():
+    """取得篩選條件統計 (總數與未指定維度的細項筆數)"""
+    data = get_loaded_data()
+    if data is None:
+        return jsonify({"error": "無法載入資料"}), 500
+    
+    return jsonify(data.facets.lookup(
+        request.args.get('city'),
+        request.args.get('district'),
+        request.args.get('service_type', '')
+    ))
+
+@app.route('/api/refresh-data')
+def refresh_data():
+    """
+    送出背景更新工作，立即回傳工作編號 (進度請查詢 /api/refresh-status/<工作編號>)
+
+    強制向來源確認 (條件式請求，來源未變更時不會重新下載) 並重新載入資料；
+    已有更新工作執行中時不另外啟動，回傳該工作的編號 (coalesced 為 true)
+    """
+    job, coalesced = refresh_worker.submit(force=True)
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "coalesced": coalesced,
+        "status_url": f"/api/refresh-status/{job.id}"
+    }), 202
+
+@app.route('/api/refresh-status/<job_id>')
+def refresh_status(job_id):
+    """取得更新工作的狀態、目前階段與各階段耗時 (download / parse / mapping / index / swap)"""
+    job = refresh_worker.get(job_id)
+    if job is None:
+        return jsonify({"error": "找不到此更新工作"}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/api/data-info')
 def get_data_info():
     """取得資料檔案資訊"""
-    local_csv_file = 'data/abc.csv'
+    local_csv_file = LOCAL_CSV_FILE
     info = {
         "local_file_exists": os.path.exists(local_csv_file),
-        "total_records": len(ltc_data) if ltc_data is not None else 0
+        "total_records": len(loaded_data.data) if loaded_data is not None else 0,
+        "result_cache": result_cache.stats(),
+        "regions": region_catalog.info(),
+        "search_index": loaded_data.search.info() if loaded_data is not None else None,
+        "suggest_index": loaded_data.suggest.info() if loaded_data is not None else None
     }
     
+    latest_job = refresh_worker.latest()
+    if latest_job is not None:
+        info["refresh_job"] = latest_job.to_dict()
+    
     if os.path.exists(local_csv_file):
         file_time = os.path.getmtime(local_csv_file)
-        current_time = datetime.now().timestamp()
-        days_old = (current_time - file_time) / (24 * 3600)
+        # 以上次向來源確認的時間計算 (來源未更新時CSV檔本身不會被改寫)
+        days_old = file_age_days(local_csv_file)
         
         info.update({
             "file_date": datetime.fromtimestamp(file_time).strftime('%Y-%m-%d %H:%M:%S'),
             "days_old": round(days_old, 1),
-            "needs_update": days_old >= 30
+            "needs_update": days_old >= MAX_AGE_DAYS,
+            "source_sha256": load_metadata(local_csv_file).get('sha256')
         })
     
     return jsonify(info)
@@ -304,12 +704,19 @@ def get_data_info():
 if __name__ == '__main__':
     # 啟動時載入資料
     print("正在載入長照機構資料...")
-    ltc_data = download_and_process_csv()
-    city_district_mapping = load_city_district_mapping()
+    load_regions()
+    data = load_ltc_data()
     
-    if ltc_data is not None:
-        print(f"成功載入 {len(ltc_data)} 筆機構資料")
+    if data is not None:
+        activate_data(data)
+        print(f"成功載入 {len(loaded_data.data)} 筆機構資料")
     else:
         print("警告: 無法載入機構資料")
     
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    # 開發模式的自動重新載入會另外啟動監看行程，只在實際提供服務的行程啟動更新排程
+    # (未啟用自動重新載入時只有一個行程，直接啟動)
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        refresh_worker.start_scheduler(refresh_is_due, force=True)
+    
+    app.run(debug=debug, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,8 @@
+"""
+長照機構查詢系統 - 效能測試套件
+以合成的 abc.csv (可由 2.2 萬筆放大到數百萬筆) 測量 SQLite 版本 (app.py) 與
+CSV 版本 (app_csv.py) 的匯入時間、啟動時間、記憶體用量與各查詢情境的延遲分布，
+結果輸出為 JSON 供不同版本比較
+
+用法: python -m benchmarks --help
+"""
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+效能測試命令列
+
+    python -m benchmarks generate 220000 data/abc.csv
+    python -m benchmarks run --rows 22000 220000 2200000 --output results.json
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks serialization
+    python -m benchmarks normalization data/abc.csv
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.normalization import normalization_main
+from benchmarks.run import (
+    BACKENDS, DEFAULT_REPEAT, DEFAULT_ROWS, DEFAULT_THRESHOLD, DEFAULT_WARMUP, PHASES,
+    compare_reports, print_comparison, print_results, run_benchmarks, worker_main
+)
+from benchmarks.serialization import serialization_main
+from benchmarks.synthetic import DEFAULT_SEED, generate_csv
+from downloader import LOCAL_CSV_FILE
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='長照機構查詢系統效能測試')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='產生合成的 abc.csv')
+    generate.add_argument('rows', type=int, help='資料筆數')
+    generate.add_argument('path', help='輸出的CSV檔案')
+    generate.add_argument('--seed', type=int, default=DEFAULT_SEED)
+
+    run = commands.add_parser('run', help='執行匯入、啟動與查詢延遲測試')
+    run.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='資料筆數 (可指定多個)')
+    run.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='每個情境的請求次數')
+    run.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help='每個情境的暖機請求次數')
+    run.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run.add_argument('--cached', action='store_true', help='保留結果快取 (預設每次請求前清除)')
+    run.add_argument('--work-dir', help='保留測試資料的目錄 (預設使用暫存目錄並於結束後刪除)')
+    run.add_argument('--output', help='結果 JSON 檔案')
+
+    compare = commands.add_parser('compare', help='比較兩次測試結果')
+    compare.add_argument('baseline', help='基準結果 JSON')
+    compare.add_argument('current', help='本次結果 JSON')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                         help='視為變慢的比例 (預設 0.1，即慢 10%%)')
+
+    commands.add_parser('serialization', help='比較結果序列化做法的成本')
+
+    normalization = commands.add_parser('normalization', help='比較關鍵字比對做法 (多種寫法 / 正規化欄位) 的成本')
+    normalization.add_argument('csv_file', nargs='?', default=LOCAL_CSV_FILE,
+                               help=f'測試用的CSV檔案 (預設 {LOCAL_CSV_FILE})')
+
+    # 由 run 啟動的子行程 (不另外顯示在說明中)
+    worker = commands.add_parser('worker')
+    worker.add_argument('phase', choices=PHASES)
+    worker.add_argument('backend', choices=BACKENDS)
+    worker.add_argument('result_file')
+    worker.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    worker.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    worker.add_argument('--cached', action='store_true')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'generate':
+        count = generate_csv(args.path, args.rows, args.seed)
+        print(f"✓ 已產生 {count:,} 筆合成資料到 {args.path}")
+        return 0
+
+    if args.command == 'serialization':
+        return serialization_main()
+
+    if args.command == 'normalization':
+        return normalization_main(args.csv_file)
+
+    if args.command == 'worker':
+        return worker_main(args.phase, args.backend, args.result_file,
+                           args.repeat, args.warmup, args.cached)
+
+    if args.command == 'compare':
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        rows, regressions = compare_reports(baseline, current, args.threshold)
+        print_comparison(rows, regressions, args.threshold)
+        return 1 if regressions else 0
+
+    print("=== 長照機構查詢系統效能測試 ===")
+    report = run_benchmarks(args.rows, args.backends, args.repeat, args.warmup,
+                            args.seed, args.cached, args.work_dir)
+    print_results(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 結果已寫入 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+關鍵字正規化效能測試
+比較「查詢時對原始欄位嘗試多種寫法 (臺/台、全形/半形數字)」與
+「匯入時已寫入正規化欄位，查詢時只正規化關鍵字」的查詢耗時與命中筆數，
+SQLite 版本 (app.py) 與 CSV 版本 (app_csv.py) 各測一次
+
+用法: python -m benchmarks normalization [CSV檔案]
+"""
+
+import itertools
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+from app import SELECTIVE_RATIO, approximate_row_count, keyword_condition
+from app_csv import keyword_filter
+from csv_importer import CSV_DTYPES, bulk_import, clean_chunk, create_schema
+from downloader import LOCAL_CSV_FILE
+from region_mapping import CITY_NAMES
+from text_normalize import normalize_addresses, normalize_series
+
+KEYWORDS = ['台北市', '臺中市大安', '中正路１２３', '中山路5', '長照', '高雄市三民區']
+REPEAT = 20
+# 舊做法比對原始欄位用的全文檢索表 (只在測試資料庫中建立)
+RAW_FTS_TABLE = 'benchmark_raw_fts'
+
+FULLWIDTH_DIGITS = str.maketrans('0123456789', '０１２３４５６７８９')
+HALFWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+
+
+def keyword_variants(keyword):
+    """舊做法：列舉關鍵字的各種寫法 (臺/台 × 全形/半形數字)"""
+    keyword = keyword.strip()
+    names = {keyword, keyword.replace('臺', '台'), keyword.replace('台', '臺')}
+    digits = [lambda s: s, lambda s: s.translate(FULLWIDTH_DIGITS), lambda s: s.translate(HALFWIDTH_DIGITS)]
+    return sorted({convert(name) for name, convert in itertools.product(names, digits)})
+
+
+def raw_condition(conn, keyword):
+    """
+    舊做法的 SQL 條件 (選擇規則與 app.substring_condition 相同)：
+    全部寫法都至少三個字且命中筆數夠少時走原始欄位的 FTS，否則以 LIKE 逐一比對
+    """
+    variants = keyword_variants(keyword)
+    if all(len(v) >= 3 for v in variants):
+        phrases = ' OR '.join('"{}"'.format(v.replace('"', '""')) for v in variants)
+        match = f'{{name address}} : ({phrases})'
+        hits = conn.execute(
+            f'SELECT COUNT(*) FROM {RAW_FTS_TABLE} WHERE {RAW_FTS_TABLE} MATCH ?', (match,)
+        ).fetchone()[0]
+        if hits <= approximate_row_count(conn) * SELECTIVE_RATIO:
+            condition = f'id IN (SELECT rowid FROM {RAW_FTS_TABLE} WHERE {RAW_FTS_TABLE} MATCH ?)'
+            return condition, [match]
+    condition = '(' + ' OR '.join(f'{c} LIKE ?' for c in ('name', 'address') for _ in variants) + ')'
+    return condition, [f'%{v}%' for _ in ('name', 'address') for v in variants]
+
+
+def query_page(conn, build_condition, keyword):
+    """與 /api/institutions 相同：建立條件、計算總數並取第一頁"""
+    condition, params = build_condition(conn, keyword)
+    total = conn.execute(f'SELECT COUNT(*) FROM institutions WHERE {condition}', params).fetchone()[0]
+    conn.execute(
+        f'SELECT * FROM institutions WHERE {condition} ORDER BY name, id LIMIT 100', params
+    ).fetchall()
+    return total
+
+
+def raw_filter(df, keyword):
+    """舊做法的 DataFrame 篩選：以各種寫法組成正則表達式比對原始欄位"""
+    regex = '|'.join(re.escape(v) for v in keyword_variants(keyword))
+    return (
+        df['機構名稱'].str.contains(regex, na=False).to_numpy()
+        | df['地址全址'].str.contains(regex, na=False).to_numpy()
+    )
+
+
+def measure(func, *args, repeat=REPEAT):
+    """回傳 (平均耗時毫秒, 最後一次結果)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def build_database(csv_file, path):
+    """匯入測試資料庫，並另外為原始名稱 / 地址建立全文檢索表供舊做法使用"""
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    bulk_import(conn, csv_file, durable=False)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {RAW_FTS_TABLE} USING fts5("
+        "name, address, content='institutions', content_rowid='id', tokenize='trigram')"
+    )
+    conn.execute(f"INSERT INTO {RAW_FTS_TABLE}({RAW_FTS_TABLE}) VALUES ('rebuild')")
+    conn.commit()
+    return conn
+
+
+def load_frame(csv_file):
+    """讀取CSV並計算與 app_csv 載入時相同的正規化欄位"""
+    df = clean_chunk(pd.read_csv(csv_file, dtype=CSV_DTYPES, encoding='utf-8-sig'))
+    return df.assign(
+        name_norm=normalize_series(df['機構名稱']),
+        address_norm=normalize_addresses(df['地址全址'], df['縣市'].map(CITY_NAMES)),
+    )
+
+
+def normalization_main(csv_file=LOCAL_CSV_FILE):
+    if not os.path.exists(csv_file):
+        print(f"✗ 找不到CSV檔案: {csv_file}")
+        return 1
+
+    print("=== 關鍵字正規化效能測試 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_database(csv_file, os.path.join(tmp, 'benchmark.db'))
+        print(f"\nSQLite (app.py)，{REPEAT} 次平均，單位 ms")
+        print("關鍵字\t\t多種寫法\t筆數\t正規化欄位\t筆數")
+        for keyword in KEYWORDS:
+            old_ms, old_total = measure(query_page, conn, raw_condition, keyword)
+            new_ms, new_total = measure(query_page, conn, keyword_condition, keyword)
+            print(f"{keyword}\t{old_ms:.2f}\t\t{old_total}\t{new_ms:.2f}\t\t{new_total}")
+        conn.close()
+
+    df = load_frame(csv_file)
+    print(f"\nCSV (app_csv.py)，{REPEAT} 次平均，單位 ms")
+    print("關鍵字\t\t多種寫法\t筆數\t正規化欄位\t筆數")
+    for keyword in KEYWORDS:
+        old_ms, old_mask = measure(raw_filter, df, keyword)
+        new_ms, new_mask = measure(keyword_filter, df, keyword)
+        print(f"{keyword}\t{old_ms:.2f}\t\t{int(old_mask.sum())}\t{new_ms:.2f}\t\t{int(new_mask.sum())}")
+
+    # 正規化欄位涵蓋多種寫法能找到的全部機構 (另外還有地址省略縣市名稱的機構)
+    missing = [k for k in KEYWORDS if (raw_filter(df, k) & ~keyword_filter(df, k)).any()]
+    if missing:
+        print(f"\n✗ 正規化比對遺漏了多種寫法找得到的機構: {missing}")
+        return 1
+    print("\n✓ 正規化比對涵蓋多種寫法的全部結果")
+    return 0
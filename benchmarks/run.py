@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+效能測試執行
+每種資料量產生一份合成 CSV，每個版本在獨立的工作目錄 (data/abc.csv、對照表) 中
+以子行程依序執行兩個階段，記憶體量測不受其他階段或版本影響：
+
+- import: 首次匯入 (SQLite 版本建立資料集；CSV 版本解析CSV、寫入快照並建立索引)
+- serve: 重新啟動 (載入既有資料與索引)，再以 Flask test client 對每個查詢情境
+  先暖機後重複請求，記錄 p50 / p95 / p99 延遲
+
+延遲預設在每次請求前清除結果快取 (測量實際查詢成本)，cached=True 時保留快取
+"""
+
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.scenarios import search_scenarios
+from benchmarks.synthetic import DEFAULT_SEED, generate_csv
+from downloader import LOCAL_CSV_FILE
+from region_mapping import MAPPING_FILE
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ('sqlite', 'csv')
+PHASES = ('import', 'serve')
+DEFAULT_ROWS = [22000]
+DEFAULT_REPEAT = 50
+DEFAULT_WARMUP = 5
+# 比較結果時視為變慢的比例 (新 / 舊 - 1)
+DEFAULT_THRESHOLD = 0.1
+RESULT_FORMAT_VERSION = 1
+
+
+class BenchmarkError(RuntimeError):
+    """效能測試子行程失敗"""
+
+
+def peak_rss_mb():
+    """本行程的記憶體峰值 (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報，macOS 以 bytes 回報
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def current_rss_mb():
+    """本行程目前的常駐記憶體 (MB)，不支援的平台回傳 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+
+
+def directory_size_mb(path, exclude=()):
+    """目錄內檔案的總大小 (MB)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if os.path.abspath(file_path) not in exclude:
+                total += os.path.getsize(file_path)
+    return round(total / (1024 * 1024), 1)
+
+
+def latency_summary(samples):
+    """延遲樣本 (秒) 的分位數與平均 (毫秒)"""
+    ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+    }
+
+
+def result_size(body):
+    """回應的結果筆數：有 total 時使用 total，否則為第一個列表欄位的長度"""
+    if 'total' in body:
+        return body['total']
+    for value in body.values():
+        if isinstance(value, list):
+            return len(value)
+    return None
+
+
+# --- 子行程 (工作目錄為該版本的測試目錄) ---
+
+def import_backend(backend):
+    """首次匯入，回傳耗時 (秒)"""
+    if backend == 'sqlite':
+        import app
+        start = time.perf_counter()
+        app.init_database()
+        app.load_city_district_mapping()
+        if not app.import_csv_to_database(LOCAL_CSV_FILE):
+            raise BenchmarkError("匯入資料庫失敗")
+    else:
+        import app_csv
+        start = time.perf_counter()
+        app_csv.load_regions()
+        if app_csv.load_ltc_data() is None:
+            raise BenchmarkError("載入CSV失敗")
+    return time.perf_counter() - start
+
+
+def start_backend(backend):
+    """
+    依各版本 __main__ 的啟動流程載入既有資料與索引
+
+    回傳 (Flask app, 每次請求前清除快取的函式)
+    """
+    if backend == 'sqlite':
+        import app
+        app.init_database()
+        app.load_city_district_mapping()
+        if app.get_institution_count() == 0:
+            raise BenchmarkError("資料庫沒有資料，請先執行匯入階段")
+        app.load_search_indexes()
+
+        def clear_caches():
+            app.result_cache.invalidate()
+            app.count_cache.clear()
+        return app.app, clear_caches
+
+    import app_csv
+    app_csv.load_regions()
+    data = app_csv.load_ltc_data()
+    if data is None:
+        raise BenchmarkError("載入CSV失敗")
+    app_csv.activate_data(data)
+    return app_csv.app, app_csv.result_cache.invalidate
+
+
+def measure_scenario(client, scenario, clear_caches, repeat, warmup, cached):
+    """重複請求單一情境，回傳延遲分位數與結果筆數"""
+    for _ in range(warmup):
+        client.get(scenario.path, query_string=scenario.params)
+    samples = []
+    for _ in range(repeat):
+        if not cached:
+            clear_caches()
+        start = time.perf_counter()
+        response = client.get(scenario.path, query_string=scenario.params)
+        samples.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise BenchmarkError(f"{scenario.name}: HTTP {response.status_code} {response.get_data(as_text=True)}")
+    result = scenario.to_dict()
+    result.update(latency_summary(samples))
+    result['results'] = result_size(response.get_json())
+    return result
+
+
+def run_phase(phase, backend, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, cached=False):
+    """在目前的工作目錄執行單一階段並回傳量測結果"""
+    started = time.perf_counter()
+    if phase == 'import':
+        seconds = import_backend(backend)
+        return {
+            'seconds': round(seconds, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'disk_mb': directory_size_mb('data', exclude={os.path.abspath(LOCAL_CSV_FILE)}),
+        }
+
+    flask_app, clear_caches = start_backend(backend)
+    # 啟動時間含模組載入 (Flask、pandas 等)
+    startup = {
+        'seconds': round(time.perf_counter() - started, 3),
+        'rss_mb': current_rss_mb(),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    client = flask_app.test_client()
+    scenarios = [
+        measure_scenario(client, scenario, clear_caches, repeat, warmup, cached)
+        for scenario in search_scenarios()
+    ]
+    return {'startup': startup, 'scenarios': scenarios, 'rss_after_mb': current_rss_mb()}
+
+
+def worker_main(phase, backend, result_file, repeat, warmup, cached):
+    """子行程進入點：執行階段並將結果寫入 result_file"""
+    result = run_phase(phase, backend, repeat, warmup, cached)
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    return 0
+
+
+# --- 主行程 ---
+
+def prepare_workdir(csv_file, work_dir, backend):
+    """建立版本的測試目錄：data/abc.csv 與對照表檔案 (已存在時清除重建)"""
+    workdir = os.path.join(work_dir, backend)
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(os.path.join(workdir, os.path.dirname(LOCAL_CSV_FILE)))
+    target = os.path.join(workdir, LOCAL_CSV_FILE)
+    try:
+        os.link(csv_file, target)
+    except OSError:
+        shutil.copyfile(csv_file, target)
+    # 下載模組以修改時間判斷本地檔案是否過期，避免測試中向資料來源發出請求
+    os.utime(target)
+    shutil.copyfile(os.path.join(REPO_ROOT, MAPPING_FILE), os.path.join(workdir, MAPPING_FILE))
+    return workdir
+
+
+def spawn_phase(phase, backend, workdir, repeat, warmup, cached):
+    """以子行程執行單一階段，輸出記錄在測試目錄的 <階段>.log"""
+    result_file = os.path.join(workdir, f'{phase}.json')
+    command = [
+        sys.executable, '-m', 'benchmarks', 'worker', phase, backend, result_file,
+        '--repeat', str(repeat), '--warmup', str(warmup),
+    ]
+    if cached:
+        command.append('--cached')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    log_file = os.path.join(workdir, f'{phase}.log')
+    with open(log_file, 'w', encoding='utf-8') as log:
+        completed = subprocess.run(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if completed.returncode != 0:
+        raise BenchmarkError(f"{backend} {phase} 階段失敗，請查看 {log_file}")
+    with open(result_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def git_commit():
+    """目前的 git commit (不在 git 儲存庫中時回傳 None)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info(seed, repeat, warmup, cached):
+    """執行環境與測試參數"""
+    import sqlite3
+    import pandas as pd
+    return {
+        'format_version': RESULT_FORMAT_VERSION,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version,
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'seed': seed,
+        'repeat': repeat,
+        'warmup': warmup,
+        'cached': cached,
+    }
+
+
+def run_benchmarks(rows_list=DEFAULT_ROWS, backends=BACKENDS, repeat=DEFAULT_REPEAT,
+                   warmup=DEFAULT_WARMUP, seed=DEFAULT_SEED, cached=False, work_dir=None):
+    """
+    對每種資料量與版本執行匯入與查詢測試，回傳 {'meta': ..., 'results': [...]}
+
+    work_dir 省略時使用暫存目錄 (測試完成後刪除)
+    """
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = tempfile.mkdtemp(prefix='ltc-benchmark-')
+        work_dir = temp_dir
+    results = []
+    try:
+        for rows in rows_list:
+            rows_dir = os.path.join(work_dir, str(rows))
+            os.makedirs(rows_dir, exist_ok=True)
+            csv_file = os.path.join(rows_dir, f'synthetic-{seed}.csv')
+            if not os.path.exists(csv_file):
+                start = time.perf_counter()
+                generate_csv(csv_file, rows, seed)
+                print(f"✓ 已產生 {rows:,} 筆合成資料 ({time.perf_counter() - start:.1f} 秒)")
+            for backend in backends:
+                workdir = prepare_workdir(csv_file, rows_dir, backend)
+                print(f"  {backend}: 匯入中...")
+                imported = spawn_phase('import', backend, workdir, repeat, warmup, cached)
+                print(f"  {backend}: 啟動與查詢測試中...")
+                served = spawn_phase('serve', backend, workdir, repeat, warmup, cached)
+                results.append({
+                    'rows': rows,
+                    'backend': backend,
+                    'csv_mb': round(os.path.getsize(csv_file) / (1024 * 1024), 1),
+                    'import': imported,
+                    'startup': served['startup'],
+                    'rss_after_mb': served['rss_after_mb'],
+                    'scenarios': served['scenarios'],
+                })
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return {'meta': environment_info(seed, repeat, warmup, cached), 'results': results}
+
+
+def print_results(report):
+    """以表格輸出測試結果"""
+    for result in report['results']:
+        imported, startup = result['import'], result['startup']
+        print(f"\n=== {result['backend']}，{result['rows']:,} 筆 (CSV {result['csv_mb']} MB) ===")
+        print(f"匯入 {imported['seconds']} 秒 (記憶體峰值 {imported['peak_rss_mb']} MB，"
+              f"磁碟 {imported['disk_mb']} MB)")
+        print(f"啟動 {startup['seconds']} 秒 (常駐記憶體 {startup['rss_mb']} MB，"
+              f"峰值 {startup['peak_rss_mb']} MB)")
+        # 情境名稱為全形字，放在最後一欄避免對齊錯位
+        print(f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'results':>9}  scenario")
+        for scenario in result['scenarios']:
+            print(f"{scenario['p50_ms']:>9.2f}{scenario['p95_ms']:>9.2f}{scenario['p99_ms']:>9.2f}"
+                  f"{scenario['results'] or 0:>9}  {scenario['name']}")
+
+
+def flatten_metrics(report):
+    """將結果展開為 {(筆數, 版本, 指標): 數值}，供不同次測試比較"""
+    metrics = {}
+    for result in report['results']:
+        prefix = (result['rows'], result['backend'])
+        metrics[prefix + ('import_seconds',)] = result['import']['seconds']
+        metrics[prefix + ('import_peak_rss_mb',)] = result['import']['peak_rss_mb']
+        metrics[prefix + ('startup_seconds',)] = result['startup']['seconds']
+        metrics[prefix + ('startup_peak_rss_mb',)] = result['startup']['peak_rss_mb']
+        for scenario in result['scenarios']:
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                metrics[prefix + (f"{scenario['name']} {key}",)] = scenario[key]
+    return metrics
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    比較兩次測試結果，回傳 [(筆數, 版本, 指標, 舊值, 新值, 比例)] 與變慢的項目
+
+    只比較兩邊都有的指標；新值超過舊值 (1 + threshold) 倍者視為變慢
+    """
+    old, new = flatten_metrics(baseline), flatten_metrics(current)
+    rows = []
+    for key in old:
+        if key not in new:
+            continue
+        before, after = old[key], new[key]
+        ratio = after / before if before else None
+        rows.append(key + (before, after, ratio))
+    regressions = [row for row in rows if row[-1] is not None and row[-1] > 1 + threshold]
+    return rows, regressions
+
+
+def print_comparison(rows, regressions, threshold=DEFAULT_THRESHOLD):
+    """以表格輸出比較結果 (變慢的項目以 ⚠ 標示)"""
+    flagged = set(regressions)
+    print(f"{'rows':>10}  {'backend':<8}{'before':>10}{'after':>10}{'ratio':>7}  metric")
+    for row in rows:
+        rows_count, backend, metric, before, after, ratio = row
+        ratio_text = f"{ratio:.2f}" if ratio is not None else '-'
+        mark = ' ⚠' if row in flagged else ''
+        print(f"{rows_count:>10,}  {backend:<8}{before:>10}{after:>10}{ratio_text:>7}  {metric}{mark}")
+    if regressions:
+        print(f"\n⚠ {len(regressions)} 項指標變慢超過 {threshold:.0%}")
+    else:
+        print(f"\n✓ 沒有指標變慢超過 {threshold:.0%}")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+效能測試的查詢情境
+SEARCH_LOGIC_FINAL.md 列出的搜尋場景 (全部機構、只選縣市、縣市+區域、只選服務、
+縣市+服務、全部條件)，以及關鍵字、容錯搜尋、自動完成、附近機構與篩選統計等端點；
+兩個版本以相同的請求測試
+"""
+
+import json
+
+from region_mapping import MAPPING_FILE
+
+
+class Scenario:
+    """單一查詢情境：名稱、API 路徑與查詢參數"""
+
+    def __init__(self, name, path, params=None):
+        self.name = name
+        self.path = path
+        self.params = params or {}
+
+    def to_dict(self):
+        return {'name': self.name, 'path': self.path, 'params': self.params}
+
+
+def district_code(mapping, city_code, district_name):
+    """依區域名稱查對照表中的區域代碼 (找不到時回傳 None)"""
+    districts = mapping.get(city_code, {}).get('districts', {})
+    return next((code for code, name in districts.items() if name == district_name), None)
+
+
+def search_scenarios(mapping_file=MAPPING_FILE):
+    """
+    回傳全部查詢情境
+
+    區域代碼由對照表查出 (對照表缺少該區域時略過對應情境)
+    """
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    sanmin = district_code(mapping, '64000', '三民區')
+    daan = district_code(mapping, '63000', '大安區')
+
+    scenarios = [
+        Scenario('全部機構', '/api/institutions'),
+        Scenario('只選縣市 - 高雄市', '/api/institutions', {'city': '64000'}),
+        Scenario('只選縣市 - 臺北市', '/api/institutions', {'city': '63000'}),
+    ]
+    if sanmin:
+        scenarios.append(Scenario('縣市+區域 - 高雄市三民區', '/api/institutions',
+                                  {'city': '64000', 'district': sanmin}))
+    if daan:
+        scenarios.append(Scenario('縣市+區域 - 臺北市大安區', '/api/institutions',
+                                  {'city': '63000', 'district': daan}))
+    scenarios += [
+        Scenario('只選服務 - 居家服務', '/api/institutions', {'service_type': '居家服務'}),
+        Scenario('只選服務 - 喘息服務', '/api/institutions', {'service_type': '喘息服務'}),
+        Scenario('只選服務 - 專業照護服務', '/api/institutions', {'service_type': '專業照護服務'}),
+        Scenario('縣市+服務 - 高雄市居家服務', '/api/institutions',
+                 {'city': '64000', 'service_type': '居家服務'}),
+        Scenario('縣市+服務 - 高雄市專業照護服務', '/api/institutions',
+                 {'city': '64000', 'service_type': '專業照護服務'}),
+    ]
+    if sanmin:
+        scenarios.append(Scenario('全部條件 - 高雄市三民區居家服務', '/api/institutions',
+                                  {'city': '64000', 'district': sanmin, 'service_type': '居家服務'}))
+    scenarios += [
+        Scenario('關鍵字 - 台北市', '/api/institutions', {'keyword': '台北市'}),
+        Scenario('關鍵字 - 中正路', '/api/institutions', {'keyword': '中正路', 'city': '64000'}),
+        Scenario('容錯搜尋 - 康寧長照', '/api/search', {'q': '康寧長照'}),
+        Scenario('容錯搜尋 - 三民區中山路', '/api/search', {'q': '三民區中山路', 'city': '64000'}),
+        Scenario('自動完成 - 三民', '/api/suggest', {'prefix': '三民'}),
+        Scenario('附近機構 - 臺北車站 3 公里', '/api/institutions/nearby',
+                 {'lat': '25.0478', 'lng': '121.5170', 'radius': '3'}),
+        Scenario('篩選統計 - 高雄市', '/api/facets', {'city': '64000'}),
+    ]
+    return scenarios
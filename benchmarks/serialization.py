@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+結果序列化效能測試
+比較「整個符合集合逐列 iterrows」與「先切頁再整欄轉換」的成本，
+驗證序列化成本只與頁面筆數有關，與符合條件的總筆數無關
+
+用法: python -m benchmarks serialization
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from app_csv import RESULT_COLUMNS, serialize_page
+
+MATCH_COUNTS = [1000, 10000, 100000]
+PAGE_SIZES = [20, 100, 500]
+REPEAT = 20
+
+
+def make_frame(rows):
+    """產生與CSV欄位相同的測試資料 (約 2% 缺經緯度)"""
+    rng = np.random.default_rng(7)
+    data = {column: [f'{column}{i}' for i in range(rows)] for column in RESULT_COLUMNS}
+    longitude = 120 + rng.random(rows) * 2
+    latitude = 22 + rng.random(rows) * 3
+    missing = rng.random(rows) < 0.02
+    longitude[missing] = np.nan
+    latitude[missing] = np.nan
+    data['經度'] = longitude
+    data['緯度'] = latitude
+    return pd.DataFrame(data)
+
+
+def serialize_all_with_iterrows(filtered, limit):
+    """舊做法：整個符合集合逐列轉成字典後才取前 limit 筆"""
+    result = []
+    for _, row in filtered.iterrows():
+        institution = {api: row[column] for column, api in RESULT_COLUMNS.items()}
+        for key in ('longitude', 'latitude'):
+            if pd.isna(institution[key]):
+                institution[key] = None
+        result.append(institution)
+    return result[:limit]
+
+
+def measure(func, *args, repeat=REPEAT):
+    """回傳平均耗時 (毫秒)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def serialization_main():
+    print("=== 結果序列化效能測試 ===")
+    frame = make_frame(max(MATCH_COUNTS))
+
+    print("\n頁面序列化 (先切頁再整欄轉換)，單位 ms")
+    print("符合筆數\t" + "\t".join(f"每頁 {size}" for size in PAGE_SIZES))
+    for matches in MATCH_COUNTS:
+        filtered = frame.iloc[:matches]
+        timings = [measure(serialize_page, filtered.iloc[:size]) for size in PAGE_SIZES]
+        print(f"{matches}\t\t" + "\t".join(f"{t:.2f}" for t in timings))
+
+    print("\n舊做法 (整個符合集合 iterrows 後取前 100 筆)，單位 ms")
+    for matches in MATCH_COUNTS[:2]:
+        filtered = frame.iloc[:matches]
+        elapsed = measure(serialize_all_with_iterrows, filtered, 100, repeat=3)
+        print(f"{matches}\t\t{elapsed:.2f}")
+
+    # 兩種做法的輸出必須一致
+    sample = frame.iloc[:500]
+    if serialize_page(sample) != serialize_all_with_iterrows(sample, 500):
+        print("✗ 新舊做法輸出不一致")
+        return 1
+    print("\n✓ 新舊做法輸出一致")
+    return 0
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+合成測試資料
+產生與 abc.csv 欄位相同的機構資料：縣市 / 鄉鎮區取自對照表並依機構數比例分布，
+地址、名稱與服務項目 (以 ; 分隔) 參考實際資料的寫法與比例，並保留實際資料常見的
+不一致 (臺/台、全形數字、地址省略縣市、區域代碼帶 .0、缺經緯度)；
+同樣的列數與亂數種子產生的檔案內容相同
+
+用法: python -m benchmarks generate 22000 data/abc.csv
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+from csv_importer import CSV_COLUMNS
+from region_mapping import CITY_NAMES, MAPPING_FILE
+
+DEFAULT_SEED = 7
+# 每批產生的列數 (百萬筆以上時限制記憶體用量)
+GENERATE_BATCH_SIZE = 100000
+
+# 各縣市機構數的相對比例 (約略依人口) 與中心座標 (緯度, 經度)
+CITY_PROFILES = {
+    '63000': (2.5, 25.04, 121.56),
+    '64000': (2.7, 22.63, 120.30),
+    '65000': (4.0, 25.01, 121.46),
+    '66000': (2.3, 24.99, 121.30),
+    '67000': (2.8, 24.15, 120.67),
+    '68000': (1.9, 22.99, 120.21),
+    '10002': (0.5, 24.70, 121.74),
+    '10004': (0.6, 24.84, 121.01),
+    '10005': (0.6, 24.56, 120.82),
+    '10007': (1.3, 24.08, 120.54),
+    '10008': (0.5, 23.91, 120.68),
+    '10009': (0.7, 23.71, 120.43),
+    '10010': (0.5, 23.45, 120.26),
+    '10013': (0.8, 22.67, 120.49),
+    '10014': (0.3, 22.76, 121.14),
+    '10015': (0.3, 23.99, 121.60),
+    '10016': (0.1, 23.57, 119.58),
+    '10017': (0.4, 25.13, 121.74),
+    '10018': (0.5, 24.80, 120.97),
+    '10020': (0.3, 23.48, 120.45),
+    '9007': (0.05, 26.16, 119.95),
+    '9020': (0.1, 24.43, 118.32),
+}
+# 機構座標在縣市中心附近的分布範圍 (度)
+COORDINATE_SPREAD = 0.15
+
+# 服務項目與出現比例 (參考實際資料：喘息、居家服務最多，專業照護服務很少)
+SERVICES = {
+    '喘息服務': 29,
+    '專業服務': 20,
+    '居家服務': 15,
+    '巷弄長照站': 12,
+    '輔具服務': 10,
+    '交通接送': 8,
+    '日間照顧': 5,
+    '住宿式服務': 3,
+    '家庭托顧': 2,
+    '專業照護服務': 1.5,
+}
+INSTITUTION_TYPES = ['居家式', '社區式', '機構住宿式', '綜合式']
+NAME_WORDS = ['仁愛', '康寧', '福安', '慈心', '安康', '博愛', '長青', '松柏', '祥和', '永福', '同心', '惠民']
+NAME_KINDS = ['居家長照機構', '日間照顧中心', '長照服務中心', '護理之家', '老人長期照顧中心', '巷弄長照站', '居家護理所']
+ROADS = ['中山路', '中正路', '民生路', '建國路', '自由路', '復興路', '和平路', '光復路', '民族路', '成功路']
+MANAGERS = ['王小明', '陳美玲', '林志豪', '張淑芬', '李建宏', '黃雅婷']
+
+# 實際資料中各種不一致寫法的比例
+VARIANT_RATES = {
+    'tai': 0.1,             # 縣市名稱寫成「台」
+    'fullwidth': 0.05,      # 門牌號碼為全形數字
+    'no_city': 0.05,        # 地址省略縣市名稱
+    'code_suffix': 0.5,     # 區域代碼帶 .0 後綴
+    'no_coordinates': 0.02, # 缺經緯度
+}
+FULLWIDTH_DIGITS = str.maketrans('0123456789', '０１２３４５６７８９')
+
+
+def load_districts(mapping_file=MAPPING_FILE):
+    """讀取對照表，回傳 {縣市代碼: [(區域代碼, 區域名稱)]} (只含有區域資料的縣市)"""
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    return {
+        code: sorted(city['districts'].items())
+        for code, city in mapping.items() if city.get('districts') and code in CITY_PROFILES
+    }
+
+
+def _institution_names(rng, rows, city_names, district_names):
+    """依實際資料常見的命名方式組成機構名稱 (法人、○○市私立、協會附設與無前綴)"""
+    words = rng.choice(NAME_WORDS, size=(rows, 2))
+    kinds = rng.choice(NAME_KINDS, size=rows)
+    styles = rng.random(rows)
+    names = []
+    for city, district, (word, other), kind, style in zip(city_names, district_names, words, kinds, styles):
+        stem = district[:-1] if len(district) > 2 else district
+        core = f"{stem}{word}{kind}"
+        if style < 0.25:
+            core = f"財團法人{core}"
+        elif style < 0.45:
+            core = f"{city}私立{core}"
+        elif style < 0.55:
+            core = f"社團法人{city}{other}協會附設{core}"
+        names.append(core)
+    return names
+
+
+def _service_lists(rng, rows):
+    """每列 1~3 個不重複的服務項目，依 SERVICES 的比例抽樣 (以 ; 分隔)"""
+    names = np.array(list(SERVICES))
+    weights = np.array(list(SERVICES.values()), dtype=float)
+    # Gumbel top-k：加權不重複抽樣可整批以排序完成
+    keys = np.log(weights) - np.log(-np.log(rng.random((rows, len(names)))))
+    order = np.argsort(-keys, axis=1)
+    counts = rng.integers(1, 4, size=rows)
+    return [';'.join(names[row[:count]]) for row, count in zip(order, counts.tolist())]
+
+
+def generate_rows(rows, seed=DEFAULT_SEED, districts=None, start=0):
+    """
+    產生 rows 筆資料列 (欄位順序同 CSV_COLUMNS)，start 為第一筆的序號
+
+    亂數以 (seed, start) 初始化，分批產生的結果與批次大小以外的條件無關
+    """
+    districts = districts or load_districts()
+    rng = np.random.default_rng([seed, start])
+    cities = list(districts)
+    weights = np.array([CITY_PROFILES[code][0] for code in cities])
+    sizes = np.array([len(districts[code]) for code in cities])
+
+    city_index = rng.choice(len(cities), size=rows, p=weights / weights.sum())
+    district_index = (rng.random(rows) * sizes[city_index]).astype(np.int64)
+    city_codes = [cities[i] for i in city_index.tolist()]
+    picked = [districts[code][i] for code, i in zip(city_codes, district_index.tolist())]
+    district_codes = [code for code, _ in picked]
+    district_names = [name for _, name in picked]
+    city_names = [CITY_NAMES.get(code, '') for code in city_codes]
+
+    # 地址：縣市 (部分寫成台、部分省略) + 區 + 路名 + 門牌 (部分為全形數字)
+    variants = {name: rng.random(rows) < rate for name, rate in VARIANT_RATES.items()}
+    roads = rng.choice(ROADS, size=rows)
+    house_numbers = rng.integers(1, 1000, size=rows).astype(str)
+    addresses = []
+    for i, (city, district, road, number) in enumerate(zip(city_names, district_names, roads, house_numbers)):
+        if variants['fullwidth'][i]:
+            number = number.translate(FULLWIDTH_DIGITS)
+        if variants['no_city'][i]:
+            city = ''
+        elif variants['tai'][i]:
+            city = city.replace('臺', '台')
+        addresses.append(f"{city}{district}{road}{number}號")
+
+    centers = np.array([CITY_PROFILES[code][1:] for code in cities])[city_index]
+    coordinates = np.round(centers + rng.normal(0, COORDINATE_SPREAD, size=(rows, 2)), 6).astype(str)
+    coordinates[variants['no_coordinates']] = ''
+
+    numbers = np.arange(start, start + rows)
+    codes = [f"{1000000000 + number * 7 % 9000000000:010d}" for number in numbers.tolist()]
+    raw_districts = [
+        f"{code}.0" if suffix else code
+        for code, suffix in zip(district_codes, variants['code_suffix'])
+    ]
+    names = _institution_names(rng, rows, city_names, district_names)
+    services = _service_lists(rng, rows)
+    types = rng.choice(INSTITUTION_TYPES, size=rows)
+    grades = rng.choice(['A', 'B', 'C'], size=rows)
+    phones = [f"0{area}-{line}" for area, line in zip(rng.integers(2, 9, size=rows),
+                                                      rng.integers(1000000, 9999999, size=rows))]
+    managers = rng.choice(MANAGERS, size=rows)
+    start_years = rng.integers(2016, 2025, size=rows)
+    start_months = rng.integers(1, 13, size=rows)
+    end_years = rng.integers(2026, 2030, size=rows)
+    changed_months = rng.integers(1, 13, size=rows)
+    changed_days = rng.integers(1, 29, size=rows)
+
+    return [
+        [
+            names[i], codes[i], types[i], city_codes[i], raw_districts[i], addresses[i],
+            coordinates[i, 1], coordinates[i, 0], grades[i], services[i], city_codes[i],
+            district_codes[i], phones[i], f"ltc{numbers[i]}@example.org.tw", managers[i],
+            f"{start_years[i]}/{start_months[i]:02d}/01", f"{end_years[i]}/12/31",
+            f"2025/{changed_months[i]:02d}/{changed_days[i]:02d} 10:00:00",
+        ]
+        for i in range(rows)
+    ]
+
+
+def generate_csv(path, rows, seed=DEFAULT_SEED, mapping_file=MAPPING_FILE):
+    """
+    產生合成的 abc.csv (UTF-8 含 BOM、每欄加引號，與資料來源相同)
+
+    分批產生與寫入，記憶體用量與總列數無關；回傳寫入的列數
+    """
+    districts = load_districts(mapping_file)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(CSV_COLUMNS)
+        for start in range(0, rows, GENERATE_BATCH_SIZE):
+            count = min(GENERATE_BATCH_SIZE, rows - start)
+            writer.writerows(generate_rows(count, seed, districts, start))
+    return rows
+
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+欄式 (columnar) 回應格式
+以欄位名稱列表加上每欄一個陣列回傳機構資料，不必在每筆資料重複 14 個欄位名稱；
+重複值多的欄位 (機構種類、縣市、鄉鎮區等) 另以字典編碼，只傳一次實際值與每列的索引
+"""
+
+# 回應格式：rows 為原本的逐筆字典列表，columnar 為欄式格式
+RESULT_FORMATS = ('rows', 'columnar')
+DEFAULT_RESULT_FORMAT = 'rows'
+# 嘗試字典編碼的欄位
+DICTIONARY_FIELDS = ('type', 'city', 'district', 'service_type', 'contract_start', 'contract_end')
+# 不重複值數量不超過筆數的此比例時才採用字典編碼 (否則索引陣列反而讓資料變大)
+DICTIONARY_MAX_RATIO = 0.5
+
+
+class ResultFormatError(ValueError):
+    """回應格式參數錯誤"""
+
+
+def parse_result_format(value):
+    """解析 format 參數"""
+    fmt = (value or DEFAULT_RESULT_FORMAT).lower()
+    if fmt not in RESULT_FORMATS:
+        raise ResultFormatError(f"format 必須是 {' 或 '.join(RESULT_FORMATS)}: {value}")
+    return fmt
+
+
+def dictionary_encode(values):
+    """
+    字典編碼一欄資料，回傳 (字典, 索引列表)
+
+    不重複值過多、編碼後不會比較小時回傳 (None, values)
+    """
+    dictionary = {}
+    indices = [dictionary.setdefault(value, len(dictionary)) for value in values]
+    if len(dictionary) > len(values) * DICTIONARY_MAX_RATIO:
+        return None, values
+    return list(dictionary), indices
+
+
+def encode_columns(columns):
+    """
+    將 {欄位: 值列表} 轉為欄式格式
+
+    回傳 {'columns': 欄位名稱, 'count': 筆數, 'values': 每欄的值陣列,
+    'dictionaries': {欄位: 字典}}；出現在 dictionaries 中的欄位，
+    values 中存放的是字典索引，實際值為 dictionaries[欄位][索引]。
+    """
+    names = list(columns)
+    count = len(columns[names[0]]) if names else 0
+    values = []
+    dictionaries = {}
+    for name in names:
+        column = columns[name]
+        if name in DICTIONARY_FIELDS:
+            dictionary, column = dictionary_encode(column)
+            if dictionary is not None:
+                dictionaries[name] = dictionary
+        values.append(column)
+    return {'columns': names, 'count': count, 'values': values, 'dictionaries': dictionaries}
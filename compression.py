@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+回應壓縮
+依 Accept-Encoding 協商 brotli 或 gzip 壓縮 API 回應；
+brotli 為選用套件，未安裝時只提供 gzip。
+串流回應 (匯出) 與檔案回應不經過這裡，原樣送出
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # 未安裝 brotli 時只使用 gzip
+    brotli = None
+
+from flask import request
+
+# 可壓縮的內容類型
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/csv', 'application/x-ndjson'}
+# 小於此大小的回應不壓縮 (壓縮後節省有限，反而多花 CPU)
+MIN_COMPRESS_BYTES = 1024
+# 動態回應使用的壓縮等級 (兼顧壓縮率與 CPU 時間)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def supported_encodings():
+    """伺服器支援的壓縮方式 (優先順序由高到低)"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encodings=None):
+    """依請求的 Accept-Encoding 選擇壓縮方式，無可用方式時回傳 None"""
+    if accept_encodings is None:
+        accept_encodings = request.accept_encodings
+    return accept_encodings.best_match(supported_encodings())
+
+
+def compress(body, encoding):
+    """以指定方式壓縮內容"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"不支援的壓縮方式: {encoding}")
+
+
+def is_compressible(response):
+    """回應是否適合壓縮 (200、非串流、尚未壓縮、可壓縮的類型且夠大)"""
+    return (
+        response.status_code == 200
+        and not response.is_streamed
+        and not response.direct_passthrough
+        and 'Content-Encoding' not in response.headers
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+        and (response.content_length or 0) >= MIN_COMPRESS_BYTES
+    )
+
+
+def apply_encoding(response, body, encoding):
+    """
+    以已壓縮的內容取代回應內容
+
+    不同編碼的內容不同，強 ETag 也必須不同：加上編碼後綴
+    (快取端以 If-None-Match 帶回的是加上後綴的 ETag)
+    """
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+
+
+def compress_response(response):
+    """after_request 處理：依 Accept-Encoding 壓縮回應"""
+    if not is_compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is not None:
+        apply_encoding(response, compress(response.get_data(), encoding), encoding)
+    return response
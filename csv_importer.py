@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+"""
+CSV 串流匯入引擎
+分塊讀取CSV，以向量化欄位運算轉換資料，並用 executemany 批次寫入 SQLite
+"""
+
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from district_resolver import build_district_patterns, resolve_dataframe
+from facets import adjust_facets, create_facets_table, rebuild_facets
+from geo import add_geo, create_geo_table, rebuild_geo, remove_geo
+from geo_grid import adjust_grid, create_grid_table, rebuild_grid
+from region_mapping import (
+    CITY_NAMES, MAPPING_COLUMNS, MappingBuilder, counts_to_mapping, create_region_mapping_table,
+    load_region_mapping, save_region_mapping
+)
+from service_types import ServiceRegistry, compute_service_masks
+from text_normalize import normalize_addresses, normalize_series
+
+# 每個分塊的列數 (兼顧記憶體用量與批次寫入效率)
+DEFAULT_CHUNK_SIZE = 5000
+
+# CSV 欄位 -> 資料庫欄位 (順序即為 INSERT 的欄位順序)
+COLUMN_MAPPING = [
+    ('機構名稱', 'name'),
+    ('機構代碼', 'code'),
+    ('機構種類', 'type'),
+    ('縣市', 'city_code'),
+    ('區', 'district_code'),
+    ('地址全址', 'address'),
+    ('經度', 'longitude'),
+    ('緯度', 'latitude'),
+    ('O_ABC', 'o_abc'),
+    ('特約服務項目', 'service_type'),
+    ('特約縣市', 'contract_city'),
+    ('特約區域', 'contract_district'),
+    ('機構電話', 'phone'),
+    ('電子郵件', 'email'),
+    ('機構負責人姓名', 'manager'),
+    ('特約起日', 'contract_start'),
+    ('特約迄日', 'contract_end'),
+    ('最後異動時間', 'last_updated'),
+]
+
+CSV_COLUMNS = [csv_col for csv_col, _ in COLUMN_MAPPING]
+DB_COLUMNS = [db_col for _, db_col in COLUMN_MAPPING]
+
+# 經緯度以外的欄位一律以字串讀入，避免各分塊推斷出不同型別
+NUMERIC_COLUMNS = ['經度', '緯度']
+CSV_DTYPES = {col: str for col in CSV_COLUMNS if col not in NUMERIC_COLUMNS}
+
+# 資料庫結構版本 (存於 PRAGMA user_version)，結構變更時遞增，舊版資料庫需重新匯入
+SCHEMA_VERSION = 9
+
+SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS institutions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        code TEXT,
+        type TEXT,
+        city_code TEXT,
+        district_code TEXT,
+        address TEXT,
+        longitude REAL,
+        latitude REAL,
+        o_abc TEXT,
+        service_type TEXT,
+        contract_city TEXT,
+        contract_district TEXT,
+        phone TEXT,
+        email TEXT,
+        manager TEXT,
+        contract_start TEXT,
+        contract_end TEXT,
+        last_updated TEXT,
+        service_mask INTEGER NOT NULL DEFAULT 0,
+        resolved_district_code TEXT,
+        name_norm TEXT,
+        address_norm TEXT,
+        district_norm TEXT,
+        row_hash INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# 機構 <-> 服務項目對照表 (以服務名稱為主鍵前綴，服務篩選為索引等值查詢)
+SERVICES_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS institution_services (
+        service TEXT NOT NULL,
+        institution_id INTEGER NOT NULL,
+        PRIMARY KEY (service, institution_id)
+    ) WITHOUT ROWID
+'''
+
+# 服務項目位元配置 (institutions.service_mask 的第 bit 位元代表該服務)
+SERVICE_TYPES_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS service_types (
+        bit INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+'''
+
+# 索引定義 (名稱, 建立語法)
+# 地址與服務項目都是子字串比對，一般 B-tree 索引用不上，改由 FTS5 三連字索引處理
+# 縣市與區域篩選共用 (city_code, resolved_district_code, name) 複合索引，
+# 兩者皆為等值條件時可直接依名稱順序取出，不需額外排序
+INDEX_DEFINITIONS = [
+    ('idx_city_district', 'CREATE INDEX IF NOT EXISTS idx_city_district '
+                          'ON institutions(city_code, resolved_district_code, name)'),
+    ('idx_resolved_district', 'CREATE INDEX IF NOT EXISTS idx_resolved_district '
+                              'ON institutions(resolved_district_code)'),
+    ('idx_name', 'CREATE INDEX IF NOT EXISTS idx_name ON institutions(name)'),
+    ('idx_code', 'CREATE INDEX IF NOT EXISTS idx_code ON institutions(code)'),
+]
+
+# 全文檢索表 (trigram 斷詞，支援任意位置的子字串比對；需 SQLite 3.34+)
+# 名稱與地址以正規化欄位建立索引 (臺/台、全形數字、省略縣市都已統一)
+FTS_TABLE = 'institutions_fts'
+FTS_COLUMNS = ['name_norm', 'address_norm', 'service_type']
+FTS_SCHEMA_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+        {columns},
+        content='institutions',
+        content_rowid='id',
+        tokenize='trigram'
+    )
+'''.format(table=FTS_TABLE, columns=', '.join(FTS_COLUMNS))
+
+INSERT_COLUMNS = ['id'] + DB_COLUMNS + [
+    'service_mask', 'resolved_district_code', 'name_norm', 'address_norm', 'district_norm', 'row_hash'
+]
+INSERT_SQL = 'INSERT INTO institutions ({}) VALUES ({})'.format(
+    ', '.join(INSERT_COLUMNS), ', '.join('?' * len(INSERT_COLUMNS))
+)
+INSERT_SERVICE_SQL = 'INSERT INTO institution_services (service, institution_id) VALUES (?, ?)'
+
+
+def create_schema(conn):
+    """建立機構主表、服務對照表、統計表、地圖網格表、區域對照表、索引、全文檢索表與空間索引"""
+    is_new = not table_exists(conn, 'institutions')
+    conn.execute(SCHEMA_SQL)
+    conn.execute(SERVICES_SCHEMA_SQL)
+    conn.execute(SERVICE_TYPES_SCHEMA_SQL)
+    create_facets_table(conn)
+    create_grid_table(conn)
+    create_region_mapping_table(conn)
+    create_indexes(conn)
+    create_fts_table(conn)
+    create_geo_table(conn)
+    # 只替新建立的資料庫標記版本，既有的舊結構維持原版本號以便偵測
+    if is_new:
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+def table_exists(conn, name):
+    """檢查資料表 (含虛擬表) 是否存在"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def schema_is_current(conn):
+    """檢查資料庫結構是否為目前版本"""
+    return conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+
+def load_service_registry(conn):
+    """從資料庫讀取服務項目位元配置 (尚無配置時使用預設的已知服務)"""
+    names = [row[0] for row in conn.execute('SELECT name FROM service_types ORDER BY bit')]
+    return ServiceRegistry(names) if names else ServiceRegistry()
+
+
+def save_service_registry(conn, registry):
+    """寫入服務項目位元配置"""
+    conn.execute('DELETE FROM service_types')
+    conn.executemany(
+        'INSERT INTO service_types (bit, name) VALUES (?, ?)',
+        [(bit, name) for name, bit in registry.items()]
+    )
+
+
+def create_fts_table(conn):
+    """建立 FTS5 三連字全文檢索表，SQLite 不支援時回傳 False"""
+    try:
+        conn.execute(FTS_SCHEMA_SQL)
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"⚠ 無法建立全文檢索表，子字串查詢將使用 LIKE: {e}")
+        return False
+
+
+def has_fts_table(conn):
+    """檢查資料庫中是否已有全文檢索表"""
+    return table_exists(conn, FTS_TABLE)
+
+
+def rebuild_fts(conn):
+    """依 institutions 內容重建全文檢索表"""
+    if has_fts_table(conn):
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def create_indexes(conn):
+    """建立查詢用索引"""
+    for _, sql in INDEX_DEFINITIONS:
+        conn.execute(sql)
+
+
+def drop_indexes(conn):
+    """移除查詢用索引 (大量寫入前移除，寫入後一次重建較快)"""
+    for name, _ in INDEX_DEFINITIONS:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def tune_connection_for_import(conn, durable=True):
+    """
+    調整匯入用連線的 PRAGMA 設定
+
+    durable=False 用於尚未對外提供的新版本檔：關閉日誌與同步寫入，
+    失敗時整個檔案直接丟棄即可。
+    """
+    if durable:
+        conn.execute('PRAGMA synchronous = NORMAL')
+    else:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -65536')  # 64MB
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+
+def iter_csv_chunks(csv_file, chunksize=DEFAULT_CHUNK_SIZE):
+    """分塊讀取CSV，每次只保留一個分塊在記憶體中 (下載檔保留原始位元組，可能帶有 BOM)"""
+    return pd.read_csv(csv_file, dtype=CSV_DTYPES, chunksize=chunksize, encoding='utf-8-sig')
+
+
+def clean_chunk(df):
+    """資料清理：去除缺少必要欄位的資料列並正規化代碼欄位"""
+    df = df.dropna(subset=['機構名稱', '縣市', '區'])
+    df = df.assign(**{
+        '縣市': df['縣市'].str.strip(),
+        # 區域代碼去除 .0 後綴
+        '區': df['區'].str.strip().str.replace(r'\.0$', '', regex=True),
+    })
+    return df
+
+
+def scan_region_mapping(csv_file, chunksize=DEFAULT_CHUNK_SIZE):
+    """只讀取縣市、區域與地址欄位，推導區域代碼的多數名稱表 (完整匯入的第一階段)"""
+    builder = MappingBuilder()
+    for chunk in pd.read_csv(csv_file, usecols=['機構名稱'] + MAPPING_COLUMNS, dtype=str,
+                             chunksize=chunksize, encoding='utf-8-sig'):
+        builder.add(clean_chunk(chunk))
+    return builder.counts()
+
+
+class DistrictRules:
+    """
+    匯入時解析區域用的規則：地址解析正則表達式與區域代碼 -> 名稱
+
+    以資料推導的對照表建立；推導不出任何區域時 (例如地址都沒有縣市名稱)
+    才改用呼叫端提供的對照表
+    """
+
+    def __init__(self, counts=None, fallback_mapping=None):
+        mapping = (counts_to_mapping(counts) if counts is not None else {}) or fallback_mapping or {}
+        self.mapping = mapping
+        self.patterns = build_district_patterns(mapping)
+        self.names = {
+            code: name
+            for city in mapping.values() for code, name in city.get('districts', {}).items()
+        }
+
+
+def compute_row_hashes(df):
+    """每列CSV欄位內容的 64 位元雜湊 (增量匯入時用來偵測資料是否異動)"""
+    hashes = pd.util.hash_pandas_object(df.reindex(columns=CSV_COLUMNS), index=False)
+    return hashes.to_numpy().view(np.int64)
+
+
+def chunk_to_rows(df, first_id, registry, rules=None, ids=None):
+    """
+    將分塊轉為 INSERT 用的 tuple 列表 (NaN 以向量化方式轉為 None)
+
+    機構編號由 first_id 起依序配置 (或直接使用 ids 指定的編號)，
+    同時拆出服務對照列、解析標準區域代碼、計算名稱 / 地址 / 區域的正規化欄位
+    並計算資料列雜湊。回傳 (機構資料列, 服務對照列)。
+    """
+    df = df.reset_index(drop=True)
+    if ids is None:
+        ids = np.arange(first_id, first_id + len(df), dtype=np.int64)
+    rules = rules or DistrictRules()
+    masks, services = compute_service_masks(df['特約服務項目'], registry)
+    resolved = resolve_dataframe(df, rules.patterns)
+    
+    projected = df.reindex(columns=CSV_COLUMNS).astype(object)
+    projected = projected.where(projected.notna(), None)
+    projected.insert(0, 'id', ids.tolist())
+    projected['service_mask'] = masks.to_numpy()
+    projected['resolved_district_code'] = resolved.to_numpy()
+    projected['name_norm'] = normalize_series(df['機構名稱']).to_numpy()
+    projected['address_norm'] = normalize_addresses(
+        df['地址全址'], df['縣市'].map(CITY_NAMES)
+    ).to_numpy()
+    projected['district_norm'] = normalize_series(resolved.map(rules.names)).to_numpy()
+    projected['row_hash'] = compute_row_hashes(df).tolist()
+    rows = list(projected.itertuples(index=False, name=None))
+    
+    service_rows = list(zip(services.tolist(), ids[services.index].tolist()))
+    return rows, service_rows
+
+
+def _peak_rss_mb():
+    """取得行程的常駐記憶體峰值 (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 2)
+
+
+def bulk_import(conn, csv_file, chunksize=DEFAULT_CHUNK_SIZE, replace=True,
+                durable=True, trace_memory=False, district_mapping=None):
+    """
+    以分塊 + executemany 將CSV匯入 institutions 表
+
+    匯入前先由資料推導縣市區域對照表 (mapping 階段)，用來解析每筆機構的標準區域代碼，
+    並與資料寫入同一個交易；推導不出任何區域時改用 district_mapping。
+
+    整個匯入在單一交易內完成；索引於寫入前移除、寫入後重建，全文檢索表、
+    篩選條件統計表、空間索引與地圖網格表同步重建。
+    回傳匯入統計 (筆數、耗時、每秒筆數、記憶體峰值與各階段耗時 phases)。
+    trace_memory=True 時以 tracemalloc 量測匯入本身的配置峰值 (較慢，供效能分析用)。
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    row_count = 0
+    chunk_count = 0
+    parse_seconds = 0.0
+
+    try:
+        mapping_counts = scan_region_mapping(csv_file, chunksize)
+        mapping_seconds = time.perf_counter() - start_time
+        
+        tune_connection_for_import(conn, durable)
+        conn.execute('BEGIN')
+        if replace:
+            conn.execute('DELETE FROM institutions')
+            conn.execute('DELETE FROM institution_services')
+            registry = ServiceRegistry()
+        else:
+            registry = load_service_registry(conn)
+        drop_indexes(conn)
+        rules = DistrictRules(mapping_counts, district_mapping)
+        next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM institutions').fetchone()[0]
+
+        # 讀取與轉換 (parse) 和寫入 (import) 交錯進行，分別累計耗時
+        mark = time.perf_counter()
+        for chunk in iter_csv_chunks(csv_file, chunksize):
+            rows, service_rows = chunk_to_rows(
+                clean_chunk(chunk), next_id, registry, rules
+            )
+            parsed = time.perf_counter()
+            parse_seconds += parsed - mark
+            conn.executemany(INSERT_SQL, rows)
+            conn.executemany(INSERT_SERVICE_SQL, service_rows)
+            next_id += len(rows)
+            row_count += len(rows)
+            chunk_count += 1
+            mark = time.perf_counter()
+
+        index_start = time.perf_counter()
+        save_service_registry(conn, registry)
+        save_region_mapping(conn, mapping_counts)
+        create_indexes(conn)
+        rebuild_fts(conn)
+        rebuild_facets(conn)
+        rebuild_geo(conn)
+        rebuild_grid(conn)
+        conn.commit()
+        index_seconds = time.perf_counter() - index_start
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if trace_memory:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    elapsed = time.perf_counter() - start_time
+    stats = {
+        'rows': row_count,
+        'chunks': chunk_count,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(row_count / elapsed) if elapsed > 0 else None,
+        'peak_memory_mb': _peak_rss_mb(),
+        'districts': len(mapping_counts),
+        'phases': _phase_seconds(elapsed, parse_seconds, index_seconds, mapping_seconds),
+    }
+    if trace_memory:
+        stats['traced_peak_mb'] = round(traced_peak / (1024 * 1024), 2)
+    return stats
+
+
+def _phase_seconds(elapsed, parse_seconds, index_seconds, mapping_seconds=0.0):
+    """
+    各階段耗時：mapping 為推導區域對照表，parse 為讀取與轉換CSV，
+    index 為索引、全文檢索與統計表，其餘計入 import
+    """
+    return {
+        'mapping': round(mapping_seconds, 3),
+        'parse': round(parse_seconds, 3),
+        'import': round(max(elapsed - mapping_seconds - parse_seconds - index_seconds, 0), 3),
+        'index': round(index_seconds, 3),
+    }
+
+
+def reresolve_districts(conn, rules, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    以新的區域規則重新解析全部機構的標準區域代碼與正規化區域名稱，回傳變動筆數
+
+    對照表改變時，內容未異動的機構也可能解析出不同的區域；只更新結果不同的資料列
+    (應在匯入的同一交易中呼叫，呼叫端需另外重建統計表)
+    """
+    cursor = conn.execute(
+        'SELECT id, city_code, district_code, address, resolved_district_code, district_norm '
+        'FROM institutions ORDER BY id'
+    )
+    updates = []
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        df = pd.DataFrame(
+            [tuple(row) for row in rows],
+            columns=['id', '縣市', '區', '地址全址', 'resolved_district_code', 'district_norm']
+        )
+        resolved = resolve_dataframe(df, rules.patterns).astype(object)
+        resolved = resolved.where(resolved.notna(), None)
+        district_norm = normalize_series(resolved.map(rules.names))
+        differs = (
+            (resolved.fillna('') != df['resolved_district_code'].fillna(''))
+            | (district_norm != df['district_norm'].fillna(''))
+        )
+        updates.extend(zip(
+            resolved[differs].tolist(), district_norm[differs].tolist(), df['id'][differs].tolist()
+        ))
+    # 讀取完畢後才寫入，避免在同一張表的查詢游標未結束時更新
+    conn.executemany(
+        'UPDATE institutions SET resolved_district_code = ?, district_norm = ? WHERE id = ?', updates
+    )
+    return len(updates)
+
+
+def _delta_keys(codes, hashes):
+    """增量比對用的鍵值 (機構代碼 + 資料列雜湊)"""
+    return list(zip(codes.fillna('').astype(str).tolist(), hashes.tolist()))
+
+
+def _fill_id_table(conn, table, ids):
+    conn.execute(f'DELETE FROM {table}')
+    conn.executemany(f'INSERT INTO {table} (id) VALUES (?)', [(int(i),) for i in ids])
+
+
+def delta_import(conn, csv_file, chunksize=DEFAULT_CHUNK_SIZE, district_mapping=None):
+    """
+    增量匯入：與資料庫現有資料比對，只寫入新增、異動與刪除的機構
+
+    以機構代碼為鍵、整列CSV內容的雜湊 (含最後異動時間) 判斷是否異動；
+    同一機構代碼只有一筆異動時保留原編號就地更新，其餘視為新增或刪除。
+    全部變更在單一交易內完成，全文檢索表、統計表、空間索引與地圖網格表只調整受影響的機構；
+    比對時同時由完整資料推導區域對照表，用來解析新增與異動機構的區域並整表取代；
+    對照表與上次匯入不同時，未異動的機構也以新對照表重新解析區域並重建統計表，
+    結果與完整匯入相同。
+    回傳匯入統計 (含 inserted / updated / deleted / unchanged 筆數，
+    以及因對照表改變而重新解析區域的 reresolved 筆數)。
+    """
+    start_time = time.perf_counter()
+    row_count = 0
+    index_seconds = 0.0
+    mapping_seconds = 0.0
+
+    try:
+        tune_connection_for_import(conn, durable=True)
+        conn.execute('BEGIN')
+        registry = load_service_registry(conn)
+        mapping_builder = MappingBuilder()
+        # 上次匯入解析區域時使用的對照表 (推導不出時與 DistrictRules 同樣改用 district_mapping)
+        previous_mapping = load_region_mapping(conn) or district_mapping or {}
+
+        existing = pd.DataFrame(
+            conn.execute('SELECT id, code, row_hash FROM institutions').fetchall(),
+            columns=['id', 'code', 'row_hash']
+        )
+        existing_keys = _delta_keys(existing['code'], existing['row_hash'].to_numpy())
+        existing_counts = {}
+        for key in existing_keys:
+            existing_counts[key] = existing_counts.get(key, 0) + 1
+
+        # 逐塊比對：同一鍵值出現的次數未超過資料庫中的筆數者視為未變動，其餘保留待寫入
+        # (逐列的字典查詢為 O(1)，比每塊都建立 pandas 對照表快得多)
+        seen = {}
+        pending = []
+        for chunk in iter_csv_chunks(csv_file, chunksize):
+            chunk = clean_chunk(chunk)
+            mapping_start = time.perf_counter()
+            mapping_builder.add(chunk)
+            mapping_seconds += time.perf_counter() - mapping_start
+            keys = _delta_keys(chunk['機構代碼'], compute_row_hashes(chunk))
+            changed = np.empty(len(keys), dtype=bool)
+            for position, key in enumerate(keys):
+                occurrence = seen.get(key, 0)
+                seen[key] = occurrence + 1
+                changed[position] = occurrence >= existing_counts.get(key, 0)
+            pending.append(chunk[changed])
+            row_count += len(chunk)
+
+        # 資料庫中多出來 (新CSV已沒有或內容已變動) 的資料列
+        removed_mask = np.empty(len(existing_keys), dtype=bool)
+        matched = {}
+        for position, key in enumerate(existing_keys):
+            occurrence = matched.get(key, 0)
+            matched[key] = occurrence + 1
+            removed_mask[position] = occurrence >= min(seen.get(key, 0), existing_counts[key])
+        removed = existing[removed_mask]
+        added = pd.concat(pending) if pending else pd.DataFrame(columns=CSV_COLUMNS)
+
+        # 同一機構代碼恰好一筆刪除、一筆新增時視為更新，沿用原編號
+        added_codes = added['機構代碼'].fillna('')
+        removed_codes = removed['code'].fillna('')
+        single_added = added_codes[~added_codes.duplicated(keep=False) & (added_codes != '')]
+        single_removed = removed_codes[~removed_codes.duplicated(keep=False) & (removed_codes != '')]
+        updated_codes = set(single_added) & set(single_removed)
+        old_ids = dict(zip(removed_codes, removed['id']))
+
+        next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM institutions').fetchone()[0]
+        is_update = added_codes.isin(updated_codes).to_numpy()
+        ids = np.empty(len(added), dtype=np.int64)
+        ids[is_update] = [old_ids[code] for code in added_codes[is_update]]
+        ids[~is_update] = np.arange(next_id, next_id + int((~is_update).sum()), dtype=np.int64)
+        mapping_start = time.perf_counter()
+        mapping_counts = mapping_builder.counts()
+        rules = DistrictRules(mapping_counts, district_mapping)
+        mapping_seconds += time.perf_counter() - mapping_start
+        # 到此為止 (讀取、雜湊與比對) 計入 parse 階段
+        parse_seconds = time.perf_counter() - start_time - mapping_seconds
+
+        # 先扣除受影響機構的舊資料 (統計表、全文檢索、服務對照)，再寫入新資料
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS delta_ids (id INTEGER PRIMARY KEY)')
+        _fill_id_table(conn, 'temp.delta_ids', removed['id'])
+        index_start = time.perf_counter()
+        adjust_facets(conn, 'temp.delta_ids', -1)
+        adjust_grid(conn, 'temp.delta_ids', -1)
+        remove_geo(conn, 'temp.delta_ids')
+        if has_fts_table(conn):
+            conn.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)}) "
+                f"SELECT 'delete', id, {', '.join(FTS_COLUMNS)} FROM institutions "
+                'WHERE id IN (SELECT id FROM temp.delta_ids)'
+            )
+        index_seconds += time.perf_counter() - index_start
+        conn.execute('DELETE FROM institution_services WHERE institution_id IN (SELECT id FROM temp.delta_ids)')
+        conn.execute('DELETE FROM institutions WHERE id IN (SELECT id FROM temp.delta_ids)')
+
+        if len(added):
+            rows, service_rows = chunk_to_rows(added, next_id, registry, rules, ids=ids)
+            conn.executemany(INSERT_SQL, rows)
+            conn.executemany(INSERT_SERVICE_SQL, service_rows)
+
+        _fill_id_table(conn, 'temp.delta_ids', ids)
+        index_start = time.perf_counter()
+        if has_fts_table(conn):
+            conn.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+                f"SELECT id, {', '.join(FTS_COLUMNS)} FROM institutions "
+                'WHERE id IN (SELECT id FROM temp.delta_ids)'
+            )
+        adjust_facets(conn, 'temp.delta_ids', 1)
+        add_geo(conn, 'temp.delta_ids')
+        adjust_grid(conn, 'temp.delta_ids', 1)
+        reresolved = 0
+        if rules.mapping != previous_mapping:
+            # 對照表改變：全部機構以新對照表重新解析，統計表整個重建
+            reresolved = reresolve_districts(conn, rules, chunksize)
+            if reresolved:
+                rebuild_facets(conn)
+        index_seconds += time.perf_counter() - index_start
+        conn.execute('DELETE FROM temp.delta_ids')
+        save_service_registry(conn, registry)
+        save_region_mapping(conn, mapping_counts)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start_time
+    updated = int(is_update.sum())
+    return {
+        'rows': row_count,
+        'inserted': len(added) - updated,
+        'updated': updated,
+        'deleted': len(removed) - updated,
+        'unchanged': row_count - len(added),
+        'reresolved': reresolved,
+        'seconds': round(elapsed, 3),
+        'peak_memory_mb': _peak_rss_mb(),
+        'districts': len(mapping_counts),
+        'phases': _phase_seconds(elapsed, parse_seconds, index_seconds, mapping_seconds),
+    }
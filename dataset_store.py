@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+資料集版本管理
+每次更新都在獨立的 institutions.<版本>.db 建立完整資料集，
+建好索引後再以指標檔原子切換，讀取端不會看到空表或半成品
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from csv_importer import create_schema, bulk_import, delta_import, schema_is_current, table_exists
+
+DATA_DIR = 'data'
+# 尚未建立任何版本時使用的舊版資料庫路徑
+LEGACY_DATABASE_PATH = os.path.join(DATA_DIR, 'institutions.db')
+# 指標檔：內容為目前使用中的資料庫檔名
+CURRENT_POINTER = os.path.join(DATA_DIR, 'institutions.current')
+# 切換後保留的舊版本數量 (供仍在讀取的連線與回復使用)
+KEEP_PREVIOUS_VERSIONS = 1
+
+
+def dataset_path(version, data_dir=DATA_DIR):
+    """取得指定版本的資料庫路徑"""
+    return os.path.join(data_dir, f'institutions.{version}.db')
+
+
+def new_version():
+    """產生新的資料集版本號 (時間戳記，可依字串排序)"""
+    return datetime.now().strftime('%Y%m%d%H%M%S%f')[:17]
+
+
+# 指標檔內容快取 {指標檔路徑: ((inode, mtime, size), 檔名)}
+_pointer_cache = {}
+
+
+def current_database_path(pointer=CURRENT_POINTER, default=LEGACY_DATABASE_PATH):
+    """讀取指標檔，取得目前使用中的資料庫路徑 (指標檔未變動時只需一次 stat)"""
+    try:
+        st = os.stat(pointer)
+    except FileNotFoundError:
+        return default
+
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _pointer_cache.get(pointer)
+    if cached is not None and cached[0] == key:
+        filename = cached[1]
+    else:
+        try:
+            with open(pointer, 'r', encoding='utf-8') as f:
+                filename = f.read().strip()
+        except FileNotFoundError:
+            return default
+        _pointer_cache[pointer] = (key, filename)
+
+    if not filename:
+        return default
+    return os.path.join(os.path.dirname(pointer), filename)
+
+
+def current_version(pointer=CURRENT_POINTER):
+    """取得目前使用中的資料集版本 (舊版資料庫回傳 None)"""
+    filename = os.path.basename(current_database_path(pointer))
+    parts = filename.split('.')
+    if len(parts) == 3 and parts[0] == 'institutions' and parts[2] == 'db':
+        return parts[1]
+    return None
+
+
+def build_dataset(csv_file, data_dir=DATA_DIR, district_mapping=None):
+    """
+    在新的版本檔中建立完整資料集
+
+    先寫入暫存檔，匯入與建立索引完成並寫回磁碟後才改名為正式版本檔。
+    回傳 (資料庫路徑, 匯入統計)。
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    version = new_version()
+    final_path = dataset_path(version, data_dir)
+    tmp_path = final_path + '.tmp'
+
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            create_schema(conn)
+            conn.commit()
+            stats = bulk_import(
+                conn, csv_file, replace=False, durable=False,
+                district_mapping=district_mapping
+            )
+            analyze_start = time.perf_counter()
+            conn.execute('ANALYZE')
+            conn.commit()
+            stats['phases']['index'] = round(
+                stats['phases']['index'] + time.perf_counter() - analyze_start, 3
+            )
+            # 對外提供後以 WAL 模式讀取，讀取端不會被寫入端阻擋
+            conn.execute('PRAGMA journal_mode = WAL')
+        finally:
+            conn.close()
+        _fsync_file(tmp_path)
+        os.replace(tmp_path, final_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    stats['version'] = version
+    return final_path, stats
+
+
+def update_dataset(csv_file, pointer=CURRENT_POINTER, district_mapping=None):
+    """
+    在目前使用中的版本檔上套用增量更新
+
+    只寫入異動的資料列，整批變更在單一交易內提交 (WAL 模式下讀取端只會看到
+    更新前或更新後的完整資料)。沒有可更新的版本檔 (尚未建立或結構為舊版) 時回傳 None，
+    呼叫端應改用 build_dataset 完整重建。回傳 (資料庫路徑, 匯入統計)。
+    """
+    db_path = current_database_path(pointer, default=None)
+    if db_path is None or not os.path.exists(db_path):
+        return None
+
+    conn = sqlite3.connect(db_path)
+    try:
+        if not table_exists(conn, 'institutions') or not schema_is_current(conn):
+            return None
+        stats = delta_import(conn, csv_file, district_mapping=district_mapping)
+    finally:
+        conn.close()
+
+    stats['version'] = current_version(pointer)
+    return db_path, stats
+
+
+def activate_dataset(db_path, pointer=CURRENT_POINTER):
+    """以原子方式將指標檔切換到新的資料庫檔，並清除過舊的版本"""
+    tmp_pointer = pointer + '.tmp'
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(os.path.basename(db_path))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+    prune_old_versions(os.path.dirname(pointer), keep=os.path.basename(db_path))
+
+
+def prune_old_versions(data_dir=DATA_DIR, keep=None):
+    """刪除過舊的版本檔，保留目前版本與最近的 KEEP_PREVIOUS_VERSIONS 個舊版本"""
+    versions = sorted(
+        name for name in os.listdir(data_dir)
+        if name.startswith('institutions.') and name.endswith('.db') and name != keep
+        and name != os.path.basename(LEGACY_DATABASE_PATH)
+    )
+    stale = versions[:-KEEP_PREVIOUS_VERSIONS] if KEEP_PREVIOUS_VERSIONS else versions
+    for name in stale:
+        # 已開啟的連線仍可讀取舊檔 (POSIX)；Windows 上刪除失敗則留待下次清理
+        try:
+            os.remove(os.path.join(data_dir, name))
+        except OSError:
+            pass
+
+
+def _fsync_file(path):
+    """確保檔案內容已寫入磁碟"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+SQLite 連線池
+長期保留已設定好 PRAGMA 的唯讀連線，避免每個請求都重新開檔、冷啟動頁面快取
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 讀取用連線的 PRAGMA 設定
+READ_PRAGMAS = [
+    'PRAGMA query_only = ON',
+    'PRAGMA mmap_size = 268435456',   # 256MB，資料檔以記憶體映射讀取
+    'PRAGMA cache_size = -16384',     # 每條連線 16MB 頁面快取
+    'PRAGMA temp_store = MEMORY',
+]
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 5.0
+
+
+class PooledConnection(sqlite3.Connection):
+    """記錄所屬資料庫檔案的連線，資料集切換後可判斷是否需要重開"""
+    db_path = None
+
+
+class PoolTimeout(Exception):
+    """等待可用連線逾時"""
+
+
+class ConnectionPool:
+    """
+    有上限的 SQLite 連線池
+
+    連線在請求之間重複使用；取出時若資料集已切換到新的版本檔，
+    舊連線會被關閉並改開新檔。同時借出的連線數不超過 max_size。
+    """
+
+    def __init__(self, path_resolver, max_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, pragmas=None):
+        self.path_resolver = path_resolver
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = READ_PRAGMAS if pragmas is None else pragmas
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'opened': 0,     # 新開的連線數
+            'reused': 0,     # 直接重複使用的次數
+            'reopened': 0,   # 因資料集切換而重開的次數
+            'closed': 0,     # 關閉的連線數
+            'timeouts': 0,   # 等待連線逾時次數
+            'in_use': 0,     # 目前借出中的連線數
+        }
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    def _open(self, path):
+        conn = sqlite3.connect(path, factory=PooledConnection, check_same_thread=False)
+        conn.db_path = path
+        conn.row_factory = sqlite3.Row  # 讓結果可以像字典一樣存取
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        self._count('opened')
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        finally:
+            self._count('closed')
+
+    def acquire(self):
+        """借出一條連線 (使用完畢需呼叫 release)"""
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('timeouts')
+            raise PoolTimeout(f"等待資料庫連線超過 {self.timeout} 秒")
+
+        try:
+            path = self.path_resolver()
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open(path)
+            else:
+                if conn.db_path == path:
+                    self._count('reused')
+                else:
+                    self._close(conn)
+                    conn = self._open(path)
+                    self._count('reopened')
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._count('in_use')
+        return conn
+
+    def release(self, conn):
+        """歸還連線"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            self._close(conn)
+        finally:
+            self._count('in_use', -1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """以 with 語法借用連線"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """關閉所有閒置連線"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def stats(self):
+        """連線池統計"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        stats['max_size'] = self.max_size
+        return stats
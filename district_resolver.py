@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+鄉鎮區解析
+匯入時依地址、區域代碼與縣市區域對照表，為每筆機構算出唯一的標準區域代碼，
+查詢時只需做等值比對，不必再對地址做模糊比對
+"""
+
+import re
+
+import pandas as pd
+
+from text_normalize import POSTAL_CODE_PATTERN
+
+
+def _name_variants(name):
+    """縣市名稱的常見寫法 (臺/台)"""
+    variants = {name, name.replace('臺', '台'), name.replace('台', '臺')}
+    return sorted(variants, key=len, reverse=True)
+
+
+def build_district_patterns(mapping):
+    """
+    為每個縣市建立地址解析用的正則表達式與「區域名稱 -> 代碼」反查表
+
+    正則表達式比對地址開頭 (可省略縣市名稱，郵遞區號在解析前移除) 緊接的區域名稱，
+    候選名稱依長度由長到短排列，避免「新市區」被誤判為「新市」。
+    回傳 {縣市代碼: (compiled regex, {區域名稱: 區域代碼})}。
+    """
+    patterns = {}
+    for city_code, city in mapping.items():
+        name_to_code = {}
+        for district_code, district_name in city.get('districts', {}).items():
+            if not district_name or district_code == 'nan':
+                continue
+            name_to_code.setdefault(district_name, district_code)
+        if not name_to_code:
+            continue
+
+        city_prefix = '|'.join(re.escape(v) for v in _name_variants(city['name']))
+        alternatives = '|'.join(
+            re.escape(n) for n in sorted(name_to_code, key=len, reverse=True)
+        )
+        regex = re.compile(rf'^\s*(?:{city_prefix})?\s*({alternatives})')
+        patterns[city_code] = (regex, name_to_code)
+    return patterns
+
+
+def resolve_district_codes(city_codes, district_codes, addresses, patterns):
+    """
+    計算每列的標準區域代碼
+
+    地址中可解析出該縣市已知區域名稱時以地址為準 (與原本地址模糊比對的判斷一致)，
+    否則沿用資料本身的區域代碼。三個參數為索引相同的 Series，回傳 Series。
+    地址開頭的郵遞區號 (例如「806高雄市三民區…」) 與 normalize_addresses 一樣先移除。
+    """
+    resolved = district_codes.copy()
+    addresses = (
+        addresses.fillna('').astype(str).str.lstrip()
+        .str.replace(POSTAL_CODE_PATTERN, '', regex=True)
+    )
+
+    for city_code, rows in city_codes.groupby(city_codes, sort=False).groups.items():
+        if city_code not in patterns:
+            continue
+        regex, name_to_code = patterns[city_code]
+        names = addresses.loc[rows].str.extract(regex, expand=False)
+        codes = names.map(name_to_code)
+        resolved.loc[codes.index] = codes.where(codes.notna(), resolved.loc[codes.index])
+
+    return resolved
+
+
+def resolve_dataframe(df, patterns):
+    """對原始CSV欄位 (縣市、區、地址全址) 計算標準區域代碼"""
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    return resolve_district_codes(df['縣市'], df['區'], df['地址全址'], patterns)
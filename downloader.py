@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+CSV 下載管理
+以條件式請求 (If-None-Match / If-Modified-Since) 檢查來源是否更新，
+串流寫入暫存檔並計算 SHA-256，中斷後以 Range 續傳，完成後才原子改名為正式檔案
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+CSV_URL = 'https://ltcpap.mohw.gov.tw/publish/abc.csv'
+LOCAL_CSV_FILE = 'data/abc.csv'
+
+# 距離上次向來源確認超過此天數才重新發出請求
+MAX_AGE_DAYS = 30
+DEFAULT_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """下載失敗 (已下載的部分保留在暫存檔，下次可續傳)"""
+
+
+def _meta_path(dest):
+    """下載資訊檔：記錄 ETag、Last-Modified、SHA-256 與最後確認時間"""
+    return dest + '.meta.json'
+
+
+def _part_path(dest):
+    return dest + '.part'
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    """以暫存檔 + os.replace 寫入 JSON"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_metadata(dest=LOCAL_CSV_FILE):
+    """讀取下載資訊 (沒有資訊檔時回傳空字典)"""
+    return _read_json(_meta_path(dest))
+
+
+def file_age_days(dest=LOCAL_CSV_FILE):
+    """
+    距離上次確認來源的天數
+
+    以資訊檔記錄的確認時間為準 (收到 304 時只更新確認時間，不改動CSV本身)，
+    沒有資訊檔時使用CSV的修改時間；檔案不存在時回傳 None。
+    """
+    if not os.path.exists(dest):
+        return None
+    checked_at = load_metadata(dest).get('checked_at') or os.path.getmtime(dest)
+    return (time.time() - checked_at) / (24 * 3600)
+
+
+def _sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest
+
+
+def _validator(meta):
+    """續傳時用於 If-Range 的驗證值 (優先使用 ETag)"""
+    return meta.get('etag') or meta.get('last_modified')
+
+
+def download_csv(url=CSV_URL, dest=LOCAL_CSV_FILE, timeout=DEFAULT_TIMEOUT,
+                 session=None, chunk_size=CHUNK_SIZE):
+    """
+    條件式下載CSV
+
+    回傳下載結果字典，status 為：
+    - 'not_modified': 伺服器回應 304，本地檔案即為最新
+    - 'unchanged': 下載完成但內容與本地檔案相同 (SHA-256 相同)
+    - 'downloaded': 已下載新內容並取代本地檔案
+    連線或傳輸失敗時拋出 DownloadError，已收到的內容保留在 .part 檔供下次續傳。
+    """
+    http = session or requests
+    start_time = time.perf_counter()
+    meta = load_metadata(dest) if os.path.exists(dest) else {}
+    part_path = _part_path(dest)
+    part_meta_path = part_path + '.json'
+    part_meta = _read_json(part_meta_path)
+
+    # 不接受壓縮傳輸：續傳位移與 Content-Length 才會對應到檔案本身的位元組
+    headers = {'Accept-Encoding': 'identity'}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    # 有同一版本的未完成下載時從中斷處續傳
+    offset = 0
+    if os.path.exists(part_path) and part_meta.get('url') == url and _validator(part_meta):
+        offset = os.path.getsize(part_path)
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = _validator(part_meta)
+
+    try:
+        response = http.get(url, headers=headers, stream=True, timeout=timeout)
+    except requests.RequestException as e:
+        raise DownloadError(f"無法連線到資料來源: {e}")
+
+    with response:
+        if response.status_code == 304:
+            meta['checked_at'] = time.time()
+            _write_json(_meta_path(dest), meta)
+            return {'status': 'not_modified', 'path': dest, 'bytes': 0, 'resumed': False,
+                    'sha256': meta.get('sha256'), 'seconds': round(time.perf_counter() - start_time, 3)}
+
+        if response.status_code == 416:
+            # 續傳位置已超出檔案大小 (來源已變更)，捨棄暫存檔重新下載
+            os.remove(part_path)
+            os.remove(part_meta_path)
+            return download_csv(url, dest, timeout, session, chunk_size)
+
+        if response.status_code not in (200, 206):
+            raise DownloadError(f"資料來源回應 HTTP {response.status_code}")
+
+        resumed = response.status_code == 206
+        if resumed:
+            digest = _sha256_of(part_path)
+            mode = 'ab'
+            expected = response.headers.get('Content-Range', '').rpartition('/')[2]
+        else:
+            digest = hashlib.sha256()
+            mode = 'wb'
+            offset = 0
+            expected = response.headers.get('Content-Length')
+        expected = int(expected) if expected and expected.isdigit() else None
+
+        # 記錄此暫存檔對應的版本，中斷後續傳時用來確認來源未變
+        previous = part_meta if resumed else {}
+        part_meta = {
+            'url': url,
+            'etag': response.headers.get('ETag') or previous.get('etag'),
+            'last_modified': response.headers.get('Last-Modified') or previous.get('last_modified'),
+        }
+        _write_json(part_meta_path, part_meta)
+
+        received = 0
+        try:
+            with open(part_path, mode) as f:
+                for block in response.iter_content(chunk_size=chunk_size):
+                    f.write(block)
+                    digest.update(block)
+                    received += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+        except (requests.RequestException, OSError) as e:
+            raise DownloadError(f"下載中斷 (已取得 {offset + received} bytes，下次將續傳): {e}")
+
+        total_size = offset + received
+        if expected is not None and total_size != expected:
+            raise DownloadError(f"下載不完整：預期 {expected} bytes，實際 {total_size} bytes")
+
+    sha256 = digest.hexdigest()
+    new_meta = {
+        'url': url,
+        'etag': part_meta['etag'],
+        'last_modified': part_meta['last_modified'],
+        'sha256': sha256,
+        'size': total_size,
+        'checked_at': time.time(),
+    }
+
+    status = 'downloaded'
+    if meta.get('sha256') == sha256 and os.path.exists(dest):
+        # 內容相同：保留原檔 (修改時間不變，依賴它的快照仍有效)
+        os.remove(part_path)
+        status = 'unchanged'
+    else:
+        os.replace(part_path, dest)
+    _write_json(_meta_path(dest), new_meta)
+    os.remove(part_meta_path)
+
+    return {'status': status, 'path': dest, 'bytes': received, 'resumed': resumed,
+            'sha256': sha256, 'seconds': round(time.perf_counter() - start_time, 3)}
+
+
+def ensure_csv(url=CSV_URL, dest=LOCAL_CSV_FILE, max_age_days=MAX_AGE_DAYS, force=False, **kwargs):
+    """
+    確保本地CSV可用且不過期
+
+    本地檔案在 max_age_days 內確認過時直接使用 (status 為 'fresh')，不發出任何請求；
+    否則 (或 force=True) 發出條件式請求，來源未變時只會收到 304。
+    """
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    age = file_age_days(dest)
+    if not force and age is not None and age < max_age_days:
+        return {'status': 'fresh', 'path': dest, 'bytes': 0, 'resumed': False,
+                'sha256': load_metadata(dest).get('sha256'), 'age_days': round(age, 1), 'seconds': 0}
+    return download_csv(url, dest, **kwargs)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+查詢結果匯出
+以產生器逐批輸出符合條件的全部機構 (NDJSON 或 CSV)，回應以 chunked 傳輸，
+不論結果多少筆，伺服器端只保留一個批次在記憶體中
+"""
+
+import csv
+import io
+import json
+
+from flask import Response
+
+# 格式 -> (Content-Type, 副檔名)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+DEFAULT_FORMAT = 'ndjson'
+# 每批次的機構數
+EXPORT_BATCH_SIZE = 1000
+# CSV 欄位 (與 /api/institutions 回傳的機構欄位相同)
+EXPORT_FIELDS = (
+    'name', 'code', 'type', 'city', 'district', 'address', 'longitude', 'latitude',
+    'service_type', 'phone', 'email', 'manager', 'contract_start', 'contract_end',
+)
+
+
+class ExportError(ValueError):
+    """匯出參數錯誤"""
+
+
+def parse_format(value):
+    """解析匯出格式"""
+    fmt = (value or DEFAULT_FORMAT).lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"format 必須是 {' 或 '.join(EXPORT_FORMATS)}: {value}")
+    return fmt
+
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        yield ''.join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in batch
+        ).encode('utf-8')
+
+
+def _csv_chunks(batches, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(fields)
+    for batch in batches:
+        writer.writerows([record.get(field) for field in fields] for record in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # 沒有任何資料時仍輸出標題列
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def export_response(batches, fmt, fields=EXPORT_FIELDS, filename='institutions'):
+    """
+    建立串流匯出回應
+
+    batches 為逐批產生 API 格式字典列表的產生器 (由呼叫端負責在結束或中斷時釋放資源)，
+    fields 為 CSV 的欄位順序。未設定 Content-Length，由伺服器以 chunked 傳輸；
+    用戶端中斷連線時 WSGI 伺服器會關閉回應，產生器隨之結束。
+    """
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    if fmt == 'csv':
+        chunks = _csv_chunks(batches, fields)
+    else:
+        chunks = _ndjson_chunks(batches)
+
+    def body():
+        try:
+            yield from chunks
+        finally:
+            # 中途中斷時也立即關閉資料來源 (例如歸還資料庫連線)
+            batches.close()
+
+    response = Response(body(), content_type=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    response.headers['Cache-Control'] = 'no-store'
+    # 停用反向代理 (nginx) 的回應緩衝，資料產生後立即送出
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+篩選條件統計 (facet)
+匯入時預先計算 (縣市, 鄉鎮區, 服務項目) 各種組合的機構數，
+儀表板要的各區、各服務筆數只需查表，不必逐一執行完整的搜尋查詢
+"""
+
+from itertools import product
+
+import pandas as pd
+
+# 統計表中代表「不限」的維度值
+ANY = ''
+
+FACET_TABLE = 'facet_counts'
+FACET_DIMENSIONS = ['city_code', 'district_code', 'service']
+
+# 每個維度皆可為 ANY，主鍵即為查詢鍵，任何篩選組合都是一次主鍵查詢
+FACETS_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS facet_counts (
+        city_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        service TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (city_code, district_code, service)
+    ) WITHOUT ROWID
+'''
+
+# 各維度在來源查詢中的欄位 (服務項目來自 institution_services 對照表)
+_SOURCE_COLUMNS = {
+    'city_code': 'i.city_code',
+    'district_code': "COALESCE(i.resolved_district_code, '')",
+    'service': 's.service',
+}
+
+
+def _rollup_selects(where=None, weight=''):
+    """
+    產生八種維度組合 (每個維度指定或不限) 的統計 SELECT 語法
+
+    where 可限制只統計部分機構；weight 為計數前的係數 (例如 '-1 * ')。
+    """
+    selects = []
+    for grouped in product([True, False], repeat=len(FACET_DIMENSIONS)):
+        dims = dict(zip(FACET_DIMENSIONS, grouped))
+        columns = [_SOURCE_COLUMNS[d] if dims[d] else "''" for d in FACET_DIMENSIONS]
+        group_by = [_SOURCE_COLUMNS[d] for d in FACET_DIMENSIONS if dims[d]]
+        # 服務對照表主鍵為 (服務, 機構編號)，按服務分組的列數即為機構數
+        source = 'institutions i'
+        if dims['service']:
+            source += ' JOIN institution_services s ON s.institution_id = i.id'
+        sql = f'SELECT {", ".join(columns)}, {weight}COUNT(*) FROM {source}'
+        if where:
+            sql += f' WHERE {where}'
+        if group_by:
+            sql += ' GROUP BY ' + ', '.join(group_by)
+        selects.append(sql)
+    return selects
+
+
+ROLLUP_STATEMENTS = [f'INSERT INTO {FACET_TABLE} {sql}' for sql in _rollup_selects()]
+
+
+def create_facets_table(conn):
+    """建立統計表"""
+    conn.execute(FACETS_SCHEMA_SQL)
+
+
+def rebuild_facets(conn):
+    """
+    依 institutions 與服務對照表重新計算統計表
+
+    應在匯入的同一交易中呼叫，統計表與資料一起寫進新版本檔、一起切換上線。
+    """
+    conn.execute(f'DELETE FROM {FACET_TABLE}')
+    for sql in ROLLUP_STATEMENTS:
+        conn.execute(sql)
+
+
+def adjust_facets(conn, id_table, sign):
+    """
+    依部分機構增減統計表 (增量匯入用)
+
+    id_table 為只含 id 欄位的暫存表；sign 為 -1 時扣除這些機構目前的計數
+    (需在刪除資料前呼叫)，為 1 時加回 (需在寫入新資料後呼叫)。
+    成本只與異動的機構數有關，不必重新掃描整張表。
+    """
+    where = f'i.id IN (SELECT id FROM {id_table})'
+    for sql in _rollup_selects(where, weight=f'{int(sign)} * '):
+        conn.execute(
+            f'INSERT INTO {FACET_TABLE} {sql} '
+            'ON CONFLICT (city_code, district_code, service) '
+            'DO UPDATE SET total = total + excluded.total'
+        )
+    conn.execute(f'DELETE FROM {FACET_TABLE} WHERE total <= 0')
+
+
+def _normalize(city_code, district_code, service):
+    return city_code or ANY, district_code or ANY, service or ANY
+
+
+def lookup_facets(conn, city_code=None, district_code=None, service=None):
+    """
+    查詢篩選組合的機構數，並列出未指定維度的細項筆數
+
+    回傳 {'total': n, 'by_city': {...}, 'by_district': {...}, 'by_service': {...}}，
+    只有未指定的維度才會出現對應的細項。
+    """
+    key = _normalize(city_code, district_code, service)
+    row = conn.execute(
+        f'SELECT total FROM {FACET_TABLE} WHERE city_code = ? AND district_code = ? AND service = ?',
+        key
+    ).fetchone()
+    result = {'total': row[0] if row else 0}
+
+    for position, (dimension, label) in enumerate(
+            zip(FACET_DIMENSIONS, ['by_city', 'by_district', 'by_service'])):
+        if key[position] != ANY:
+            continue
+        conditions = [f'{d} = ?' for d in FACET_DIMENSIONS if d != dimension]
+        params = [v for d, v in zip(FACET_DIMENSIONS, key) if d != dimension]
+        rows = conn.execute(
+            f'SELECT {dimension}, total FROM {FACET_TABLE} '
+            f'WHERE {" AND ".join(conditions)} AND {dimension} != ? ORDER BY {dimension}',
+            params + [ANY]
+        ).fetchall()
+        result[label] = {value: total for value, total in rows}
+
+    return result
+
+
+class FacetIndex:
+    """
+    記憶體中的統計表 (CSV 版本使用)，查詢結果與 lookup_facets 相同
+
+    除了各組合的總數，也預先依「其餘兩個維度」分好細項，查詢不需掃描整張表。
+    """
+
+    LABELS = ['by_city', 'by_district', 'by_service']
+
+    def __init__(self, totals):
+        self.totals = totals
+        self.breakdowns = {}
+        for key, total in sorted(totals.items()):
+            for position, value in enumerate(key):
+                if value == ANY:
+                    continue
+                rest = key[:position] + (ANY,) + key[position + 1:]
+                self.breakdowns.setdefault((position, rest), {})[value] = total
+
+    @classmethod
+    def from_series(cls, city_codes, district_codes, services):
+        """
+        以 pandas 計算各組合的機構數
+
+        city_codes、district_codes 為索引相同的 Series，
+        services 為拆分後的服務長表 (索引對應機構列)。
+        """
+        base = pd.DataFrame({
+            'city_code': city_codes.fillna(ANY).astype(str),
+            'district_code': district_codes.fillna(ANY).astype(str),
+        })
+        long = base.loc[services.index].assign(service=services.to_numpy())
+        base = base.assign(service=ANY)
+
+        totals = {}
+        for grouped in product([True, False], repeat=len(FACET_DIMENSIONS)):
+            dims = [d for d, g in zip(FACET_DIMENSIONS, grouped) if g]
+            frame = long if 'service' in dims else base
+            if not dims:
+                totals[(ANY, ANY, ANY)] = len(frame)
+                continue
+            for values, total in frame.groupby(dims, sort=False).size().items():
+                values = values if isinstance(values, tuple) else (values,)
+                named = dict(zip(dims, values))
+                totals[tuple(named.get(d, ANY) for d in FACET_DIMENSIONS)] = int(total)
+        return cls(totals)
+
+    def lookup(self, city_code=None, district_code=None, service=None):
+        key = _normalize(city_code, district_code, service)
+        result = {'total': self.totals.get(key, 0)}
+        for position, label in enumerate(self.LABELS):
+            if key[position] == ANY:
+                result[label] = dict(self.breakdowns.get((position, key), {}))
+        return result
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+容錯全文搜尋
+載入資料時以正規化的機構名稱與地址建立字元二連字 (bigram) 倒排索引；
+查詢時依共同二連字數量取出候選，再以限定編輯距離的近似子字串比對 (Myers 位元平行演算法)
+重新排序。每次查詢只處理少量候選，不必對每一列計算相似度
+"""
+
+import sqlite3
+
+import numpy as np
+
+from text_normalize import normalize_text
+
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 50
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# 依共同二連字數量取前幾名候選做編輯距離比對 (控制每次查詢的最壞成本)
+MAX_CANDIDATES = 200
+# 每筆機構建立索引的最大字元數 (名稱 + 地址，超過的部分不列入索引)
+MAX_INDEXED_CHARS = 96
+# 建立索引時每批轉換的列數 (限制暫存矩陣的記憶體用量；不可超過 ROW_BITS 可表示的範圍)
+BUILD_BATCH_SIZE = 50000
+ROW_BITS = 16
+# 名稱與地址之間的分隔字元 (碼位 0 視為空白，不會產生跨欄位的二連字)
+FIELD_SEPARATOR = '\x00'
+# Unicode 碼位最多 21 位元，兩個碼位合成一個 int64 鍵值
+CODEPOINT_BITS = 21
+
+MATCH_NAME = 'name'
+MATCH_ADDRESS = 'address'
+
+
+class SearchQueryError(ValueError):
+    """搜尋參數錯誤"""
+
+
+def parse_query(value):
+    """解析並正規化搜尋字串"""
+    query = normalize_text(value)
+    if len(query) < MIN_QUERY_LENGTH:
+        raise SearchQueryError(f"q 至少需要 {MIN_QUERY_LENGTH} 個字")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise SearchQueryError(f"q 不可超過 {MAX_QUERY_LENGTH} 個字")
+    return query
+
+
+def parse_search_limit(value, default=DEFAULT_SEARCH_LIMIT, maximum=MAX_SEARCH_LIMIT):
+    """解析回傳筆數"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise SearchQueryError(f"limit 必須是整數: {value}")
+    if limit < 1:
+        raise SearchQueryError("limit 必須大於 0")
+    return min(limit, maximum)
+
+
+def max_edits(length):
+    """依查詢長度允許的編輯次數 (短字串容錯過多會失去鑑別力)"""
+    if length <= 2:
+        return 0
+    if length <= 5:
+        return 1
+    return 2
+
+
+def _bigram_codes(texts):
+    """
+    將字串陣列轉為 (列號, 二連字鍵值)，每列的二連字不重複
+
+    以固定寬度的 NumPy 字串陣列取得碼位矩陣，整批向量化計算，不逐字元迴圈
+    """
+    codepoints = np.asarray(texts, dtype=f'<U{MAX_INDEXED_CHARS}')
+    codepoints = codepoints.view(np.uint32).reshape(len(texts), MAX_INDEXED_CHARS).astype(np.int64)
+    left, right = codepoints[:, :-1], codepoints[:, 1:]
+    rows, columns = np.nonzero((left != 0) & (right != 0))
+    codes = (left[rows, columns] << CODEPOINT_BITS) | right[rows, columns]
+    # 同一列重複的二連字只保留一個 (二連字與列號合成單一鍵值去重，列號不超過 16 位元)
+    keys = np.unique((codes << ROW_BITS) | rows)
+    return keys & ((1 << ROW_BITS) - 1), keys >> ROW_BITS
+
+
+def query_bigrams(query):
+    """查詢字串的二連字鍵值 (不重複)"""
+    return sorted({(ord(a) << CODEPOINT_BITS) | ord(b) for a, b in zip(query, query[1:])})
+
+
+def approximate_distance(pattern, text, limit):
+    """
+    pattern 與 text 中任一子字串的最小編輯距離 (Myers 位元平行演算法，O(len(text)))
+
+    超過 limit 時回傳 None
+    """
+    length = len(pattern)
+    if length == 0:
+        return 0
+    full = (1 << length) - 1
+    high = 1 << (length - 1)
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    pv, mv, score = full, 0, length
+    best = length
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # 子字串比對：起點不計成本，水平差值的最低位元不補 1
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+        if score < best:
+            best = score
+            if best == 0:
+                break
+    return best if best <= limit else None
+
+
+class BigramIndex:
+    """
+    機構名稱 / 地址的二連字倒排索引
+
+    keys 為每列對應的識別值 (CSV 版本為 DataFrame 位置、SQLite 版本為機構編號)，
+    搜尋結果以 keys 回傳。建立後不再變動，資料更新時建立新的索引整個替換。
+    """
+
+    def __init__(self, keys, names, addresses, city_codes, service_masks):
+        self.keys = np.asarray(keys)
+        self.names = [str(name) for name in names]
+        self.addresses = [str(address) for address in addresses]
+        self.size = len(self.keys)
+        # 縣市代碼轉為整數編號，篩選時只需比較整數
+        city_codes = np.asarray(city_codes, dtype=object)
+        self.city_values = {code: i for i, code in enumerate(dict.fromkeys(city_codes.tolist()))}
+        self.city_ids = np.array([self.city_values[code] for code in city_codes], dtype=np.int32)
+        self.service_masks = np.asarray(service_masks, dtype=np.int64)
+
+        all_rows, all_codes = [], []
+        for start in range(0, self.size, BUILD_BATCH_SIZE):
+            texts = [
+                name + FIELD_SEPARATOR + address
+                for name, address in zip(self.names[start:start + BUILD_BATCH_SIZE],
+                                         self.addresses[start:start + BUILD_BATCH_SIZE])
+            ]
+            rows, codes = _bigram_codes(texts)
+            all_rows.append(rows + start)
+            all_codes.append(codes)
+        rows = np.concatenate(all_rows) if all_rows else np.empty(0, dtype=np.int64)
+        codes = np.concatenate(all_codes) if all_codes else np.empty(0, dtype=np.int64)
+
+        # 依 (二連字, 列號) 排序，每個二連字的列號為連續區段 (CSR 格式)
+        order = np.lexsort((rows, codes))
+        self.postings = rows[order].astype(np.int32)
+        self.codes, starts = np.unique(codes[order], return_index=True)
+        self.offsets = np.append(starts, len(order)).astype(np.int64)
+
+    def _candidates(self, codes, required):
+        """共同二連字數量至少 required 的列號與數量"""
+        positions = np.searchsorted(self.codes, codes)
+        lists = [
+            self.postings[self.offsets[p]:self.offsets[p + 1]]
+            for p, code in zip(positions.tolist(), codes)
+            if p < len(self.codes) and self.codes[p] == code
+        ]
+        if not lists:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        postings = np.concatenate(lists)
+        if len(postings) > self.size // 16:
+            # 常見二連字的列號很多：直接對全部列計數，比排序去重快
+            counts = np.bincount(postings, minlength=self.size)
+            rows = np.flatnonzero(counts >= required)
+            return rows, counts[rows]
+        rows, overlap = np.unique(postings, return_counts=True)
+        keep = overlap >= required
+        return rows[keep], overlap[keep]
+
+    @staticmethod
+    def _distance(query, name, address, edits):
+        """名稱與地址中較小的編輯距離與命中欄位 (完全包含時不必逐字元計算)"""
+        if query in name:
+            return 0, MATCH_NAME
+        if query in address:
+            return 0, MATCH_ADDRESS
+        if edits == 0:
+            return None, None
+        distance = approximate_distance(query, name, edits)
+        if distance is not None and distance <= 1:
+            return distance, MATCH_NAME
+        address_distance = approximate_distance(query, address, edits)
+        if address_distance is not None and (distance is None or address_distance < distance):
+            return address_distance, MATCH_ADDRESS
+        return distance, MATCH_NAME
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, city_code=None, service_mask=None):
+        """
+        搜尋已正規化的 query，回傳依相關程度排序的 [(key, 編輯距離, 命中欄位)]
+
+        service_mask 為服務位元遮罩 (0 代表沒有符合的服務)，city_code 與 service_mask 為 None 時不限
+        """
+        edits = max_edits(len(query))
+        codes = query_bigrams(query)
+        # q-gram 計數下界：每次編輯最多破壞兩個二連字
+        required = max(1, len(codes) - 2 * edits)
+        rows, overlap = self._candidates(codes, required)
+
+        keep = np.ones(len(rows), dtype=bool)
+        if city_code:
+            city_id = self.city_values.get(city_code)
+            keep &= self.city_ids[rows] == (-1 if city_id is None else city_id)
+        if service_mask is not None:
+            keep &= (self.service_masks[rows] & service_mask) != 0
+        rows, overlap = rows[keep], overlap[keep]
+
+        # 依共同二連字由多到少排序 (相同時依列號，結果不受執行順序影響)，最多處理 MAX_CANDIDATES 筆
+        if len(rows) > MAX_CANDIDATES:
+            cutoff = np.partition(overlap, -MAX_CANDIDATES)[-MAX_CANDIDATES]
+            keep = overlap >= cutoff
+            rows, overlap = rows[keep], overlap[keep]
+        order = np.lexsort((rows, -overlap))[:MAX_CANDIDATES]
+        rows, overlap = rows[order], overlap[order]
+
+        # 缺少 m 個二連字的列編輯距離至少為 ceil(m / 2)：已有 limit 筆結果小於此下界時，
+        # 之後的候選都不可能排進前 limit 筆
+        found = [0] * (edits + 1)
+        ranked = []
+        for row, shared in zip(rows.tolist(), overlap.tolist()):
+            lower_bound = (len(codes) - shared + 1) // 2
+            if sum(found[:lower_bound]) >= limit:
+                break
+            name = self.names[row]
+            distance, field = self._distance(query, name, self.addresses[row], edits)
+            if distance is None:
+                continue
+            found[distance] += 1
+            # 編輯距離小、名稱命中、共同二連字多、名稱短者優先
+            ranked.append((distance, field != MATCH_NAME, -shared, len(name), row, field))
+
+        ranked.sort()
+        return [
+            (self.keys[row].item(), distance, field)
+            for distance, _, _, _, row, field in ranked[:limit]
+        ]
+
+    def info(self):
+        return {
+            'rows': self.size,
+            'bigrams': len(self.codes),
+            'postings': len(self.postings),
+        }
+
+
+def load_bigram_index(conn):
+    """由資料庫的正規化欄位建立索引 (舊版資料庫沒有正規化欄位時回傳 None)"""
+    try:
+        rows = conn.execute(
+            'SELECT id, name_norm, address_norm, city_code, service_mask '
+            'FROM institutions ORDER BY id'
+        ).fetchall()
+    except sqlite3.OperationalError:  # 舊版資料庫沒有正規化欄位
+        return None
+    keys, names, addresses, cities, masks = zip(*rows) if rows else ([], [], [], [], [])
+    return BigramIndex(
+        keys,
+        [name or '' for name in names],
+        [address or '' for address in addresses],
+        cities,
+        [mask or 0 for mask in masks],
+    )
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+地理位置查詢
+匯入時將機構經緯度寫入 R*Tree 空間索引；附近機構查詢先以半徑換算的
+經緯度範圍框選候選，再以 haversine 公式計算實際距離，取最近的 k 筆
+"""
+
+import math
+import sqlite3
+
+import numpy as np
+
+GEO_TABLE = 'institutions_geo'
+# R*Tree 以 32 位元浮點數儲存邊界 (會往外取整，範圍查詢不會漏掉資料)，
+# 實際距離一律以 institutions 中的原始經緯度計算
+GEO_SCHEMA_SQL = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {GEO_TABLE} USING rtree(
+        id, min_lng, max_lng, min_lat, max_lat
+    )
+'''
+# 座標缺漏或超出範圍的機構不寫入空間索引
+VALID_POINT_SQL = 'longitude BETWEEN -180 AND 180 AND latitude BETWEEN -90 AND 90'
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 50.0
+DEFAULT_K = 20
+MAX_K = 200
+
+
+class GeoQueryError(ValueError):
+    """地理查詢參數錯誤"""
+
+
+def _parse_float(name, value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise GeoQueryError(f"{name} 必須是數字: {value}")
+    if not math.isfinite(number):
+        raise GeoQueryError(f"{name} 必須是有限的數字")
+    return number
+
+
+def parse_point(lat, lng):
+    """解析中心點座標 (緯度, 經度)"""
+    if lat in (None, '') or lng in (None, ''):
+        raise GeoQueryError("必須提供 lat 與 lng")
+    lat = _parse_float('lat', lat)
+    lng = _parse_float('lng', lng)
+    if not -90 <= lat <= 90:
+        raise GeoQueryError("lat 必須介於 -90 與 90 之間")
+    if not -180 <= lng <= 180:
+        raise GeoQueryError("lng 必須介於 -180 與 180 之間")
+    return lat, lng
+
+
+def parse_radius(value, default=DEFAULT_RADIUS_KM, maximum=MAX_RADIUS_KM):
+    """解析搜尋半徑 (公里)"""
+    if value in (None, ''):
+        return default
+    radius = _parse_float('radius', value)
+    if radius <= 0:
+        raise GeoQueryError("radius 必須大於 0")
+    return min(radius, maximum)
+
+
+def parse_k(value, default=DEFAULT_K, maximum=MAX_K):
+    """解析回傳筆數"""
+    if value in (None, ''):
+        return default
+    try:
+        k = int(value)
+    except (TypeError, ValueError):
+        raise GeoQueryError(f"k 必須是整數: {value}")
+    if k < 1:
+        raise GeoQueryError("k 必須大於 0")
+    return min(k, maximum)
+
+
+def create_geo_table(conn):
+    """建立 R*Tree 空間索引，SQLite 未編入 R*Tree 模組時回傳 False"""
+    try:
+        conn.execute(GEO_SCHEMA_SQL)
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"⚠ 無法建立空間索引，附近機構查詢將無法使用: {e}")
+        return False
+
+
+def has_geo_table(conn):
+    """檢查資料庫中是否已有空間索引"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (GEO_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def rebuild_geo(conn):
+    """依 institutions 的經緯度重建空間索引 (應在匯入的同一交易中呼叫)"""
+    if not has_geo_table(conn):
+        return
+    conn.execute(f'DELETE FROM {GEO_TABLE}')
+    conn.execute(
+        f'INSERT INTO {GEO_TABLE} (id, min_lng, max_lng, min_lat, max_lat) '
+        f'SELECT id, longitude, longitude, latitude, latitude FROM institutions '
+        f'WHERE {VALID_POINT_SQL}'
+    )
+
+
+def remove_geo(conn, id_table):
+    """自空間索引移除 id_table 中的機構 (增量匯入用)"""
+    if has_geo_table(conn):
+        conn.execute(f'DELETE FROM {GEO_TABLE} WHERE id IN (SELECT id FROM {id_table})')
+
+
+def add_geo(conn, id_table):
+    """將 id_table 中的機構加入空間索引 (增量匯入用，需在寫入新資料後呼叫)"""
+    if has_geo_table(conn):
+        conn.execute(
+            f'INSERT INTO {GEO_TABLE} (id, min_lng, max_lng, min_lat, max_lat) '
+            f'SELECT id, longitude, longitude, latitude, latitude FROM institutions '
+            f'WHERE id IN (SELECT id FROM {id_table}) AND {VALID_POINT_SQL}'
+        )
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    半徑範圍的外接經緯度框 (west, south, east, north)
+
+    經度方向以範圍內最靠近極區的緯度換算，框必定涵蓋整個圓；
+    不處理跨越 180 度經線的情況 (資料範圍在臺灣)。
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south = max(lat - dlat, -90.0)
+    north = min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    if cos_lat < 1e-9:
+        dlng = 180.0
+    else:
+        dlng = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    return max(lng - dlng, -180.0), south, min(lng + dlng, 180.0), north
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """兩點間的大圓距離 (公里)，參數可為 NumPy 陣列"""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def closest(keys, lats, lngs, lat, lng, radius_km, k):
+    """
+    由候選中取出半徑內最近的 k 筆
+
+    keys 為候選的識別值 (機構編號或列位置)，距離相同時依 keys 排序。
+    回傳 (依距離排序的 keys, 對應距離, 半徑內的總筆數)。
+    """
+    distances = haversine_km(lat, lng, lats, lngs)
+    inside = np.flatnonzero(distances <= radius_km)
+    total = len(inside)
+    if total > k:
+        # 只需排序最近的 k 筆 (argpartition 為線性時間)
+        nearest = np.argpartition(distances[inside], k - 1)[:k]
+        cutoff = distances[inside][nearest].max()
+        # 第 k 名同距離的候選都納入排序，確保結果與完整排序一致
+        inside = inside[distances[inside] <= cutoff]
+    order = np.lexsort((keys[inside], distances[inside]))[:k]
+    selected = inside[order]
+    return keys[selected], distances[selected], total
+
+
+def bbox_condition(west, south, east, north):
+    """
+    以 R*Tree 框選經緯度範圍內機構的 WHERE 條件與參數
+
+    R*Tree 的邊界經過 32 位元取整，只用來縮小候選，範圍邊緣再以原始經緯度確認
+    """
+    condition = (
+        f'id IN (SELECT id FROM {GEO_TABLE} '
+        'WHERE min_lng <= ? AND max_lng >= ? AND min_lat <= ? AND max_lat >= ?) '
+        'AND longitude BETWEEN ? AND ? AND latitude BETWEEN ? AND ?'
+    )
+    return condition, [east, west, north, south, west, east, south, north]
+
+
+def nearby_ids(conn, lat, lng, radius_km, k, conditions=(), params=()):
+    """
+    以 R*Tree 框選候選後計算實際距離，回傳 (機構編號列表, 距離列表, 半徑內總筆數)
+
+    conditions / params 為額外的篩選條件 (例如服務類型)，欄位為 institutions 的欄位。
+    """
+    box, box_params = bbox_condition(*bounding_box(lat, lng, radius_km))
+    where = [box] + list(conditions)
+    rows = conn.execute(
+        f'SELECT id, latitude, longitude FROM institutions WHERE {" AND ".join(where)}',
+        box_params + list(params)
+    ).fetchall()
+    if not rows:
+        return [], [], 0
+
+    candidates = np.array(rows, dtype=np.float64)
+    keys, distances, total = closest(
+        candidates[:, 0].astype(np.int64), candidates[:, 1], candidates[:, 2],
+        lat, lng, radius_km, k
+    )
+    return keys.tolist(), distances.tolist(), total
+
+
+class PointIndex:
+    """
+    記憶體中的座標索引 (CSV 版本使用)
+
+    有效座標依緯度排序，查詢時以二分搜尋取出緯度範圍內的候選，
+    再檢查經度範圍與實際距離，不必計算每一筆機構的距離。
+    """
+
+    def __init__(self, latitudes, longitudes):
+        lats = np.asarray(latitudes, dtype=np.float64)
+        lngs = np.asarray(longitudes, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            valid = (np.abs(lats) <= 90) & (np.abs(lngs) <= 180)
+        positions = np.flatnonzero(valid)
+        order = np.argsort(lats[positions], kind='stable')
+        self.positions = positions[order]
+        self.lats = lats[self.positions]
+        self.lngs = lngs[self.positions]
+
+    def _box(self, west, south, east, north, allowed=None):
+        """經緯度範圍內的 (DataFrame 位置, 排序後陣列中的位置)"""
+        start = int(np.searchsorted(self.lats, south, side='left'))
+        end = int(np.searchsorted(self.lats, north, side='right'))
+        lngs = self.lngs[start:end]
+        selected = np.flatnonzero((lngs >= west) & (lngs <= east)) + start
+        positions = self.positions[selected]
+        if allowed is not None:
+            keep = allowed[positions]
+            positions, selected = positions[keep], selected[keep]
+        return positions, selected
+
+    def within(self, west, south, east, north, allowed=None):
+        """地圖範圍內機構的 DataFrame 位置 (遞增排序)"""
+        positions, _ = self._box(west, south, east, north, allowed)
+        return np.sort(positions)
+
+    def nearest(self, lat, lng, radius_km, k, allowed=None):
+        """
+        回傳 (DataFrame 位置陣列, 距離陣列, 半徑內總筆數)
+
+        allowed 為以 DataFrame 位置計算的布林陣列 (其他篩選條件)，None 代表不限。
+        """
+        positions, selected = self._box(*bounding_box(lat, lng, radius_km), allowed)
+        return closest(positions, self.lats[selected], self.lngs[selected], lat, lng, radius_km, k)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+地圖網格聚合
+匯入時以 geohash 各層級 (前綴長度 1~6) 的格子預先統計機構數與座標總和，
+地圖縮小時直接以格子範圍查表回傳各格的數量與中心點，不必傳送個別機構
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from geo import GeoQueryError
+
+GRID_TABLE = 'geo_grid'
+# 預先統計的 geohash 前綴長度 (長度 6 的格子約 1.2 x 0.6 公里)
+GRID_PRECISIONS = range(1, 7)
+# 縮放層級超過此值時回傳個別機構
+CLUSTER_MAX_ZOOM = 13
+MAX_ZOOM = 22
+# 個別機構模式最多回傳的筆數
+MAX_POINTS = 2000
+# 每個地圖圖磚寬度內至少切成幾格
+CELLS_PER_TILE = 4
+
+# 統計表中代表「不限服務」的值
+ANY = ''
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 格子以整數座標 (x, y) 為主鍵，地圖範圍查詢為 x、y 的區間條件
+GRID_SCHEMA_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {GRID_TABLE} (
+        service TEXT NOT NULL,
+        precision INTEGER NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        cell TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        lat_sum REAL NOT NULL,
+        lng_sum REAL NOT NULL,
+        PRIMARY KEY (service, precision, x, y)
+    ) WITHOUT ROWID
+'''
+
+GRID_COLUMNS = ['service', 'precision', 'x', 'y', 'cell', 'total', 'lat_sum', 'lng_sum']
+INSERT_SQL = 'INSERT INTO {} ({}) VALUES ({})'.format(
+    GRID_TABLE, ', '.join(GRID_COLUMNS), ', '.join('?' * len(GRID_COLUMNS))
+)
+UPSERT_SQL = (
+    f'INSERT INTO {GRID_TABLE} (service, precision, x, y, cell, total, lat_sum, lng_sum) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (service, precision, x, y) DO UPDATE SET '
+    'total = total + excluded.total, '
+    'lat_sum = lat_sum + excluded.lat_sum, '
+    'lng_sum = lng_sum + excluded.lng_sum'
+)
+
+
+def _bits(precision):
+    """geohash 前綴長度對應的 (經度位元數, 緯度位元數)，經度位元在前交錯排列"""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def cell_size(precision):
+    """格子的 (經度寬, 緯度高)，單位為度"""
+    lng_bits, lat_bits = _bits(precision)
+    return 360.0 / (1 << lng_bits), 180.0 / (1 << lat_bits)
+
+
+def cell_coords(lats, lngs, precision):
+    """座標所在格子的整數座標 (x, y)，參數可為 NumPy 陣列"""
+    lng_bits, lat_bits = _bits(precision)
+    x = np.floor((np.asarray(lngs) + 180.0) / 360.0 * (1 << lng_bits))
+    y = np.floor((np.asarray(lats) + 90.0) / 180.0 * (1 << lat_bits))
+    x = np.clip(x, 0, (1 << lng_bits) - 1).astype(np.int64)
+    y = np.clip(y, 0, (1 << lat_bits) - 1).astype(np.int64)
+    return x, y
+
+
+def geohash_cells(x, y, precision):
+    """將格子整數座標轉為 geohash 字串 (向量化交錯位元)"""
+    lng_bits, lat_bits = _bits(precision)
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    code = np.zeros(len(x), dtype=np.int64)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            bit = (x >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    alphabet = np.array(list(BASE32))
+    digits = np.stack([(code >> (5 * (precision - 1 - j))) & 31 for j in range(precision)], axis=1)
+    # 每列 precision 個單字元直接視為一個定長字串，不必逐列 join
+    chars = np.ascontiguousarray(alphabet[digits])
+    return chars.view(f'<U{precision}').ravel().tolist()
+
+
+def precision_for_zoom(zoom):
+    """
+    縮放層級對應的 geohash 前綴長度
+
+    取格子寬度不超過圖磚寬度 1/CELLS_PER_TILE 的最粗層級 (上限為預先統計的最細層級)
+    """
+    tile_width = 360.0 / (1 << zoom)
+    for precision in GRID_PRECISIONS:
+        if cell_size(precision)[0] <= tile_width / CELLS_PER_TILE:
+            return precision
+    return GRID_PRECISIONS[-1]
+
+
+def parse_bbox(west, south, east, north):
+    """解析地圖範圍 (west, south, east, north)，不支援跨越 180 度經線的範圍"""
+    values = []
+    for name, value in (('west', west), ('south', south), ('east', east), ('north', north)):
+        if value in (None, ''):
+            raise GeoQueryError("必須提供 west、south、east、north")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise GeoQueryError(f"{name} 必須是數字: {value}")
+        if not math.isfinite(number):
+            raise GeoQueryError(f"{name} 必須是有限的數字")
+        values.append(number)
+    west, south, east, north = values
+    if west > east or south > north:
+        raise GeoQueryError("範圍錯誤 (需 west <= east 且 south <= north)")
+    # 地圖縮得很小時範圍可能超出地球邊界，截到有效範圍
+    return max(west, -180.0), max(south, -90.0), min(east, 180.0), min(north, 90.0)
+
+
+def parse_zoom(value):
+    """解析縮放層級"""
+    if value in (None, ''):
+        raise GeoQueryError("必須提供 zoom")
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise GeoQueryError(f"zoom 必須是整數: {value}")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise GeoQueryError(f"zoom 必須介於 0 與 {MAX_ZOOM} 之間")
+    return zoom
+
+
+def grid_frame(ids, lats, lngs, service_ids, services, sign=1):
+    """
+    計算各層級、各服務 (含不限) 格子的機構數與座標總和
+
+    ids / lats / lngs 為機構座標 (座標無效者略過)，service_ids / services 為
+    (機構編號, 服務項目) 對照；sign 為 -1 時產生扣除用的負值。
+    回傳欄位為 service, precision, x, y, cell, total, lat_sum, lng_sum 的 DataFrame。
+    """
+    points = pd.DataFrame({
+        'id': np.asarray(ids, dtype=np.int64),
+        'lat': np.asarray(lats, dtype=np.float64),
+        'lng': np.asarray(lngs, dtype=np.float64),
+    })
+    with np.errstate(invalid='ignore'):
+        points = points[(points['lat'].abs() <= 90) & (points['lng'].abs() <= 180)]
+
+    by_service = pd.DataFrame({'id': np.asarray(service_ids, dtype=np.int64),
+                               'service': np.asarray(services, dtype=object)})
+    long = pd.concat([
+        points.assign(service=ANY),
+        points.merge(by_service, on='id'),
+    ], ignore_index=True)
+
+    frames = []
+    for precision in GRID_PRECISIONS:
+        x, y = cell_coords(long['lat'].to_numpy(), long['lng'].to_numpy(), precision)
+        grouped = long.assign(x=x, y=y).groupby(['service', 'x', 'y'], sort=False).agg(
+            total=('id', 'size'), lat_sum=('lat', 'sum'), lng_sum=('lng', 'sum')
+        ).reset_index()
+        grouped.insert(1, 'precision', precision)
+        grouped.insert(4, 'cell', geohash_cells(grouped['x'], grouped['y'], precision))
+        frames.append(grouped)
+
+    frame = pd.concat(frames, ignore_index=True)
+    if sign != 1:
+        frame[['total', 'lat_sum', 'lng_sum']] *= sign
+    return frame[GRID_COLUMNS]
+
+
+def create_grid_table(conn):
+    """建立網格統計表"""
+    conn.execute(GRID_SCHEMA_SQL)
+
+
+def _write_grid(conn, frame, sql=UPSERT_SQL):
+    # 逐欄轉成 Python 值再組成列，比 itertuples 快得多
+    conn.executemany(sql, zip(*(frame[column].tolist() for column in GRID_COLUMNS)))
+
+
+def _grid_source(conn, id_table=None):
+    """從資料庫讀出計算網格所需的座標與服務對照 (id_table 可限制只讀部分機構)"""
+    where = service_where = ''
+    if id_table:
+        where = f'WHERE id IN (SELECT id FROM {id_table})'
+        service_where = f'WHERE institution_id IN (SELECT id FROM {id_table})'
+    points = conn.execute(f'SELECT id, latitude, longitude FROM institutions {where}').fetchall()
+    services = conn.execute(
+        f'SELECT institution_id, service FROM institution_services {service_where}'
+    ).fetchall()
+    points = np.array(points, dtype=np.float64).reshape(-1, 3)
+    service_ids = [row[0] for row in services]
+    service_names = [row[1] for row in services]
+    return points[:, 0], points[:, 1], points[:, 2], service_ids, service_names
+
+
+def rebuild_grid(conn):
+    """依 institutions 重新計算網格統計表 (應在匯入的同一交易中呼叫)"""
+    conn.execute(f'DELETE FROM {GRID_TABLE}')
+    ids, lats, lngs, service_ids, services = _grid_source(conn)
+    frame = grid_frame(ids, lats, lngs, service_ids, services)
+    # 依主鍵順序寫入，B-tree 只需在尾端附加
+    _write_grid(conn, frame.sort_values(['service', 'precision', 'x', 'y']), INSERT_SQL)
+
+
+def adjust_grid(conn, id_table, sign):
+    """
+    依部分機構增減網格統計表 (增量匯入用)
+
+    與 facets.adjust_facets 相同：sign 為 -1 時在刪除資料前扣除，為 1 時在寫入後加回
+    """
+    ids, lats, lngs, service_ids, services = _grid_source(conn, id_table)
+    _write_grid(conn, grid_frame(ids, lats, lngs, service_ids, services, sign))
+    conn.execute(f'DELETE FROM {GRID_TABLE} WHERE total <= 0')
+
+
+def _cell_range(west, south, east, north, precision):
+    """地圖範圍涵蓋的格子整數座標區間 (x0, x1, y0, y1)"""
+    x, y = cell_coords(np.array([south, north]), np.array([west, east]), precision)
+    return int(x[0]), int(x[1]), int(y[0]), int(y[1])
+
+
+def _clusters(cells, totals, lat_sums, lng_sums):
+    return [
+        {'cell': cell, 'count': int(total),
+         'latitude': round(lat_sum / total, 6), 'longitude': round(lng_sum / total, 6)}
+        for cell, total, lat_sum, lng_sum in zip(cells, totals, lat_sums, lng_sums)
+    ]
+
+
+def query_grid(conn, west, south, east, north, precision, service=None):
+    """查詢地圖範圍內的格子，回傳聚合列表 (格子 geohash、機構數、中心點)"""
+    x0, x1, y0, y1 = _cell_range(west, south, east, north, precision)
+    rows = conn.execute(
+        f'SELECT cell, total, lat_sum, lng_sum FROM {GRID_TABLE} '
+        'WHERE service = ? AND precision = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ? '
+        'ORDER BY x, y',
+        (service or ANY, precision, x0, x1, y0, y1)
+    ).fetchall()
+    return _clusters(*zip(*rows)) if rows else []
+
+
+class GridIndex:
+    """記憶體中的網格統計 (CSV 版本使用)，查詢結果與 query_grid 相同"""
+
+    @classmethod
+    def from_dataframe(cls, df, services):
+        """df 為機構資料 (列索引即機構編號)，services 為拆分後的服務長表"""
+        return cls(grid_frame(df.index, df['緯度'], df['經度'], services.index, services.to_numpy()))
+
+    def __init__(self, frame):
+        self.groups = {}
+        for (service, precision), group in frame.groupby(['service', 'precision'], sort=False):
+            group = group.sort_values(['x', 'y'])
+            self.groups[(service, precision)] = {
+                column: group[column].to_numpy() for column in
+                ('x', 'y', 'cell', 'total', 'lat_sum', 'lng_sum')
+            }
+
+    def query(self, west, south, east, north, precision, service=None):
+        group = self.groups.get((service or ANY, precision))
+        if group is None:
+            return []
+        x0, x1, y0, y1 = _cell_range(west, south, east, north, precision)
+        start = int(np.searchsorted(group['x'], x0, side='left'))
+        end = int(np.searchsorted(group['x'], x1, side='right'))
+        y = group['y'][start:end]
+        selected = np.flatnonzero((y >= y0) & (y <= y1)) + start
+        return _clusters(group['cell'][selected].tolist(), group['total'][selected].tolist(),
+                         group['lat_sum'][selected].tolist(), group['lng_sum'][selected].tolist())
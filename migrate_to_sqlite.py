@@ -19,7 +19,7 @@ def backup_current_system():
     files_to_backup = [
         'app.py',
         'data/abc.csv',
-        'data/abc_processed.pkl',
+        'data/abc.snapshot',
         'real_city_mapping.json'
     ]
     
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+分頁工具
+以 (機構名稱, 編號) 做 keyset 分頁：游標記錄上一頁最後一筆，
+下一頁直接從該位置往後取，深層頁面的成本與第一頁相同
+"""
+
+import base64
+import json
+import threading
+from collections import OrderedDict
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# 每個篩選條件的總筆數快取上限
+COUNT_CACHE_SIZE = 1024
+
+
+class PaginationError(ValueError):
+    """分頁參數錯誤"""
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """解析每頁筆數參數"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError(f"limit 必須是整數: {value}")
+    if limit < 1:
+        raise PaginationError("limit 必須大於 0")
+    return min(limit, maximum)
+
+
+def encode_cursor(name, row_id):
+    """將最後一筆的 (名稱, 編號) 編成不透明游標字串"""
+    payload = json.dumps([name, row_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游標字串，回傳 (名稱, 編號)；沒有游標時回傳 None"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        name, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise PaginationError("cursor 格式錯誤")
+    if not isinstance(name, str) or not isinstance(row_id, int):
+        raise PaginationError("cursor 格式錯誤")
+    return name, row_id
+
+
+class TotalCountCache:
+    """
+    各篩選條件的總筆數快取 (LRU)
+
+    鍵值應包含資料集版本，資料更新後舊版本的筆數自然不再被命中。
+    """
+
+    def __init__(self, max_entries=COUNT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, total):
+        with self._lock:
+            self._entries[key] = total
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
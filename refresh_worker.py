@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+背景資料更新
+更新要求只建立工作並立即回傳工作編號，下載、解析、匯入在背景執行緒進行，
+查詢端可依工作編號取得進度與各階段耗時。
+同時間只執行一個更新工作：執行中收到的更新要求會併入同一個工作；
+另有排程執行緒定期檢查資料是否到期，到期時自動送出更新
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# 更新流程的階段 (依執行順序)
+PHASES = ('download', 'mapping', 'parse', 'import', 'index', 'swap')
+# 保留最近幾個工作的狀態供查詢
+KEEP_JOBS = 20
+# 排程執行緒檢查資料是否到期的間隔 (秒)
+CHECK_INTERVAL_SECONDS = 3600
+
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class RefreshJob:
+    """單一更新工作的狀態：queued -> running -> succeeded / failed"""
+
+    def __init__(self, trigger, options):
+        self.id = uuid.uuid4().hex[:12]
+        self.trigger = trigger
+        self.options = dict(options)
+        self.status = 'queued'
+        self.current_phase = None
+        self.phases = {}
+        self.result = {}
+        self.error = None
+        # 執行期間併入此工作的更新要求數
+        self.coalesced = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    @contextmanager
+    def phase(self, name):
+        """量測一個階段的耗時 (同名階段重複執行時累加)"""
+        self.current_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - start)
+            self.current_phase = None
+
+    def record_phase(self, name, seconds):
+        """記錄由其他模組量測的階段耗時 (例如匯入統計中的 parse / import / index)"""
+        self.phases[name] = round(self.phases.get(name, 0) + seconds, 3)
+
+    def to_dict(self):
+        finished = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'trigger': self.trigger,
+            'options': self.options,
+            'current_phase': self.current_phase,
+            'phases': {name: self.phases[name] for name in PHASES if name in self.phases},
+            'result': dict(self.result),
+            'error': self.error,
+            'coalesced_requests': self.coalesced,
+            'created_at': _format_time(self.created_at),
+            'started_at': _format_time(self.started_at),
+            'finished_at': _format_time(self.finished_at),
+            'seconds': round(finished - self.started_at, 3) if self.started_at else None,
+        }
+
+
+def job_phase(job, name):
+    """有工作時量測階段耗時，沒有工作 (例如啟動時同步匯入) 時不做任何事"""
+    return job.phase(name) if job is not None else nullcontext()
+
+
+class RefreshWorker:
+    """
+    更新工作管理
+
+    target(job, **options) 執行實際的更新，成功回傳 True；
+    失敗時回傳 False (可先設定 job.error 說明原因) 或直接拋出例外。
+    """
+
+    def __init__(self, target, keep_jobs=KEEP_JOBS):
+        self.target = target
+        self.keep_jobs = keep_jobs
+        self._jobs = OrderedDict()
+        self._current = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+
+    def submit(self, trigger='manual', **options):
+        """
+        送出更新要求，回傳 (工作, 是否併入執行中的工作)
+
+        已有工作在執行時不另外啟動，直接回傳該工作 (本次的 options 不生效)
+        """
+        with self._lock:
+            if self._current is not None and self._current.active:
+                self._current.coalesced += 1
+                return self._current, True
+
+            job = RefreshJob(trigger, options)
+            self._current = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+
+        threading.Thread(target=self._run, args=(job,), name=f'refresh-{job.id}', daemon=True).start()
+        return job, False
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        print(f"開始背景更新工作 {job.id} ({job.trigger})")
+        try:
+            success = self.target(job, **job.options)
+            if not success and job.error is None:
+                job.error = '資料更新失敗'
+        except Exception as e:
+            success = False
+            job.error = str(e)
+        finally:
+            job.current_phase = None
+            job.finished_at = time.time()
+
+        with self._lock:
+            job.status = 'succeeded' if success else 'failed'
+        timings = '，'.join(f"{name} {seconds} 秒" for name, seconds in job.to_dict()['phases'].items())
+        if success:
+            print(f"✓ 背景更新工作 {job.id} 完成 ({timings})")
+        else:
+            print(f"⚠ 背景更新工作 {job.id} 失敗: {job.error}")
+
+    def get(self, job_id):
+        """取得指定工作 (不存在或已被清除時回傳 None)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self):
+        """最近一次送出的工作"""
+        with self._lock:
+            return self._current
+
+    def start_scheduler(self, is_due, interval=CHECK_INTERVAL_SECONDS, **options):
+        """
+        啟動排程執行緒：每 interval 秒呼叫 is_due()，回傳 True 時送出更新工作
+
+        到期判斷由呼叫端決定 (例如資料超過 30 天未向來源確認)，
+        排程送出的工作與手動要求一樣會併入執行中的工作。
+        """
+        if self._scheduler is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    due = is_due()
+                except Exception as e:
+                    print(f"⚠ 檢查資料是否到期時發生錯誤: {e}")
+                    continue
+                if due:
+                    job, coalesced = self.submit('scheduled', **options)
+                    if not coalesced:
+                        print(f"資料已到期，已排程更新工作 {job.id}")
+
+        self._scheduler = threading.Thread(target=loop, name='refresh-scheduler', daemon=True)
+        self._scheduler.start()
+        print(f"✓ 已啟動資料更新排程 (每 {interval} 秒檢查一次)")
+
+    def stop_scheduler(self):
+        self._stop.set()
+        if self._scheduler is not None:
+            self._scheduler.join()
+            self._scheduler = None
+        self._stop.clear()
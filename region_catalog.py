@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+縣市 / 鄉鎮區目錄
+縣市鄉鎮區對照表載入 (或更新) 時一次序列化為不可變的回應內容：
+縣市列表、各縣市的鄉鎮區列表與包含全部縣市鄉鎮區的整包目錄，
+各附內容雜湊 ETag 並預先壓縮，請求時直接回傳，不必重新組成列表
+"""
+
+import json
+
+from flask import Response, request
+
+from compression import apply_encoding, compress, negotiate_encoding, supported_encodings
+from result_cache import CachedResult
+
+# 目錄只在對照表更新時變動，瀏覽器可直接使用一天，過期後以 ETag 確認
+CATALOG_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def serialize_entry(value):
+    """序列化為 JSON 並預先產生所有支援的壓縮內容"""
+    body = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    entry = CachedResult(body, 'application/json')
+    if entry.compressible:
+        for encoding in supported_encodings():
+            entry.encoded[encoding] = compress(body, encoding)
+    return entry
+
+
+class RegionCatalog:
+    """
+    由 {縣市代碼: {'name': 名稱, 'districts': {鄉鎮區代碼: 名稱}}} 建立的目錄
+
+    建立後不再變動，對照表更新時建立新的目錄整個替換
+    """
+
+    def __init__(self, mapping):
+        cities = []
+        self.districts = {}
+        for code, city in mapping.items():
+            districts = [{'code': d_code, 'name': d_name} for d_code, d_name in city['districts'].items()]
+            cities.append({'code': code, 'name': city['name'], 'districts': districts})
+            self.districts[code] = serialize_entry(districts)
+
+        self.cities = serialize_entry([{'code': city['code'], 'name': city['name']} for city in cities])
+        self.bundle = serialize_entry({'cities': cities})
+        self.empty = serialize_entry([])
+        self.city_count = len(cities)
+        self.district_count = sum(len(city['districts']) for city in cities)
+
+    def district_entry(self, city_code):
+        """指定縣市的鄉鎮區列表 (不存在的縣市回傳空列表)"""
+        return self.districts.get(city_code, self.empty)
+
+    def info(self):
+        return {
+            'cities': self.city_count,
+            'districts': self.district_count,
+            'etag': self.bundle.etag,
+        }
+
+
+def catalog_response(entry):
+    """回傳目錄內容，附 ETag 與長時間的 Cache-Control，If-None-Match 符合時回傳 304"""
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = CATALOG_CACHE_CONTROL
+    if entry.encoded:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding()
+        if encoding is not None:
+            apply_encoding(response, entry.encoded[encoding], encoding)
+    return response.make_conditional(request)
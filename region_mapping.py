@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+縣市區域對照表產生
+匯入時由資料本身推導「區域代碼 -> 區域名稱」：對全部地址做一次向量化的 str.extract，
+取出縣市名稱之後的區域名稱，再依 (縣市, 區域代碼, 名稱) 分組計數，
+每個區域代碼採用出現最多次的名稱。對照表與資料集一起寫入，提供的對照表不會與資料脫節
+"""
+
+import json
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+# 對照表檔案 (CSV 版本與舊工具讀取)
+MAPPING_FILE = 'real_city_mapping.json'
+
+# 縣市代碼 -> 名稱 (順序即為對照表中的縣市順序)
+CITY_NAMES = {
+    '63000': '臺北市',
+    '64000': '高雄市',
+    '65000': '新北市',
+    '66000': '桃園市',
+    '67000': '臺中市',
+    '68000': '臺南市',
+    '10002': '宜蘭縣',
+    '10004': '新竹縣',
+    '10005': '苗栗縣',
+    '10007': '彰化縣',
+    '10008': '南投縣',
+    '10009': '雲林縣',
+    '10010': '嘉義縣',
+    '10013': '屏東縣',
+    '10014': '臺東縣',
+    '10015': '花蓮縣',
+    '10016': '澎湖縣',
+    '10017': '基隆市',
+    '10018': '新竹市',
+    '10020': '嘉義市',
+    '9007': '連江縣',
+    '9020': '金門縣',
+}
+
+# 資料庫中的對照表 (與機構資料在同一個版本檔、同一個交易中寫入)
+REGION_MAPPING_TABLE = 'region_mapping'
+REGION_MAPPING_SCHEMA_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {REGION_MAPPING_TABLE} (
+        city_code TEXT NOT NULL,
+        district_code TEXT NOT NULL,
+        city_name TEXT NOT NULL,
+        district_name TEXT NOT NULL,
+        institutions INTEGER NOT NULL,
+        PRIMARY KEY (city_code, district_code)
+    ) WITHOUT ROWID
+'''
+
+# 地址讀取欄位 (推導對照表只需要這三欄)
+MAPPING_COLUMNS = ['縣市', '區', '地址全址']
+
+
+def _name_to_city_code():
+    """縣市名稱的各種寫法 (臺/台) -> 縣市代碼"""
+    names = {}
+    for code, name in CITY_NAMES.items():
+        for variant in (name, name.replace('臺', '台')):
+            names[variant] = code
+    return names
+
+
+CITY_NAME_CODES = _name_to_city_code()
+# 縣市名稱後接 1-3 個非數字字元與行政區字尾；貪婪比對，「新市區」不會被截成「新市」，
+# 偶有多取 (例如「大安區市民大道」取成「大安區市」) 由分組計數的多數決排除
+ADDRESS_PATTERN = re.compile(
+    '(?P<city>{})\\s*(?P<district>[^\\W\\d_]{{1,3}}[區市鎮鄉])'.format(
+        '|'.join(re.escape(n) for n in sorted(CITY_NAME_CODES, key=len, reverse=True))
+    )
+)
+
+
+def district_name_counts(df):
+    """
+    計算每個 (縣市代碼, 區域代碼, 地址中的區域名稱) 的筆數
+
+    df 需有 縣市、區、地址全址 欄位 (區域代碼已正規化)。地址中的縣市名稱
+    與該列縣市代碼不一致的資料不列入。回傳以三者為索引的筆數 Series。
+    """
+    extracted = df['地址全址'].astype('string').str.extract(ADDRESS_PATTERN)
+    city_codes = extracted['city'].map(CITY_NAME_CODES)
+    keep = (
+        city_codes.eq(df['縣市']).fillna(False).astype(bool)
+        & extracted['district'].notna()
+        & df['區'].notna()
+        & df['區'].ne('nan')
+    )
+    return (
+        pd.DataFrame({
+            'city_code': df['縣市'][keep],
+            'district_code': df['區'][keep],
+            'district_name': extracted['district'][keep].astype(object),
+        })
+        .groupby(['city_code', 'district_code', 'district_name'], sort=False)
+        .size()
+    )
+
+
+class MappingBuilder:
+    """逐塊累計區域名稱筆數，最後產生對照表 (分塊匯入時使用)"""
+
+    def __init__(self):
+        self._counts = []
+
+    def add(self, df):
+        counts = district_name_counts(df)
+        if len(counts):
+            self._counts.append(counts)
+
+    def counts(self):
+        """每個 (縣市代碼, 區域代碼) 的多數名稱與筆數 DataFrame"""
+        if not self._counts:
+            return pd.DataFrame(columns=['city_code', 'district_code', 'district_name', 'institutions'])
+        counts = pd.concat(self._counts).groupby(level=[0, 1, 2], sort=False).sum()
+        counts = counts.rename('institutions').reset_index()
+        # 同一代碼取筆數最多的名稱 (筆數相同時取名稱排序較前者，結果不受資料順序影響)
+        counts = counts.sort_values(
+            ['city_code', 'district_code', 'institutions', 'district_name'],
+            ascending=[True, True, False, True]
+        )
+        return counts.drop_duplicates(['city_code', 'district_code']).reset_index(drop=True)
+
+    def mapping(self):
+        """產生 {縣市代碼: {'name': 名稱, 'districts': {區域代碼: 名稱}}}"""
+        return counts_to_mapping(self.counts())
+
+
+def counts_to_mapping(counts):
+    """由多數名稱表組成對照表 (縣市依 CITY_NAMES 順序，區域依代碼排序)"""
+    districts = {}
+    for city_code, district_code, district_name in zip(
+        counts['city_code'], counts['district_code'], counts['district_name']
+    ):
+        districts.setdefault(city_code, {})[district_code] = district_name
+    return {
+        code: {'name': name, 'districts': districts[code]}
+        for code, name in CITY_NAMES.items() if code in districts
+    }
+
+
+def derive_mapping(df):
+    """由完整的 DataFrame 推導對照表"""
+    builder = MappingBuilder()
+    builder.add(df)
+    return builder.mapping()
+
+
+def create_region_mapping_table(conn):
+    conn.execute(REGION_MAPPING_SCHEMA_SQL)
+
+
+def save_region_mapping(conn, counts):
+    """以多數名稱表取代資料庫中的對照表 (應在匯入的同一交易中呼叫)"""
+    conn.execute(f'DELETE FROM {REGION_MAPPING_TABLE}')
+    conn.executemany(
+        f'INSERT INTO {REGION_MAPPING_TABLE} '
+        '(city_code, district_code, city_name, district_name, institutions) VALUES (?, ?, ?, ?, ?)',
+        [
+            (city_code, district_code, CITY_NAMES.get(city_code, city_code), district_name, int(n))
+            for city_code, district_code, district_name, n in zip(
+                counts['city_code'], counts['district_code'],
+                counts['district_name'], counts['institutions']
+            )
+        ]
+    )
+
+
+def load_region_mapping(conn):
+    """讀取資料庫中的對照表 (沒有對照表時回傳 None)"""
+    try:
+        rows = conn.execute(
+            f'SELECT city_code, district_code, district_name FROM {REGION_MAPPING_TABLE} '
+            'ORDER BY city_code, district_code'
+        ).fetchall()
+    except sqlite3.OperationalError:  # 舊版資料庫沒有對照表
+        return None
+    if not rows:
+        return None
+    counts = pd.DataFrame(
+        [tuple(row) for row in rows], columns=['city_code', 'district_code', 'district_name']
+    )
+    return counts_to_mapping(counts)
+
+
+def write_mapping_file(mapping, path=MAPPING_FILE):
+    """
+    以原子方式寫入對照表檔案 (先寫暫存檔再改名)
+
+    內容與現有檔案相同時不改寫，回傳是否有寫入
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if json.load(f) == mapping:
+                return False
+    except (OSError, ValueError):
+        pass
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(mapping, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return True
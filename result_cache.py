@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+查詢結果快取
+常見的篩選組合直接回傳快取的 JSON 內容，不必重新查詢與序列化；
+回應附帶以內容雜湊計算的強 ETag，瀏覽器與代理伺服器可用 If-None-Match 取得 304；
+壓縮後的內容也一併快取，命中時不必重新壓縮
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+from compression import (
+    COMPRESSIBLE_MIMETYPES, MIN_COMPRESS_BYTES, apply_encoding, compress, negotiate_encoding
+)
+
+# 快取內容總大小上限 (bytes)
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# 單筆超過上限的此比例時不快取，避免一筆大結果擠掉其他常用結果
+MAX_ENTRY_RATIO = 0.25
+# 每筆項目除了內容以外的估計額外成本 (鍵值、字典與物件)
+ENTRY_OVERHEAD = 256
+
+
+class CachedResult:
+    """快取的回應內容與其 ETag"""
+
+    __slots__ = ('body', 'mimetype', 'etag', 'size', 'encoded')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        # 強 ETag：內容相同 (不論資料集版本) 時即相同，內容不同時必定不同
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.size = len(body) + ENTRY_OVERHEAD
+        # 壓縮方式 -> 壓縮後的內容 (第一次以該方式回應時才產生)
+        self.encoded = {}
+
+    @property
+    def compressible(self):
+        return self.mimetype in COMPRESSIBLE_MIMETYPES and len(self.body) >= MIN_COMPRESS_BYTES
+
+
+class ResultCache:
+    """
+    以位元組數為上限的 LRU 查詢結果快取
+
+    鍵值由呼叫端組成，應包含資料集版本與正規化後的查詢參數。
+    資料更新後呼叫 invalidate()：清除所有項目並遞增世代，
+    更新前開始、更新後才完成的查詢不會再寫入快取。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'skipped': 0, 'invalidations': 0}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, body, mimetype='application/json', generation=None):
+        """
+        寫入快取並回傳 CachedResult
+
+        generation 為查詢開始時的世代，期間資料已更新 (世代不同) 或內容過大時不寫入，
+        仍回傳 CachedResult 供本次回應使用。
+        """
+        entry = CachedResult(body, mimetype)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry
+            if entry.size > self.max_bytes * MAX_ENTRY_RATIO:
+                self._stats['skipped'] += 1
+                return entry
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+        return entry
+
+    def encoded(self, key, entry, encoding):
+        """取得項目以指定方式壓縮的內容，第一次產生後保存在項目中並計入快取大小"""
+        with self._lock:
+            body = entry.encoded.get(encoding)
+        if body is not None:
+            return body
+
+        body = compress(entry.body, encoding)
+        with self._lock:
+            if encoding not in entry.encoded:
+                entry.encoded[encoding] = body
+                if self._entries.get(key) is entry:
+                    entry.size += len(body)
+                    self._bytes += len(body)
+                    self._evict()
+        return body
+
+    def _evict(self):
+        """淘汰最久未使用的項目直到總大小不超過上限 (需持有鎖)"""
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats['evictions'] += 1
+
+    def invalidate(self):
+        """資料更新後清除所有項目"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """快取統計 (命中、未命中、淘汰次數與目前大小)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+
+def cached_response(cache, key, build):
+    """
+    以快取回應查詢
+
+    未命中時呼叫 build() 產生 Flask 回應，只有 200 回應會寫入快取。
+    回應附帶 ETag 與 Cache-Control: no-cache (每次使用前都需向伺服器確認)，
+    請求的 If-None-Match 符合時回傳 304。用戶端接受壓縮時回傳快取中的壓縮內容，
+    ETag 加上編碼後綴。
+    """
+    entry = cache.get(key)
+    status = 'HIT'
+    if entry is None:
+        generation = cache.generation
+        response = build()
+        if response.status_code != 200:
+            return response
+        entry = cache.put(key, response.get_data(), response.mimetype, generation)
+        status = 'MISS'
+
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    if entry.compressible:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding()
+        if encoding is not None:
+            apply_encoding(response, cache.encoded(key, entry, encoding), encoding)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Cache'] = status
+    return response.make_conditional(request)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+記憶體倒排索引 (CSV 版本使用)
+資料載入時為每個縣市、標準區域與服務項目建立排序好的列號陣列 (NumPy)，
+查詢只需做陣列交集，不必複製或逐列掃描整個 DataFrame
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _postings(values, ranks):
+    """
+    依欄位值分組，回傳 {值: 名次陣列}
+
+    ranks 須已遞增排序；groupby.indices 保留出現順序，各組的名次因此也是遞增的。
+    """
+    groups = pd.Series(ranks).groupby(values, sort=False).indices
+    return {key: ranks[positions] for key, positions in groups.items()}
+
+
+class InvertedIndex:
+    """
+    以 (機構名稱, 編號) 排序名次為列號的倒排索引
+
+    所有列號陣列都是名次，交集結果本身就依名稱排好序：
+    分頁只需在結果陣列上二分搜尋游標位置，再切出 limit 筆。
+    """
+
+    def __init__(self, df, services, districts):
+        """
+        df 為機構資料，districts 為與 df 同順序的標準區域代碼，
+        services 為拆分後的服務長表 (索引對應 df 的列索引，見 service_types.split_services)
+        """
+        names = df['機構名稱'].fillna('').astype(str).to_numpy()
+        ids = df.index.to_numpy()
+        # order[名次] = DataFrame 中的位置
+        self.order = np.lexsort((ids, names))
+        self.sorted_names = names[self.order]
+        self.sorted_ids = ids[self.order]
+        self.size = len(df)
+
+        # rank_of[位置] = 名次
+        rank_of = np.empty(self.size, dtype=np.int64)
+        rank_of[self.order] = np.arange(self.size, dtype=np.int64)
+
+        all_ranks = np.arange(self.size, dtype=np.int64)
+        self.by_city = _postings(df['縣市'].to_numpy()[self.order], all_ranks)
+        self.by_district = _postings(np.asarray(districts)[self.order], all_ranks)
+
+        service_ranks = rank_of[df.index.get_indexer(services.index)]
+        by_rank = np.argsort(service_ranks, kind='stable')
+        self.by_service = _postings(services.to_numpy()[by_rank], service_ranks[by_rank])
+
+    def rank_after(self, name, row_id):
+        """游標 (名稱, 編號) 之後第一筆的名次"""
+        start = int(np.searchsorted(self.sorted_names, name, side='left'))
+        end = int(np.searchsorted(self.sorted_names, name, side='right'))
+        return start + int(np.searchsorted(self.sorted_ids[start:end], row_id, side='right'))
+
+    def match(self, city_code=None, district_code=None, service=None, service_fallback=None,
+              row_filter=None):
+        """
+        回傳符合條件的名次陣列 (遞增)；沒有任何條件時回傳 None 代表全部
+
+        service 不在索引中時，若提供 service_fallback (以 DataFrame 位置計算的布林陣列)，
+        改用它篩選；否則視為沒有符合的機構。row_filter 為其他條件 (例如關鍵字) 的布林陣列。
+        """
+        empty = np.empty(0, dtype=np.int64)
+        postings = []
+        if city_code:
+            postings.append(self.by_city.get(city_code, empty))
+        if district_code:
+            postings.append(self.by_district.get(district_code, empty))
+        if service:
+            if service in self.by_service:
+                postings.append(self.by_service[service])
+            elif service_fallback is not None:
+                postings.append(np.flatnonzero(service_fallback[self.order]))
+            else:
+                postings.append(empty)
+        if row_filter is not None:
+            postings.append(np.flatnonzero(row_filter[self.order]))
+        if not postings:
+            return None
+
+        # 由最短的陣列開始，以二分搜尋檢查是否出現在其他陣列中：
+        # 成本只與最短陣列的長度有關 (k log m)，不必合併整個長陣列
+        postings.sort(key=len)
+        result = postings[0]
+        for other in postings[1:]:
+            if not len(result) or not len(other):
+                return empty
+            positions = np.minimum(np.searchsorted(other, result), len(other) - 1)
+            result = result[other[positions] == result]
+        return result
+
+    def page(self, ranks, limit, cursor=None):
+        """
+        從結果中取出游標之後的 limit 筆
+
+        回傳 (DataFrame 位置陣列, 總筆數, 是否還有下一頁)
+        """
+        start = self.rank_after(*cursor) if cursor else 0
+        if ranks is None:
+            total = self.size
+            selected = np.arange(start, min(start + limit + 1, self.size), dtype=np.int64)
+        else:
+            total = len(ranks)
+            offset = int(np.searchsorted(ranks, start, side='left'))
+            selected = ranks[offset:offset + limit + 1]
+        has_more = len(selected) > limit
+        return self.order[selected[:limit]], total, has_more
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+特約服務項目對照
+將「特約服務項目」的分號分隔字串拆成個別服務，並為每項服務配置一個位元，
+讓服務篩選變成等值查詢或位元運算，不再需要子字串比對
+"""
+
+import pandas as pd
+
+# 服務項目分隔符號
+SERVICE_SEPARATOR = ';'
+
+# 已知服務項目 (依此順序配置位元 0, 1, 2, ...)，資料中出現的其他項目接續配置
+KNOWN_SERVICES = [
+    '居家服務',
+    '喘息服務',
+    '巷弄長照站',
+    '日間照顧',
+    '住宿式服務',
+    '專業照護服務',
+    '家庭托顧',
+    '專業服務',
+    '交通接送',
+    '輔具服務',
+    '居家無障礙環境改善',
+    '營養餐飲',
+]
+
+# SQLite INTEGER 為有號 64 位元，只使用 0~62 位元避免出現負數
+MAX_SERVICE_BITS = 63
+
+
+class ServiceRegistry:
+    """服務項目 -> 位元編號對照表"""
+
+    def __init__(self, names=None):
+        self.bits = {}
+        for name in (KNOWN_SERVICES if names is None else names):
+            self.add(name)
+
+    def add(self, name):
+        """登錄服務項目並回傳位元編號，位元已用完時回傳 None"""
+        if name in self.bits:
+            return self.bits[name]
+        if len(self.bits) >= MAX_SERVICE_BITS:
+            return None
+        self.bits[name] = len(self.bits)
+        return self.bits[name]
+
+    def bit(self, name):
+        """取得服務項目的位元編號 (未登錄回傳 None)"""
+        return self.bits.get(name)
+
+    def mask(self, name):
+        """取得服務項目的位元遮罩 (未登錄回傳 None)"""
+        bit = self.bits.get(name)
+        return None if bit is None else 1 << bit
+
+    def items(self):
+        return self.bits.items()
+
+    def __contains__(self, name):
+        return name in self.bits
+
+    def __len__(self):
+        return len(self.bits)
+
+
+def split_services(series):
+    """
+    將服務項目欄位拆成 (資料列索引, 服務名稱) 的長表
+
+    回傳以原資料列索引為 index 的 Series，同一列重複的服務只保留一筆。
+    """
+    exploded = series.fillna('').astype(str).str.split(SERVICE_SEPARATOR).explode().str.strip()
+    exploded = exploded[exploded != '']
+    pairs = pd.DataFrame({'row': exploded.index, 'service': exploded.to_numpy()}).drop_duplicates()
+    return pd.Series(pairs['service'].to_numpy(), index=pairs['row'].to_numpy())
+
+
+def compute_service_masks(series, registry):
+    """
+    計算每列的服務位元遮罩
+
+    未登錄的服務會自動登錄到 registry；回傳 (遮罩 Series, 拆分後的長表)。
+    """
+    services = split_services(series)
+    for name in services.unique():
+        registry.add(name)
+    bit_values = services.map(registry.mask).dropna().astype('int64')
+    masks = bit_values.groupby(level=0).sum().reindex(series.index, fill_value=0)
+    return masks.astype('int64'), services
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+欄式資料快照
+將清理後的 DataFrame 以欄為單位寫成單一檔案，啟動時以 mmap 讀回：
+數值欄位與列索引直接對應到檔案頁面 (多個行程共用同一份頁面快取)；
+字串欄位以字典編碼儲存，讀取時只需解碼不重複的值，但解碼後的物件陣列為各行程私有
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'LTCSNAP1'
+# 格式版本，檔案結構變更時遞增；版本不符的快照會被忽略並重新解析CSV
+FORMAT_VERSION = 1
+# 各欄位資料區塊的對齊位元組數
+ALIGNMENT = 64
+
+_HEADER_PREFIX = struct.Struct('<8sQ')  # magic, 標頭長度
+
+
+class SnapshotError(Exception):
+    """快照無法寫入 (例如欄位型別不支援)"""
+
+
+def source_signature(source_file):
+    """來源CSV的識別資訊 (大小與修改時間)，CSV 變更後舊快照即失效"""
+    stat = os.stat(source_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _encode_column(series):
+    """
+    將欄位轉成 (欄位描述, 資料區塊列表)
+
+    數值欄位直接存原始陣列；字串欄位存 int32 代碼 + 不重複值 (定長 UCS-4 陣列，
+    讀取時可在 C 層一次轉成 Python 字串)，缺值的代碼為 -1。
+    """
+    if series.dtype != object:
+        values = np.ascontiguousarray(series.to_numpy())
+        if values.dtype.kind not in 'biuf':
+            raise SnapshotError(f"不支援的欄位型別: {series.name} ({values.dtype})")
+        return {'kind': 'numeric', 'dtype': values.dtype.str}, [values]
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = list(uniques)
+    if not all(isinstance(value, str) for value in uniques):
+        raise SnapshotError(f"字串欄位含非字串值: {series.name}")
+    dictionary = np.array(uniques, dtype=str) if uniques else np.empty(0, dtype='U1')
+    return {'kind': 'dictionary', 'size': len(uniques)}, [codes.astype(np.int32), dictionary]
+
+
+def write_snapshot(df, path, source_file):
+    """
+    將 DataFrame 寫成快照檔
+
+    先寫入暫存檔、fsync 後再以 os.replace 取代，讀取端不會看到寫到一半的檔案。
+    """
+    columns = []
+    blocks = []
+    index_meta, index_blocks = _encode_column(pd.Series(df.index.to_numpy(), name='index'))
+    for name, meta, column_blocks in [(None, index_meta, index_blocks)] + [
+            (name,) + _encode_column(df[name]) for name in df.columns]:
+        meta = dict(meta, name=name, blocks=[])
+        for block in column_blocks:
+            meta['blocks'].append({'dtype': block.dtype.str, 'count': len(block)})
+            blocks.append(block)
+        columns.append(meta)
+
+    # 計算各區塊位移 (相對於資料區起點)
+    offset = 0
+    block_iter = iter(blocks)
+    for meta in columns:
+        for block_meta in meta['blocks']:
+            block = next(block_iter)
+            offset = _align(offset)
+            block_meta['offset'] = offset
+            offset += block.nbytes
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'source': source_signature(source_file),
+        'rows': len(df),
+        'columns': columns,
+    }, ensure_ascii=False).encode('utf-8')
+    data_start = _align(_HEADER_PREFIX.size + len(header))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER_PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        position = _HEADER_PREFIX.size + len(header)
+        block_iter = iter(blocks)
+        for meta in columns:
+            for block_meta in meta['blocks']:
+                block = next(block_iter)
+                target = data_start + block_meta['offset']
+                f.write(b'\0' * (target - position))
+                f.write(block.tobytes())
+                position = target + block.nbytes
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_header(mm):
+    magic, header_length = _HEADER_PREFIX.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError("不是快照檔")
+    header = json.loads(mm[_HEADER_PREFIX.size:_HEADER_PREFIX.size + header_length])
+    return header, _align(_HEADER_PREFIX.size + header_length)
+
+
+def _decode_column(mm, meta, data_start):
+    arrays = [
+        np.frombuffer(mm, dtype=block['dtype'], count=block['count'],
+                      offset=data_start + block['offset'])
+        for block in meta['blocks']
+    ]
+    if meta['kind'] == 'numeric':
+        return arrays[0]
+
+    codes, dictionary = arrays
+    # 最後多放一個 NaN，代碼 -1 的缺值直接對應到它
+    values = np.empty(meta['size'] + 1, dtype=object)
+    values[:-1] = dictionary
+    values[-1] = np.nan
+    return values[codes]
+
+
+def read_snapshot(path, source_file):
+    """
+    讀取快照檔，回傳 DataFrame
+
+    檔案不存在、格式版本不符或來源CSV已變更時回傳 None，呼叫端應重新解析CSV。
+    數值欄位為唯讀的 mmap 陣列，不會複製到行程私有記憶體；呼叫端不可對回傳的 DataFrame
+    增加或修改欄位 (pandas 會整個複製，mmap 欄位因此變成私有記憶體)。
+    字串欄位解碼為物件陣列 (重複的值共用同一個字串物件)，屬於行程私有記憶體。
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header, data_start = _read_header(mm)
+        if header.get('format_version') != FORMAT_VERSION:
+            print(f"⚠ 快照格式版本不符 ({header.get('format_version')})，重新解析CSV")
+            return None
+        if header.get('source') != source_signature(source_file):
+            print("⚠ CSV 檔案已變更，重新解析CSV")
+            return None
+
+        index_meta, *column_metas = header['columns']
+        index = _decode_column(mm, index_meta, data_start)
+        data = {meta['name']: _decode_column(mm, meta, data_start) for meta in column_metas}
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"⚠ 無法讀取快照檔，重新解析CSV: {e}")
+        return None
+
+    # 每欄各自成為一個區塊，避免 pandas 合併同型別欄位時複製 mmap 陣列
+    df = pd.concat(
+        [pd.Series(values, index=index, name=name, copy=False) for name, values in data.items()],
+        axis=1, copy=False
+    )
+    return df
@@ -3,6 +3,12 @@
 class LTCSearchApp {
     constructor() {
         this.apiBase = '/api';
+        this.searchParams = null;
+        this.nextCursor = null;
+        // 縣市代碼 -> 鄉鎮區列表 (啟動時由 /api/regions 一次載入)
+        this.districtsByCity = {};
+        // 自動完成：只保留最後一次輸入的請求結果
+        this.suggestRequest = 0;
         this.init();
     }
 
@@ -16,12 +22,49 @@ class LTCSearchApp {
             e.preventDefault();
             this.searchInstitutions();
         });
+        document.getElementById('keywordInput').addEventListener('input', (e) => {
+            this.loadSuggestions(e.target.value);
+        });
+    }
+
+    async loadSuggestions(prefix) {
+        const request = ++this.suggestRequest;
+        const datalist = document.getElementById('nameSuggestions');
+        if (!prefix.trim()) {
+            datalist.innerHTML = '';
+            return;
+        }
+
+        try {
+            const params = new URLSearchParams({ prefix, limit: 10 });
+            const cityCode = document.getElementById('citySelect').value;
+            if (cityCode) params.append('city', cityCode);
+
+            const response = await fetch(`${this.apiBase}/suggest?${params}`);
+            const data = await response.json();
+            // 較早送出的請求較晚回來時不覆蓋目前的建議
+            if (request !== this.suggestRequest || data.error) return;
+
+            datalist.innerHTML = '';
+            data.suggestions.forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.name;
+                datalist.appendChild(option);
+            });
+        } catch (error) {
+            console.error('載入名稱建議失敗:', error);
+        }
     }
 
     async loadCities() {
         try {
-            const response = await fetch(`${this.apiBase}/cities`);
-            const cities = await response.json();
+            const response = await fetch(`${this.apiBase}/regions`);
+            const { cities } = await response.json();
+            
+            this.districtsByCity = {};
+            cities.forEach(city => {
+                this.districtsByCity[city.code] = city.districts;
+            });
             
             const citySelect = document.getElementById('citySelect');
             citySelect.innerHTML = '<option value="">請選擇縣市</option>';
@@ -38,7 +81,7 @@ class LTCSearchApp {
         }
     }
 
-    async loadDistricts() {
+    loadDistricts() {
         const cityCode = document.getElementById('citySelect').value;
         const districtSelect = document.getElementById('districtSelect');
         
@@ -46,26 +89,20 @@ class LTCSearchApp {
         
         if (!cityCode) return;
 
-        try {
-            const response = await fetch(`${this.apiBase}/districts/${cityCode}`);
-            const districts = await response.json();
-            
-            districts.forEach(district => {
-                const option = document.createElement('option');
-                option.value = district.code;
-                option.textContent = district.name;
-                districtSelect.appendChild(option);
-            });
-        } catch (error) {
-            console.error('載入區域資料失敗:', error);
-            this.showAlert('載入區域資料失敗', 'danger');
-        }
+        // 鄉鎮區已隨縣市目錄一併載入，不需再向伺服器查詢
+        (this.districtsByCity[cityCode] || []).forEach(district => {
+            const option = document.createElement('option');
+            option.value = district.code;
+            option.textContent = district.name;
+            districtSelect.appendChild(option);
+        });
     }
 
     async searchInstitutions() {
         const cityCode = document.getElementById('citySelect').value;
         const districtCode = document.getElementById('districtSelect').value;
         const serviceType = document.getElementById('serviceType').value;
+        const keyword = document.getElementById('keywordInput').value.trim();
 
         // 顯示載入指示器
         this.showLoading(true);
@@ -76,6 +113,9 @@ class LTCSearchApp {
             if (cityCode) params.append('city', cityCode);
             if (districtCode) params.append('district', districtCode);
             if (serviceType) params.append('service_type', serviceType);
+            if (keyword) params.append('keyword', keyword);
+            // 欄式格式：欄位名稱只傳一次，重複值以字典編碼
+            params.append('format', 'columnar');
 
             const response = await fetch(`${this.apiBase}/institutions?${params}`);
             const data = await response.json();
@@ -84,20 +124,55 @@ class LTCSearchApp {
                 throw new Error(data.error);
             }
 
-            this.displayResults(data.institutions);
+            this.searchParams = params;
+            this.setNextCursor(data.next_cursor);
+            this.displayResults(decodeColumnar(data.institutions));
             this.showStats(data.total);
         } catch (error) {
             console.error('搜尋失敗:', error);
             this.showAlert('搜尋失敗: ' + error.message, 'danger');
+            this.setNextCursor(null);
             this.displayResults([]);
         } finally {
             this.showLoading(false);
         }
     }
 
-    displayResults(institutions) {
+    async loadMore() {
+        if (!this.searchParams || !this.nextCursor) return;
+
+        const params = new URLSearchParams(this.searchParams);
+        params.append('cursor', this.nextCursor);
+
+        try {
+            const response = await fetch(`${this.apiBase}/institutions?${params}`);
+            const data = await response.json();
+
+            if (data.error) {
+                throw new Error(data.error);
+            }
+
+            this.setNextCursor(data.next_cursor);
+            this.displayResults(decodeColumnar(data.institutions), true);
+        } catch (error) {
+            console.error('載入更多失敗:', error);
+            this.showAlert('載入更多失敗: ' + error.message, 'danger');
+        }
+    }
+
+    setNextCursor(cursor) {
+        this.nextCursor = cursor || null;
+        document.getElementById('loadMoreContainer').style.display = this.nextCursor ? 'block' : 'none';
+    }
+
+    displayResults(institutions, append = false) {
         const container = document.getElementById('resultsContainer');
         
+        if (append) {
+            container.insertAdjacentHTML('beforeend', institutions.map(institution => this.createInstitutionCard(institution)).join(''));
+            return;
+        }
+
         if (institutions.length === 0) {
             container.innerHTML = `
                 <div class="text-center py-5">
@@ -210,11 +285,33 @@ class LTCSearchApp {
     }
 }
 
+// 將欄式回應 (columns / values / dictionaries) 還原為逐筆物件
+function decodeColumnar(result) {
+    const columns = result.columns.map((name, i) => {
+        const dictionary = result.dictionaries[name];
+        const values = result.values[i];
+        return dictionary ? values.map(index => dictionary[index]) : values;
+    });
+    const rows = [];
+    for (let row = 0; row < result.count; row++) {
+        const institution = {};
+        result.columns.forEach((name, i) => {
+            institution[name] = columns[i][row];
+        });
+        rows.push(institution);
+    }
+    return rows;
+}
+
 // 全域函數
 function loadDistricts() {
     app.loadDistricts();
 }
 
+function loadMore() {
+    app.loadMore();
+}
+
 function showMap(lat, lng, name) {
     const url = `https://www.google.com/maps?q=${lat},${lng}&z=15&t=m`;
     window.open(url, '_blank');
@@ -290,6 +387,7 @@ async function refreshData() {
     
     try {
         app.showLoading(true);
+        // 更新在伺服器背景執行，先取得工作編號再輪詢進度
         const response = await fetch('/api/refresh-data');
         const data = await response.json();
         
@@ -297,7 +395,18 @@ async function refreshData() {
             throw new Error(data.error);
         }
         
-        app.showAlert(`資料強制更新成功！共載入 ${data.total_records.toLocaleString()} 筆機構資料<br>更新時間: ${data.update_time}`, 'success');
+        const job = await waitForRefreshJob(data.status_url);
+        if (job.status !== 'succeeded') {
+            throw new Error(job.error || '資料更新失敗');
+        }
+        
+        const phases = Object.entries(job.phases)
+            .map(([name, seconds]) => `${name} ${seconds} 秒`)
+            .join('、');
+        const message = job.result.skipped
+            ? '資料來源未變更，沿用現有資料'
+            : `資料強制更新成功！共載入 ${job.result.total_records.toLocaleString()} 筆機構資料`;
+        app.showAlert(`${message}<br>更新時間: ${job.finished_at}<br>各階段耗時: ${phases}`, 'success');
     } catch (error) {
         app.showAlert('資料更新失敗: ' + error.message, 'danger');
     } finally {
@@ -305,5 +414,21 @@ async function refreshData() {
     }
 }
 
+// 輪詢背景更新工作，直到完成或失敗
+async function waitForRefreshJob(statusUrl, interval = 1000) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const job = await response.json();
+        
+        if (job.error && !job.status) {
+            throw new Error(job.error);
+        }
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // 初始化應用程式
 const app = new LTCSearchApp();
\ No newline at end of file
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+機構名稱自動完成
+資料載入 (或更新) 時將正規化的機構名稱與常見簡稱 (去掉「財團法人」「○○市私立」等前綴、
+「附設」之後的名稱) 排序成陣列，查詢時以 bisect 找出前綴範圍，只取前 limit 筆；
+每次按鍵的查詢不需存取資料庫或 DataFrame
+"""
+
+import bisect
+import re
+import sqlite3
+
+from region_mapping import CITY_NAMES
+from text_normalize import normalize_text
+
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+MAX_PREFIX_LENGTH = 50
+# 簡稱至少需要的字數 (太短的簡稱沒有鑑別力)
+MIN_ALIAS_LENGTH = 2
+
+# 名稱開頭的法人類別、縣市與公私立前綴 (依序可省略)
+ALIAS_PREFIX_PATTERN = re.compile(
+    '^(?:醫療)?(?:財團法人|社團法人)?(?:{})?(?:私立|公立|市立|縣立)?'.format(
+        '|'.join(re.escape(normalize_text(name)) for name in CITY_NAMES.values())
+    )
+)
+# 「○○協會附設○○機構」以附設之後的名稱作為簡稱
+ATTACHED_MARKER = '附設'
+
+
+class SuggestQueryError(ValueError):
+    """自動完成參數錯誤"""
+
+
+def parse_prefix(value):
+    """解析並正規化前綴 (空字串代表沒有建議)"""
+    prefix = normalize_text(value)
+    if len(prefix) > MAX_PREFIX_LENGTH:
+        raise SuggestQueryError(f"prefix 不可超過 {MAX_PREFIX_LENGTH} 個字")
+    return prefix
+
+
+def parse_suggest_limit(value, default=DEFAULT_SUGGEST_LIMIT, maximum=MAX_SUGGEST_LIMIT):
+    """解析回傳筆數"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise SuggestQueryError(f"limit 必須是整數: {value}")
+    if limit < 1:
+        raise SuggestQueryError("limit 必須大於 0")
+    return min(limit, maximum)
+
+
+def name_aliases(name):
+    """已正規化名稱的常見簡稱 (不含名稱本身)"""
+    aliases = set()
+    stripped = ALIAS_PREFIX_PATTERN.sub('', name, count=1)
+    aliases.add(stripped)
+    if ATTACHED_MARKER in name:
+        aliases.add(name.rsplit(ATTACHED_MARKER, 1)[1])
+    aliases.discard(name)
+    return [alias for alias in aliases if len(alias) >= MIN_ALIAS_LENGTH]
+
+
+class _SortedKeys:
+    """排序後的 (鍵值, 機構序號) 陣列"""
+
+    def __init__(self, entries):
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.targets = [target for _, target in entries]
+
+    def range(self, prefix):
+        """前綴範圍的起點與終點"""
+        start = bisect.bisect_left(self.keys, prefix)
+        # 所有以 prefix 開頭的字串都小於 prefix + 最大碼位
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+        return start, end
+
+
+class SuggestIndex:
+    """
+    機構名稱前綴索引
+
+    names 為原始名稱 (回傳用)，normalized_names 為正規化名稱 (比對用)，
+    codes 為機構代碼，city_codes 為縣市代碼。建立後不再變動，資料更新時整個替換。
+    """
+
+    def __init__(self, names, normalized_names, codes, city_codes):
+        self.names = [str(name) for name in names]
+        self.codes = [str(code) for code in codes]
+        self.cities = [str(city) for city in city_codes]
+
+        entries = []
+        by_city = {}
+        for target, (key, city) in enumerate(zip(normalized_names, self.cities)):
+            key = str(key)
+            for alias in [key] + name_aliases(key):
+                entries.append((alias, target))
+                by_city.setdefault(city, []).append((alias, target))
+        self.all = _SortedKeys(entries)
+        self.by_city = {city: _SortedKeys(city_entries) for city, city_entries in by_city.items()}
+        self.alias_count = len(entries) - len(self.names)
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGEST_LIMIT, city_code=None):
+        """
+        回傳名稱或簡稱以已正規化的 prefix 開頭的機構 [{'name', 'code', 'city'}]
+
+        依比對到的鍵值排序；同一機構的名稱與簡稱都符合時只回傳一次
+        """
+        if not prefix:
+            return []
+        keys = self.by_city.get(city_code) if city_code else self.all
+        if keys is None:
+            return []
+
+        start, end = keys.range(prefix)
+        seen = set()
+        result = []
+        for position in range(start, end):
+            target = keys.targets[position]
+            if target in seen:
+                continue
+            seen.add(target)
+            result.append({'name': self.names[target], 'code': self.codes[target], 'city': self.cities[target]})
+            if len(result) >= limit:
+                break
+        return result
+
+    def info(self):
+        return {
+            'names': len(self.names),
+            'aliases': self.alias_count,
+        }
+
+
+def load_suggest_index(conn):
+    """由資料庫的正規化名稱建立索引 (舊版資料庫沒有正規化欄位時回傳 None)"""
+    try:
+        rows = conn.execute(
+            'SELECT name, name_norm, code, city_code FROM institutions ORDER BY id'
+        ).fetchall()
+    except sqlite3.OperationalError:  # 舊版資料庫沒有正規化欄位
+        return None
+    names, normalized, codes, cities = zip(*rows) if rows else ([], [], [], [])
+    return SuggestIndex(
+        [name or '' for name in names],
+        [name or '' for name in normalized],
+        [code or '' for code in codes],
+        [city or '' for city in cities],
+    )
@@ -0,0 +1,100 @@
+"""
+測試共用的設定：模擬資料來源的 HTTP 伺服器與獨立的工作目錄
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from region_mapping import MAPPING_FILE
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SourceState:
+    """模擬資料來源的內容與行為 (requests 記錄每個請求的標頭)"""
+
+    def __init__(self, payload=b''):
+        self.set_payload(payload)
+        self.use_validators = True
+        self.fail_after = None   # 送出指定位元組數後中斷連線
+        self.requests = []
+        self.url = None
+
+    def set_payload(self, payload):
+        self.payload = payload
+        self.etag = '"{}"'.format(hashlib.md5(payload).hexdigest())
+        self.last_modified = formatdate(usegmt=True)
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        state = self.state
+        state.requests.append(dict(self.headers))
+        payload = state.payload
+
+        if state.use_validators and self.headers.get('If-None-Match') == state.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (if_range is None or if_range in (state.etag, state.last_modified)):
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(payload):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(payload) - 1}/{len(payload)}')
+        else:
+            self.send_response(200)
+        body = payload[start:]
+        self.send_header('Content-Length', str(len(body)))
+        if state.use_validators:
+            self.send_header('ETag', state.etag)
+            self.send_header('Last-Modified', state.last_modified)
+        self.end_headers()
+
+        if state.fail_after is not None:
+            self.wfile.write(body[:state.fail_after])
+            self.wfile.flush()
+            state.fail_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def source():
+    """在本機啟動模擬資料來源，回傳 SourceState (url 為CSV的網址)"""
+    state = SourceState()
+    handler = type('Handler', (SourceHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state.url = f'http://127.0.0.1:{server.server_port}/abc.csv'
+    yield state
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """以暫存目錄作為工作目錄 (資料檔都以相對路徑存放)，並放入縣市鄉鎮區對照表"""
+    shutil.copyfile(os.path.join(REPO_ROOT, MAPPING_FILE), tmp_path / MAPPING_FILE)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,48 @@
+"""
+鄉鎮區解析：地址寫法不同 (郵遞區號、省略縣市、臺/台) 時解析出相同的區域代碼
+"""
+
+import pandas as pd
+import pytest
+
+from district_resolver import build_district_patterns, resolve_district_codes
+
+MAPPING = {
+    '64000': {
+        'name': '高雄市',
+        'districts': {'64000050': '三民區', '64000060': '新興區'},
+    },
+    '63000': {
+        'name': '臺北市',
+        'districts': {'63000050': '中正區'},
+    },
+}
+
+
+def resolve(city_code, district_code, address):
+    patterns = build_district_patterns(MAPPING)
+    resolved = resolve_district_codes(
+        pd.Series([city_code]), pd.Series([district_code]), pd.Series([address]), patterns
+    )
+    return resolved.iloc[0]
+
+
+@pytest.mark.parametrize('address', [
+    '高雄市三民區建國路1號',
+    '806高雄市三民區建國路1號',
+    '80646高雄市三民區建國路1號',
+    ' 806 高雄市三民區建國路1號',
+    '８０６高雄市三民區建國路1號',
+    '806三民區建國路1號',
+])
+def test_address_variants_resolve_same_district(address):
+    # 資料本身的區域代碼錯誤 (新興區) 時以地址為準
+    assert resolve('64000', '64000060', address) == '64000050'
+
+
+def test_tai_variant_of_city_name():
+    assert resolve('63000', None, '100台北市中正區重慶南路1號') == '63000050'
+
+
+def test_unknown_district_keeps_code():
+    assert resolve('64000', '64000060', '806高雄市不存在區建國路1號') == '64000060'
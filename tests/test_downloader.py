@@ -0,0 +1,115 @@
+"""
+CSV 下載機制：條件式請求 (304)、中斷後以 Range 續傳、來源變更時重新下載與原子取代
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from csv_importer import iter_csv_chunks
+from downloader import DownloadError, download_csv, ensure_csv
+
+HEADER = '機構名稱,機構代碼,縣市,區\n'
+
+
+def make_payload(rows, marker='A'):
+    """產生帶 BOM 的測試CSV內容"""
+    lines = [f'{marker}長照中心{i},{1000000000 + i},64000,64000050\n' for i in range(rows)]
+    return ('\ufeff' + HEADER + ''.join(lines)).encode('utf-8')
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def dest(tmp_path):
+    return str(tmp_path / 'abc.csv')
+
+
+@pytest.fixture
+def downloaded(source, dest):
+    """已完成首次下載的來源與本地檔案"""
+    source.set_payload(make_payload(20000))
+    download_csv(source.url, dest)
+    return source
+
+
+def interrupt_download(source, dest, fail_after):
+    """下載到 fail_after 位元組時中斷連線"""
+    source.fail_after = fail_after
+    with pytest.raises(DownloadError):
+        download_csv(source.url, dest)
+
+
+def test_first_download(source, dest):
+    source.set_payload(make_payload(20000))
+    result = download_csv(source.url, dest)
+
+    assert result['status'] == 'downloaded'
+    assert read_file(dest) == source.payload
+    assert result['sha256'] == hashlib.sha256(source.payload).hexdigest()
+    # 讀取時去除 BOM
+    first_columns = list(next(iter_csv_chunks(dest, chunksize=10)).columns)
+    assert first_columns[0] == '機構名稱'
+
+
+def test_not_modified_keeps_file(downloaded, dest):
+    mtime = os.stat(dest).st_mtime_ns
+    result = download_csv(downloaded.url, dest)
+
+    assert result['status'] == 'not_modified'
+    assert 'If-None-Match' in downloaded.requests[-1]
+    assert 'If-Modified-Since' in downloaded.requests[-1]
+    assert os.stat(dest).st_mtime_ns == mtime
+
+
+def test_fresh_file_skips_request(downloaded, dest):
+    request_count = len(downloaded.requests)
+    result = ensure_csv(downloaded.url, dest)
+
+    assert result['status'] == 'fresh'
+    assert len(downloaded.requests) == request_count
+
+
+def test_interrupted_download_keeps_original(downloaded, dest):
+    old_payload = downloaded.payload
+    downloaded.set_payload(make_payload(30000, marker='B'))
+    interrupt_download(downloaded, dest, len(downloaded.payload) // 2)
+
+    assert read_file(dest) == old_payload
+    assert os.path.exists(dest + '.part')
+
+
+def test_resume_after_interruption(downloaded, dest):
+    downloaded.set_payload(make_payload(30000, marker='B'))
+    interrupt_download(downloaded, dest, len(downloaded.payload) // 2)
+    result = download_csv(downloaded.url, dest)
+
+    assert result['resumed']
+    assert downloaded.requests[-1].get('Range', '').startswith('bytes=')
+    assert read_file(dest) == downloaded.payload
+    assert result['sha256'] == hashlib.sha256(downloaded.payload).hexdigest()
+    assert result['bytes'] < len(downloaded.payload)
+    assert not os.path.exists(dest + '.part')
+
+
+def test_source_changed_after_interruption(downloaded, dest):
+    # 中斷後來源又變更：If-Range 不符，伺服器回傳完整內容
+    downloaded.set_payload(make_payload(30000, marker='C'))
+    interrupt_download(downloaded, dest, 1000)
+    downloaded.set_payload(make_payload(35000, marker='D'))
+    result = download_csv(downloaded.url, dest)
+
+    assert not result['resumed']
+    assert read_file(dest) == downloaded.payload
+
+
+def test_unchanged_without_validators(downloaded, dest):
+    # 來源不提供 ETag / Last-Modified：以 SHA-256 判斷內容是否相同
+    downloaded.use_validators = False
+    result = download_csv(downloaded.url, dest, timeout=5)
+
+    assert result['status'] == 'unchanged'
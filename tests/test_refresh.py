@@ -0,0 +1,71 @@
+"""
+兩個版本的資料更新流程：向資料來源下載 (force=True) 並匯入新內容
+"""
+
+import csv
+import io
+
+import pytest
+
+from benchmarks.synthetic import generate_csv
+
+ROWS = 300
+
+
+def synthetic_payload(path, rows, seed):
+    """合成資料的CSV內容 (與資料來源相同的格式)"""
+    generate_csv(str(path), rows, seed)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def payloads(tmp_path):
+    """來源先後提供的兩個版本 (筆數與內容都不同)"""
+    return (synthetic_payload(tmp_path / 'first.csv', ROWS, seed=1),
+            synthetic_payload(tmp_path / 'second.csv', ROWS + 20, seed=2))
+
+
+def institution_names(payload):
+    """CSV 內容中的機構名稱"""
+    return {row['機構名稱'] for row in csv.DictReader(io.StringIO(payload.decode('utf-8-sig')))}
+
+
+def assert_replaced(names, payloads, current):
+    """載入的資料全部來自第 current 個版本，且包含該版本的大部分機構"""
+    expected = institution_names(payloads[current])
+    assert names <= expected
+    assert len(names) >= len(expected) * 0.9
+
+
+def test_sqlite_refresh_imports_source(workdir, source, payloads, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, 'CSV_URL', source.url)
+    app.init_database()
+
+    for current, payload in enumerate(payloads):
+        request_count = len(source.requests)
+        source.set_payload(payload)
+        assert app.download_and_import_csv(force=True)
+
+        assert len(source.requests) == request_count + 1
+        with app.db_pool.connection() as conn:
+            names = {row[0] for row in conn.execute('SELECT name FROM institutions')}
+        assert_replaced(names, payloads, current)
+
+
+def test_csv_refresh_loads_source(workdir, source, payloads, monkeypatch):
+    import app_csv
+
+    monkeypatch.setattr(app_csv, 'CSV_URL', source.url)
+    app_csv.load_regions()
+
+    for current, payload in enumerate(payloads):
+        request_count = len(source.requests)
+        source.set_payload(payload)
+        data = app_csv.load_ltc_data(force=True)
+
+        assert len(source.requests) == request_count + 1
+        assert data is not None
+        assert_replaced(set(data.data['機構名稱']), payloads, current)
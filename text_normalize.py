@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+文字正規化
+地址與名稱的寫法不一 (臺/台、全形/半形數字、地址省略縣市或帶郵遞區號)，
+匯入時一次算出正規化欄位並建立索引；查詢時只需以同樣規則正規化使用者輸入的短字串，
+不必在每次查詢時對資料嘗試多種寫法
+"""
+
+import re
+import unicodedata
+
+import pandas as pd
+
+# 地址開頭的郵遞區號 (3、5 或 6 碼)
+POSTAL_CODE_PATTERN = r'^\d{3,6}'
+WHITESPACE_PATTERN = r'\s+'
+
+
+def normalize_text(value):
+    """
+    正規化單一字串 (使用者輸入)
+
+    NFKC 將全形英數與符號轉為半形，「台」統一為「臺」，移除空白並轉為小寫
+    """
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(value))
+    text = re.sub(WHITESPACE_PATTERN, '', text.replace('台', '臺'))
+    return text.lower()
+
+
+def normalize_series(values):
+    """以與 normalize_text 相同的規則整欄正規化 (缺值轉為空字串)"""
+    return (
+        values.astype('string').fillna('')
+        .str.normalize('NFKC')
+        .str.replace('台', '臺', regex=False)
+        .str.replace(WHITESPACE_PATTERN, '', regex=True)
+        .str.lower()
+        .astype(object)
+    )
+
+
+def normalize_addresses(addresses, city_names):
+    """
+    正規化地址並補上省略的縣市名稱
+
+    city_names 為每列對應的縣市名稱 (與 addresses 索引相同，未知縣市為缺值)，
+    開頭的郵遞區號一併移除，讓「806高雄市…」「高雄市…」「三民區…」都以「高雄市三民區…」比對
+    """
+    normalized = normalize_series(addresses).str.replace(POSTAL_CODE_PATTERN, '', regex=True)
+    cities = normalize_series(city_names)
+    missing_city = (
+        (cities != '')
+        & (normalized != '')
+        & ~pd.Series(
+            [address.startswith(city) for address, city in zip(normalized, cities)],
+            index=normalized.index, dtype=bool
+        )
+    )
+    return normalized.where(~missing_city, cities + normalized)